@@ -0,0 +1,148 @@
+#cascade_eval.py
+import argparse
+import json
+import numpy as np
+from qg_cascade import cascade_rank
+from questiongenerator import MODEL_TIERS, QuestionGenerator, load_screen_evaluator
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Calibrates a QA evaluator cascade: measures how far its ranking drifts from "
+        "the full evaluator's at each threshold, and fits the score calibration."
+    )
+    parser.add_argument(
+        "--answer_style",
+        default="all",
+        type=str,
+        help="The desired type of answers. Choose from ['all', 'sentences', 'multiple_choice']",
+    )
+    parser.add_argument(
+        "--min_top_k_overlap",
+        type=float,
+        default=0.9,
+        help="The overlap with the full evaluator's top k that the recommended thresholds must keep on every text.",
+    )
+    parser.add_argument("--num_questions", type=int, default=10)
+    parser.add_argument("--output", type=str, default=None)
+    parser.add_argument("--rescore_above", type=int, nargs="+", default=[0, 2, 4, 10])
+    parser.add_argument("--rescore_below", type=int, nargs="+", default=[0, 4, 8, 16, 32])
+    parser.add_argument(
+        "--screen_eval_model",
+        type=str,
+        default="lexical",
+        help='The first stage evaluator: "lexical" or a (small) BERT QA evaluator checkpoint.',
+    )
+    parser.add_argument("--text_files", type=str, nargs="+", required=True)
+    parser.add_argument("--tier", type=str, default="best", choices=list(MODEL_TIERS))
+    return parser.parse_args()
+
+
+def ranking_drift(cascade_order: list, full_scores: np.ndarray, k: int) -> dict:
+    full_order = np.argsort(full_scores)[::-1].tolist()
+    full_rank = {i: rank for rank, i in enumerate(full_order)}
+    # How many places each returned pair sits away from where the full evaluator ranks it.
+    displacement = [abs(position - full_rank[i]) for position, i in enumerate(cascade_order)]
+    return {
+        "top_k_overlap": len(set(cascade_order) & set(full_order[:k])) / max(k, 1),
+        "mean_rank_displacement": float(np.mean(displacement)) if displacement else 0.0,
+        "full_score_regret": float(
+            np.sum(np.sort(full_scores)[::-1][:k]) - np.sum(full_scores[cascade_order])
+        ) / max(k, 1),
+    }
+
+
+def evaluate_text(
+    qg: QuestionGenerator, screen, text: str, answer_style: str, num_questions: int, thresholds: list
+) -> dict:
+    # Questions, screening scores and full scores are computed once for every candidate; each
+    # threshold setting is then simulated by cascade_rank reading the full scores it asks for,
+    # which is exactly what QACascade.rank would return.
+    qg_inputs, qg_answers = qg.generate_qg_inputs(text, answer_style)
+    questions = qg.generate_questions_from_inputs(qg_inputs)
+    full_scores = np.array(qg.qa_evaluator.get_batched_scores(questions, qg_answers))
+    screen_scores = np.array(screen.get_batched_scores(questions, qg_answers))
+
+    k = min(num_questions, len(qg_inputs))
+    results = {
+        "candidates": len(qg_inputs),
+        "screen_scores": screen_scores.tolist(),
+        "full_scores": full_scores.tolist(),
+        "thresholds": {},
+    }
+    for above, below in thresholds:
+        ranked = cascade_rank(
+            screen_scores.tolist(), num_questions, above, below, lambda indices: full_scores[indices].tolist()
+        )
+        rescored = min(k + below, len(qg_inputs)) - max(k - above, 0)
+        results["thresholds"]["{}/{}".format(above, below)] = dict(
+            ranking_drift([i for i, _, _ in ranked], full_scores, k),
+            rescored_fraction=max(rescored, 0) / max(len(qg_inputs), 1),
+        )
+    return results
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    qg = QuestionGenerator.from_tier(args.tier)
+    screen = load_screen_evaluator(args.screen_eval_model)
+    thresholds = [(above, below) for above in args.rescore_above for below in args.rescore_below]
+
+    per_text = {}
+    for text_file in args.text_files:
+        with open(text_file, "r") as file:
+            per_text[text_file] = evaluate_text(
+                qg, screen, file.read(), args.answer_style, args.num_questions, thresholds
+            )
+
+    summary = {}
+    for above, below in thresholds:
+        runs = [r["thresholds"]["{}/{}".format(above, below)] for r in per_text.values()]
+        summary["{}/{}".format(above, below)] = {
+            "rescore_above": above,
+            "rescore_below": below,
+            "mean_rescored_fraction": float(np.mean([r["rescored_fraction"] for r in runs])),
+            "mean_top_k_overlap": float(np.mean([r["top_k_overlap"] for r in runs])),
+            "min_top_k_overlap": float(np.min([r["top_k_overlap"] for r in runs])),
+            "mean_rank_displacement": float(np.mean([r["mean_rank_displacement"] for r in runs])),
+            "mean_full_score_regret": float(np.mean([r["full_score_regret"] for r in runs])),
+        }
+
+    # Maps screening scores onto the full evaluator's scale for the pairs the cascade accepts
+    # without rescoring.
+    screen_scores = np.concatenate([r.pop("screen_scores") for r in per_text.values()])
+    full_scores = np.concatenate([r.pop("full_scores") for r in per_text.values()])
+    calibration = {"score_scale": 1.0, "score_offset": 0.0, "rank_correlation": None}
+    if len(screen_scores) > 1 and np.ptp(screen_scores) > 0:
+        scale, offset = np.polyfit(screen_scores, full_scores, 1)
+        screen_ranks = np.argsort(np.argsort(screen_scores))
+        full_ranks = np.argsort(np.argsort(full_scores))
+        calibration = {
+            "score_scale": float(scale),
+            "score_offset": float(offset),
+            "rank_correlation": float(np.corrcoef(screen_ranks, full_ranks)[0, 1]),
+        }
+
+    # The cheapest thresholds that keep enough of the full evaluator's top k on every text.
+    good_enough = [s for s in summary.values() if s["min_top_k_overlap"] >= args.min_top_k_overlap]
+    recommended = min(good_enough, key=lambda s: s["mean_rescored_fraction"], default=None)
+    cascade = None
+    if recommended is not None:
+        cascade = {
+            "rescore_above": recommended["rescore_above"],
+            "rescore_below": recommended["rescore_below"],
+            "score_scale": calibration["score_scale"],
+            "score_offset": calibration["score_offset"],
+        }
+
+    report = json.dumps({
+        "screen_eval_model": args.screen_eval_model,
+        "calibration": calibration,
+        "recommended_cascade": cascade,
+        "summary": summary,
+        "texts": per_text,
+    }, indent=2)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(report)
+    print(report)
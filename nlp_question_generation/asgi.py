@@ -14,3 +14,8 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'nlp_question_generation.settings')
 
 application = get_asgi_application()
+
+# Load (and, with static_generation, compile) QG_PRELOAD_TIERS before serving.
+from question_generationapp.inference import preload_generators  # noqa: E402
+
+preload_generators()
@@ -27,6 +27,7 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'question_generationapp.staticfiles.PrecompressedStaticMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -94,8 +95,22 @@ AUTH_USER_MODEL = 'question_generationapp.Account'
 STATICFILES_DIRS = [
     os.path.join(BASE_DIR, "static/"),
 ]
+# Where collectstatic writes; kept apart from the sources in STATICFILES_DIRS.
 STATIC_ROOT = os.path.join(BASE_DIR, "staticfiles/")
 
+# Outside DEBUG, static files are served in-process from QG_STATIC_ROOT, the
+# assets `manage.py collectstatic` collected with fingerprinted names, .gz
+# siblings and staticfiles.json (see question_generationapp/staticfiles.py), and
+# {% static %} resolves to the fingerprinted names so browsers can cache them
+# for a year.
+QG_SERVE_STATIC = not DEBUG
+QG_STATIC_ROOT = STATIC_ROOT
+if QG_SERVE_STATIC:
+    STORAGES = {
+        'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+        'staticfiles': {'BACKEND': 'question_generationapp.staticfiles.PrecompressedManifestStorage'},
+    }
+
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 MEDIA_URL = '/media/'
 
@@ -127,4 +142,109 @@ SIMPLE_JWT = {
     'USER_ID_CLAIM': 'user_id',
     'AUTH_TOKEN_CLASSES': ('rest_framework_simplejwt.tokens.AccessToken',),
     'TOKEN_TYPE_CLAIM': 'token_type',
-}
\ No newline at end of file
+}
+
+# Question generation runtime. Inference runs on a bounded executor shared by
+# the async endpoint; "process" gives each worker its own copy of the models.
+QG_EXECUTOR = os.environ.get('QG_EXECUTOR', 'thread')
+QG_EXECUTOR_WORKERS = int(os.environ.get('QG_EXECUTOR_WORKERS', 2))
+# CPU budget for inference (question_generationapp/thread_budget.py). torch, MKL/
+# OpenMP and spaCy's BLAS otherwise each size their pools to every core, which
+# oversubscribes the node as soon as several workers load models. PROCESSES is
+# the number of processes on the node that run models: e.g. 4 for gunicorn -w 4
+# with the thread executor, or 8 with QG_EXECUTOR=process and 2 executor workers.
+QG_THREAD_BUDGET = {
+    'CORES': int(os.environ.get('QG_CPU_CORES', 0)) or None,
+    'PROCESSES': int(os.environ.get('QG_INFERENCE_PROCESSES', 1)),
+    'INTEROP_THREADS': 1,
+    'PIN': os.environ.get('QG_PIN_CORES', '') == '1',
+}
+# Inputs per T5 and evaluator call in the batch endpoint's combined pipeline.
+QG_BATCH_SIZE = int(os.environ.get('QG_BATCH_SIZE', 16))
+# Run the batch endpoint's stages (text preparation, NER, generation, evaluation,
+# ranking) concurrently, joined by queues of at most QG_PIPELINE_QUEUE_SIZE items.
+# Generation and evaluation then overlap, which counts as two concurrent calls
+# for QG_THREAD_BUDGET.
+QG_PIPELINED = os.environ.get('QG_PIPELINED', '') == '1'
+QG_PIPELINE_QUEUE_SIZE = 4
+# Generate through QuestionGenerator.generate_incremental, which caches the
+# entities, questions, distractors and scores of each sentence by content, so a
+# passage submitted again after an edit only runs the models on what changed.
+# The cache belongs to the tier's generator and is shared by every user of the
+# process, so one user's text can be served results computed for another's.
+# Off unless QG_INCREMENTAL=1. A tier's "content_cache_size" in QG_MODEL_TIERS
+# bounds its cache's entries.
+QG_INCREMENTAL = os.environ.get('QG_INCREMENTAL', '') == '1'
+# Rows fetched per database round trip by the generation history exports.
+QG_EXPORT_CHUNK_SIZE = 2000
+# Searches matching more generations than this are returned newest first rather
+# than ranked, since scoring every match of a very common term is slow.
+QG_SEARCH_RANKED_MATCHES = 20000
+# Cache holding profile and history versions and cached read responses
+# (question_generationapp/conditional.py). Entries are dropped by signals in the
+# process that made the change, so with several workers this should be a shared
+# backend such as Redis or Memcached; the timeout bounds how long another
+# worker's local cache can serve a stale version.
+QG_RESPONSE_CACHE = 'default'
+QG_RESPONSE_CACHE_TIMEOUT = 300
+
+# Give the best tier the compiled, static-shape generation path (qg_static.py).
+QG_STATIC_GENERATION = os.environ.get('QG_STATIC_GENERATION', '') == '1'
+# Model tiers served by the generation endpoints: the tiers of
+# questiongenerator.MODEL_TIERS (models and latency_ms_per_question), with the
+# keys given here added or overridden. Set a tier's qg_model or qa_eval_model to
+# a local checkpoint to serve models trained with training/qg_train.py and
+# training/qa_eval_train.py; a new tier needs both and latency_ms_per_question.
+QG_MODEL_TIERS = {
+    'best': {
+        # Optional small T5 checkpoint (e.g. "t5-small") that drafts tokens for t5-large.
+        'draft_model': os.environ.get('QG_DRAFT_MODEL') or None,
+        # Optional first stage for the evaluator, "lexical" or a small BERT checkpoint:
+        # bert-large then only rescores the pairs ranked from rescore_above places above
+        # the top-k cut-off to rescore_below places below it. Pick the thresholds and
+        # the score_scale/score_offset calibration with cascade_eval.py.
+        'screen_eval_model': os.environ.get('QG_SCREEN_EVAL_MODEL') or None,
+        'cascade': {'rescore_above': 2, 'rescore_below': 8},
+        # Greedy decoding through torch.compile'd, fixed-shape encoder and decoder
+        # steps (qg_static.py), compiled for every input length bucket when the
+        # tier loads. Compiled artifacts are kept in cache_dir so that later boots
+        # load them; measure the gain with static_benchmark.py.
+        'static_generation': {
+            'buckets': [64, 128, 256, 512],
+            'cache_dir': os.environ.get('QG_COMPILE_CACHE_DIR') or os.path.join(BASE_DIR, 'compile_cache'),
+        } if QG_STATIC_GENERATION else None,
+    },
+}
+QG_DEFAULT_TIER = 'best'
+# Tiers loaded when a server process starts (wsgi.py, asgi.py and executor
+# worker processes) rather than by the first request that needs them. Compiling
+# a static_generation tier takes minutes, so it is always preloaded; run
+# `manage.py warm_up_models` at deploy time to fill its artifact cache first.
+QG_PRELOAD_TIERS = ['best'] if QG_STATIC_GENERATION else []
+# Serve every tier with question_generationapp.stub_generator instead of real
+# models, e.g. for `manage.py loadtest`; requests sleep for the tier's estimated
+# latency times QG_STUB_LATENCY_SCALE.
+QG_STUB_GENERATOR = os.environ.get('QG_STUB_GENERATOR', '') == '1'
+QG_STUB_LATENCY_SCALE = float(os.environ.get('QG_STUB_LATENCY_SCALE', 1.0))
+# Each global load level crossed (see QG_ADMISSION) moves requests one tier cheaper.
+QG_TIER_FALLBACK_LOADS = [0.5, 0.8]
+
+# Admission control for the generation endpoints (question_generationapp/admission.py).
+# Costs are estimated from the input size; budgets are in cost units (about one T5
+# decode over a full segment).
+QG_ADMISSION = {
+    'MAX_TEXT_LENGTH': 20000,
+    'MAX_NUM_QUESTIONS': 50,
+    'MAX_REQUEST_COST': 400,
+    'USER_BUDGET': 400,
+    'GLOBAL_BUDGET': 1200,
+    # Above this fraction of the global budget new requests are degraded.
+    'DEGRADE_AT': 0.75,
+    'QUEUE_TIMEOUT': 5.0,
+    'SECONDS_PER_COST_UNIT': 0.2,
+    'EVALUATOR_COST': 0.5,
+    'MAX_BATCH_DOCUMENTS': 100,
+    'MAX_BATCH_COST': 400,
+    # Batched model calls cost less per input than one request per document.
+    'BATCH_COST_FACTOR': 0.5,
+}
@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'nlp_question_generation.settings')
 
 application = get_wsgi_application()
+
+# Load (and, with static_generation, compile) QG_PRELOAD_TIERS before serving.
+from question_generationapp.inference import preload_generators  # noqa: E402
+
+preload_generators()
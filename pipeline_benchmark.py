@@ -0,0 +1,67 @@
+#pipeline_benchmark.py
+import argparse
+import json
+import time
+from questiongenerator import MODEL_TIERS, QuestionGenerator
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Compares generate_batch with the staged pipeline of generate_pipelined."
+    )
+    parser.add_argument(
+        "--answer_style",
+        default="all",
+        type=str,
+        help="The desired type of answers. Choose from ['all', 'sentences', 'multiple_choice']",
+    )
+    parser.add_argument("--batch_size", type=int, default=16)
+    parser.add_argument("--num_questions", type=int, default=10)
+    parser.add_argument("--output", type=str, default=None)
+    parser.add_argument("--queue_sizes", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--text_files", type=str, nargs="+", required=True)
+    parser.add_argument("--tier", type=str, default="best", choices=list(MODEL_TIERS))
+    parser.add_argument("--use_qa_eval", dest="use_qa_eval", action="store_true", default=True)
+    parser.add_argument("--no_qa_eval", dest="use_qa_eval", action="store_false")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    qg = QuestionGenerator.from_tier(args.tier)
+    documents = []
+    for text_file in args.text_files:
+        with open(text_file, "r") as file:
+            documents.append({
+                "text": file.read(),
+                "answer_style": args.answer_style,
+                "num_questions": args.num_questions,
+                "use_evaluator": args.use_qa_eval,
+            })
+
+    # Warm-up, so that model and spaCy loading do not count against either mode.
+    qg.generate_batch(documents[:1], args.batch_size)
+
+    start = time.perf_counter()
+    qg.generate_batch(documents, args.batch_size)
+    sequential = time.perf_counter() - start
+
+    runs = {}
+    for queue_size in args.queue_sizes:
+        qg.generate_pipelined(documents, args.batch_size, queue_size)
+        stats = qg.pipeline_stats
+        runs[queue_size] = {
+            "wall_s": stats["wall_s"],
+            "speedup": sequential / stats["wall_s"],
+            "stages": stats["stages"],
+        }
+
+    report = json.dumps({
+        "documents": len(documents),
+        "sequential_wall_s": sequential,
+        "pipelined_by_queue_size": runs,
+    }, indent=2)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(report)
+    print(report)
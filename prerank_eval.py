@@ -0,0 +1,79 @@
+#prerank_eval.py
+import argparse
+import json
+import numpy as np
+from questiongenerator import QuestionGenerator
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Measures how much lexical pre-ranking changes the final top-k questions."
+    )
+    parser.add_argument(
+        "--answer_style",
+        default="all",
+        type=str,
+        help="The desired type of answers. Choose from ['all', 'sentences', 'multiple_choice']",
+    )
+    parser.add_argument("--factors", type=int, nargs="+", default=[1, 2, 3, 5, 10])
+    parser.add_argument("--num_questions", type=int, default=10)
+    parser.add_argument("--output", type=str, default=None)
+    parser.add_argument("--text_files", type=str, nargs="+", required=True)
+    return parser.parse_args()
+
+
+def top_k(scores: np.ndarray, candidates: np.ndarray, k: int) -> set:
+    ranked = candidates[np.argsort(scores[candidates])[::-1]]
+    return set(ranked[:k].tolist())
+
+
+def evaluate_text(qg: QuestionGenerator, text: str, answer_style: str, num_questions: int, factors: list) -> dict:
+    # Questions and scores are generated once for every candidate; pre-ranking at
+    # factor N is then simulated by restricting the final ranking to the N * k
+    # candidates it would have kept, which is exactly what generate() would return.
+    qg_inputs, qg_answers = qg.generate_qg_inputs(text, answer_style)
+    questions = qg.generate_questions_from_inputs(qg_inputs)
+    encoded_qa_pairs = qg.qa_evaluator.encode_qa_pairs(questions, qg_answers)
+    eval_scores = np.array(qg.qa_evaluator.get_scores(encoded_qa_pairs))
+    prerank_scores = np.array(qg.get_prerank_scores(text, qg_inputs, qg_answers))
+
+    all_candidates = np.arange(len(qg_inputs))
+    k = min(num_questions, len(qg_inputs))
+    reference = top_k(eval_scores, all_candidates, k)
+
+    results = {"candidates": len(qg_inputs), "factors": {}}
+    for factor in factors:
+        limit = factor * num_questions
+        kept = np.sort(np.argsort(prerank_scores)[::-1][:limit])
+        selected = top_k(eval_scores, kept, k)
+        results["factors"][factor] = {
+            "generated_fraction": len(kept) / max(len(qg_inputs), 1),
+            "top_k_overlap": len(selected & reference) / max(k, 1),
+        }
+    return results
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    qg = QuestionGenerator()
+    per_text = {}
+    for text_file in args.text_files:
+        with open(text_file, "r") as file:
+            per_text[text_file] = evaluate_text(
+                qg, file.read(), args.answer_style, args.num_questions, args.factors
+            )
+
+    summary = {}
+    for factor in args.factors:
+        runs = [r["factors"][factor] for r in per_text.values()]
+        summary[factor] = {
+            "mean_generated_fraction": float(np.mean([r["generated_fraction"] for r in runs])),
+            "mean_top_k_overlap": float(np.mean([r["top_k_overlap"] for r in runs])),
+            "min_top_k_overlap": float(np.min([r["top_k_overlap"] for r in runs])),
+        }
+
+    report = json.dumps({"summary": summary, "texts": per_text}, indent=2)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(report)
+    print(report)
@@ -0,0 +1,67 @@
+#qg_cache.py
+import hashlib
+import json
+import threading
+from collections import OrderedDict, namedtuple
+from typing import Any, List, Mapping, Sequence
+
+# Stand-ins for the spaCy docs and spans of a sentence, holding only what question generation
+# reads from them, so that entities can be cached without keeping spaCy objects alive.
+CachedEntity = namedtuple("CachedEntity", ["text", "label_"])
+CachedDoc = namedtuple("CachedDoc", ["text", "ents"])
+
+_MISSING = object()
+
+
+def content_key(kind: str, content: Any) -> bytes:
+    """A short hash of a cache entry's kind and the content it was computed from."""
+    data = json.dumps([kind, content], ensure_ascii=False).encode("utf-8")
+    return hashlib.blake2b(data, digest_size=16).digest()
+
+
+class ContentCache:
+    """Keeps the results of the expensive steps of question generation, keyed by a hash of the
+    content each was computed from: the sentences of a segment, the entities of a sentence, the
+    question for an answer and its context, the distractors of a multiple choice answer and the
+    score of a QA pair. Entries of every kind share one LRU order. Hits and misses are counted per
+    kind. A cache can be shared between threads.
+    """
+
+    def __init__(self, max_entries: int = 100000) -> None:
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {}
+
+    def lookup(self, kind: str, contents: Sequence[Any]) -> List[Any]:
+        """Returns the cached value for each content, or None where there is none."""
+        keys = [content_key(kind, content) for content in contents]
+        values = []
+        with self._lock:
+            for key in keys:
+                value = self._entries.get(key, _MISSING)
+                if value is not _MISSING:
+                    self._entries.move_to_end(key)
+                values.append(value)
+            stats = self.stats.setdefault(kind, {"reused": 0, "computed": 0})
+            hits = sum(value is not _MISSING for value in values)
+            stats["reused"] += hits
+            stats["computed"] += len(values) - hits
+        return [None if value is _MISSING else value for value in values]
+
+    def store(self, kind: str, contents: Sequence[Any], values: Sequence[Any]) -> None:
+        with self._lock:
+            for content, value in zip(contents, values):
+                key = content_key(kind, content)
+                self._entries[key] = value
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_stats(self) -> Mapping[str, Mapping[str, float]]:
+        """Returns, per kind, how many results were reused and how many had to be computed."""
+        with self._lock:
+            return {
+                kind: dict(stats, reuse_rate=stats["reused"] / max(stats["reused"] + stats["computed"], 1))
+                for kind, stats in self.stats.items()
+            }
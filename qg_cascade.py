@@ -0,0 +1,142 @@
+#qg_cascade.py
+import re
+import threading
+from sklearn.feature_extraction.text import ENGLISH_STOP_WORDS
+from typing import Any, Callable, List, Optional, Sequence, Tuple
+
+WORD_PATTERN = re.compile(r"[a-z0-9]+")
+WH_WORDS = {"what", "which", "who", "whom", "whose", "when", "where", "why", "how"}
+
+
+def content_words(text: str) -> set:
+    return {w for w in WORD_PATTERN.findall(text.lower()) if w not in ENGLISH_STOP_WORDS}
+
+
+class LexicalQAScorer:
+    """Scores QA pairs from their words alone, as a first stage for QACascade that needs no model.
+    A pair scores well when the question is well formed (a question mark, a wh-word, a sensible
+    length), when its content words come from the answer sentence it was generated from, and when
+    it does not give away its answer. Scores lie roughly in [-1, 1].
+    """
+
+    WEIGHTS = {"form": 0.4, "grounding": 0.4, "length": 0.2}
+
+    def get_batched_scores(self, questions: List[str], answers: List[Any], batch_size: int = 16) -> List[float]:
+        return [self.score(question, answer) for question, answer in zip(questions, answers)]
+
+    def score(self, question: str, answer: Any) -> float:
+        words = WORD_PATTERN.findall(question.lower())
+        if not words:
+            return -1.0
+        form = 0.5 * question.rstrip().endswith("?") + 0.5 * bool(WH_WORDS.intersection(words))
+        length = 1.0 if 4 <= len(words) <= 20 else 0.0
+
+        question_words = content_words(question)
+        if isinstance(answer, list):
+            # Multiple choice: the answer is an entity of the sentence, which is not available here.
+            answer_text = [a["answer"] for a in answer if a["correct"]][0]
+            grounding = 0.5
+            leaked = answer_text.lower() in question.lower()
+        else:
+            answer_words = content_words(answer)
+            grounding = len(question_words & answer_words) / max(len(question_words), 1)
+            # A question that repeats its whole answer sentence asks nothing.
+            leaked = bool(answer_words) and answer_words <= question_words
+
+        score = (
+            self.WEIGHTS["form"] * form
+            + self.WEIGHTS["grounding"] * grounding
+            + self.WEIGHTS["length"] * length
+        )
+        return float(score - (1.0 if leaked else 0.0))
+
+
+def cascade_rank(
+    screen_scores: Sequence[float],
+    num_questions: int,
+    rescore_above: int,
+    rescore_below: int,
+    rescore: Callable[[List[int]], Sequence[float]]
+) -> List[Tuple[int, float, bool]]:
+    """Ranks candidates by their first stage scores and returns the top num_questions as
+    (index, score, rescored) tuples, best first. The candidates ranked from rescore_above places
+    above the cut-off at num_questions to rescore_below places below it are borderline: rescore is
+    called with their indices and returns their full scores, and the best of them fill the places
+    left after the candidates ranked clearly above the cut-off. Candidates ranked further below are
+    dropped without being rescored.
+    """
+    order = sorted(range(len(screen_scores)), key=lambda i: screen_scores[i], reverse=True)
+    k = min(num_questions, len(order))
+    accepted = order[:max(k - rescore_above, 0)]
+    borderline = order[len(accepted):k + rescore_below]
+
+    full_scores = list(rescore(borderline)) if borderline else []
+    winners = sorted(zip(borderline, full_scores), key=lambda pair: pair[1], reverse=True)
+    winners = winners[:k - len(accepted)]
+
+    return [(i, screen_scores[i], False) for i in accepted] + [(i, s, True) for i, s in winners]
+
+
+class QACascade:
+    """Ranks QA pairs with a cheap first stage evaluator (a small BERT QAEvaluator or a
+    LexicalQAScorer) and runs the full evaluator only on the borderline pairs near the top-k cut-off
+    (see cascade_rank). Pairs that the cascade accepts without rescoring report their first stage
+    score mapped onto the full evaluator's scale as score_scale * score + score_offset; cascade_eval.py
+    fits both and measures how far the cascade's ranking drifts from the full evaluator's.
+    stats counts the pairs ranked and the pairs rescored.
+    """
+
+    def __init__(
+        self,
+        screen: Any,
+        evaluator: Any,
+        rescore_above: int = 2,
+        rescore_below: int = 8,
+        score_scale: float = 1.0,
+        score_offset: float = 0.0
+    ) -> None:
+        self.screen = screen
+        self.evaluator = evaluator
+        self.rescore_above = rescore_above
+        self.rescore_below = rescore_below
+        self.score_scale = score_scale
+        self.score_offset = score_offset
+        self._lock = threading.Lock()
+        self.stats = {"pairs": 0, "rescored": 0}
+
+    def rank(
+        self,
+        questions: List[str],
+        answers: List[Any],
+        num_questions: int,
+        batch_size: int = 16,
+        screen_scores: Optional[Sequence[float]] = None,
+        rescore: Optional[Callable[[List[int]], Sequence[float]]] = None
+    ) -> List[Tuple[int, float]]:
+        """Returns the (index, score) of the top num_questions pairs, best first. screen_scores can
+        hold first stage scores that were already computed, and rescore replaces the full evaluator,
+        e.g. to look scores up in a cache first.
+        """
+        if screen_scores is None:
+            screen_scores = self.screen.get_batched_scores(questions, answers, batch_size)
+        if rescore is None:
+            def rescore(indices: List[int]) -> List[float]:
+                return self.evaluator.get_batched_scores(
+                    [questions[i] for i in indices], [answers[i] for i in indices], batch_size
+                )
+
+        rescored = []
+
+        def counted_rescore(indices: List[int]) -> Sequence[float]:
+            rescored.extend(indices)
+            return rescore(indices)
+
+        ranked = cascade_rank(screen_scores, num_questions, self.rescore_above, self.rescore_below, counted_rescore)
+        with self._lock:
+            self.stats["pairs"] += len(questions)
+            self.stats["rescored"] += len(rescored)
+
+        return [
+            (i, score if was_rescored else self.score_scale * score + self.score_offset)
+            for i, score, was_rescored in ranked
+        ]
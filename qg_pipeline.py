@@ -0,0 +1,297 @@
+#qg_pipeline.py
+import queue
+import threading
+import time
+from typing import Any, Callable, Iterable, List, Mapping, Optional
+
+# Marks the end of a stage's input. Every stage passes it on once it has flushed its buffers.
+DONE = object()
+# How often a stage waiting on a queue checks whether another stage has failed.
+POLL_SECONDS = 0.1
+
+
+class PipelineAborted(Exception):
+    """Stops a stage because another stage of the pipeline has failed."""
+
+
+class Plan:
+    """Tells the ranking stage how many candidates of a document to wait for."""
+
+    __slots__ = ("document", "count")
+
+    def __init__(self, document: int, count: int) -> None:
+        self.document = document
+        self.count = count
+
+
+class Candidate:
+    """One candidate answer of a document on its way through generation and scoring."""
+
+    __slots__ = ("document", "index", "qg_input", "answer", "question", "score")
+
+    def __init__(self, document: int, index: int, qg_input: str, answer: Any) -> None:
+        self.document = document
+        self.index = index
+        self.qg_input = qg_input
+        self.answer = answer
+        self.question = None
+        self.score = None
+
+
+class Stage(threading.Thread):
+    """Runs handle on every item of inbox in its own thread and puts what it returns on outbox.
+    When the inbox is momentarily empty, idle is called before waiting, so that a stage that
+    collects items into batches sends a partial batch on instead of stalling the stages after it.
+    The time spent working, waiting for input (starved) and waiting for room in a full outbox
+    (blocked, i.e. backpressure from the next stage) is recorded in stats.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        handle: Callable[[Any], Iterable[Any]],
+        inbox: queue.Queue,
+        outbox: queue.Queue,
+        abort: threading.Event,
+        idle: Optional[Callable[[], Iterable[Any]]] = None
+    ) -> None:
+        super().__init__(name="qg-pipeline-{}".format(name), daemon=True)
+        self.stage_name = name
+        self.handle = handle
+        self.idle = idle or (lambda: [])
+        self.inbox = inbox
+        self.outbox = outbox
+        self.abort = abort
+        self.error = None
+        self.stats = {"items": 0, "busy_s": 0.0, "starved_s": 0.0, "blocked_s": 0.0, "max_outbox_depth": 0}
+
+    def run(self) -> None:
+        try:
+            while True:
+                try:
+                    item = self.inbox.get_nowait()
+                except queue.Empty:
+                    self._emit(self.idle)
+                    start = time.perf_counter()
+                    item = get(self.inbox, self.abort)
+                    self.stats["starved_s"] += time.perf_counter() - start
+                if item is DONE:
+                    self._emit(self.idle)
+                    put(self.outbox, DONE, self.abort)
+                    return
+                self.stats["items"] += 1
+                self._emit(lambda: self.handle(item))
+        except PipelineAborted:
+            pass
+        except Exception as error:
+            self.error = error
+            self.abort.set()
+
+    def _emit(self, produce: Callable[[], Iterable[Any]]) -> None:
+        start = time.perf_counter()
+        outputs = list(produce())
+        self.stats["busy_s"] += time.perf_counter() - start
+        for output in outputs:
+            start = time.perf_counter()
+            put(self.outbox, output, self.abort)
+            self.stats["blocked_s"] += time.perf_counter() - start
+            self.stats["max_outbox_depth"] = max(self.stats["max_outbox_depth"], self.outbox.qsize())
+
+
+def get(inbox: queue.Queue, abort: threading.Event) -> Any:
+    while True:
+        try:
+            return inbox.get(timeout=POLL_SECONDS)
+        except queue.Empty:
+            if abort.is_set():
+                raise PipelineAborted()
+
+
+def put(outbox: queue.Queue, item: Any, abort: threading.Event) -> None:
+    while True:
+        try:
+            outbox.put(item, timeout=POLL_SECONDS)
+            return
+        except queue.Full:
+            if abort.is_set():
+                raise PipelineAborted()
+
+
+class GenerationPipeline:
+    """Runs QuestionGenerator.generate_batch as five concurrent stages connected by bounded queues:
+    text preparation, NER, question generation batches, evaluator batches and ranking. While T5
+    generates questions for one document, later documents are already being split and tagged and
+    earlier candidates scored, instead of every stage waiting for the previous one to finish all
+    documents. A full queue blocks the stage feeding it, so a slow stage holds back the ones
+    before it rather than letting work pile up in memory.
+
+    The stages are threads sharing one QuestionGenerator: torch, the tokenizers and most of spaCy
+    release the GIL while they work. Generation and scoring run at the same time, so count them as
+    two concurrent inference calls when budgeting threads.
+    """
+
+    STAGES = ["prepare", "ner", "generate", "evaluate", "rank"]
+
+    def __init__(self, generator: Any, batch_size: int = 16, queue_size: int = 4) -> None:
+        self.generator = generator
+        self.batch_size = batch_size
+        self.queue_size = queue_size
+        self.stats = {}
+
+    def run(self, documents: List[Mapping[str, Any]]) -> List[List]:
+        """Takes documents in the form generate_batch accepts and returns the QA list of each."""
+        options = [
+            {"use_evaluator": True, "num_questions": 10, "answer_style": "all", "prerank_factor": None, **document}
+            for document in documents
+        ]
+        for o in options:
+            self.generator._check_answer_style(o["answer_style"])
+        self.options = options
+        self.results = [None] * len(options)
+        self._pending = {}
+        self._generation_batch = []
+        self._evaluation_batch = []
+
+        abort = threading.Event()
+        queues = [queue.Queue(self.queue_size) for _ in range(len(self.STAGES) + 1)]
+        handlers = {
+            "prepare": (self._prepare, None),
+            "ner": (self._tag_entities, None),
+            "generate": (self._collect_for_generation, self._generate),
+            "evaluate": (self._collect_for_evaluation, self._evaluate),
+            "rank": (self._rank, None),
+        }
+        stages = [
+            Stage(name, handlers[name][0], queues[i], queues[i + 1], abort, handlers[name][1])
+            for i, name in enumerate(self.STAGES)
+        ]
+
+        start = time.perf_counter()
+        for stage in stages:
+            stage.start()
+        try:
+            for document in range(len(options)):
+                put(queues[0], document, abort)
+            put(queues[0], DONE, abort)
+        except PipelineAborted:
+            pass
+        for stage in stages:
+            stage.join()
+        wall = time.perf_counter() - start
+
+        for stage in stages:
+            if stage.error is not None:
+                raise stage.error
+
+        self.stats = {"documents": len(options), "wall_s": wall, "stages": {}}
+        for stage in stages:
+            stats = dict(stage.stats)
+            stats["utilization"] = stats["busy_s"] / max(wall, 1e-9)
+            self.stats["stages"][stage.stage_name] = stats
+        return self.results
+
+    def _prepare(self, document: int) -> List[Any]:
+        o = self.options[document]
+        inputs, answers = [], []
+        if o["answer_style"] in ["sentences", "all"]:
+            inputs, answers = self.generator._generate_sentence_qg_inputs(o["text"])
+        sentences = None
+        if o["answer_style"] in ["multiple_choice", "all"]:
+            sentences = self.generator._split_text(o["text"])
+        return [(document, inputs, answers, sentences)]
+
+    # From NER on, queue items are a Plan or a list of candidates: a document's candidates, or a
+    # batch of them, so that a queue of a few items still holds several batches of work.
+
+    def _tag_entities(self, item: Any) -> List[Any]:
+        document, inputs, answers, sentences = item
+        o = self.options[document]
+        if sentences is not None:
+            entity_docs = self.generator._extract_entities([sentences])[0]
+            mc_inputs, mc_answers = self.generator._prepare_qg_inputs_MC(entity_docs)
+            inputs = inputs + mc_inputs
+            answers = answers + mc_answers
+        if o["prerank_factor"] is not None:
+            inputs, answers = self.generator._prerank_qg_inputs(
+                o["text"], inputs, answers, o["prerank_factor"] * o["num_questions"]
+            )
+        candidates = [
+            Candidate(document, j, qg_input, answer) for j, (qg_input, answer) in enumerate(zip(inputs, answers))
+        ]
+        return [Plan(document, len(inputs)), candidates] if candidates else [Plan(document, 0)]
+
+    def _collect_for_generation(self, item: Any) -> List[Any]:
+        if isinstance(item, Plan):
+            return [item]
+        self._generation_batch.extend(item)
+        return self._generate(full_batches_only=True)
+
+    def _generate(self, full_batches_only: bool = False) -> List[Any]:
+        outputs = []
+        while self._generation_batch and (
+            len(self._generation_batch) >= self.batch_size or not full_batches_only
+        ):
+            batch = self._generation_batch[:self.batch_size]
+            self._generation_batch = self._generation_batch[self.batch_size:]
+            questions = self.generator.generate_questions_from_inputs([c.qg_input for c in batch], self.batch_size)
+            for candidate, question in zip(batch, questions):
+                candidate.question = question
+            outputs.append(batch)
+        return outputs
+
+    def _collect_for_evaluation(self, item: Any) -> List[Any]:
+        if isinstance(item, Plan):
+            return [item]
+        skipped = [c for c in item if not self.options[c.document]["use_evaluator"]]
+        self._evaluation_batch.extend(c for c in item if self.options[c.document]["use_evaluator"])
+        return ([skipped] if skipped else []) + self._evaluate(full_batches_only=True)
+
+    def _evaluate(self, full_batches_only: bool = False) -> List[Any]:
+        outputs = []
+        while self._evaluation_batch and (
+            len(self._evaluation_batch) >= self.batch_size or not full_batches_only
+        ):
+            batch = self._evaluation_batch[:self.batch_size]
+            self._evaluation_batch = self._evaluation_batch[self.batch_size:]
+            scores = self.generator._first_stage_evaluator().get_batched_scores(
+                [c.question for c in batch], [c.answer for c in batch], self.batch_size
+            )
+            for candidate, score in zip(batch, scores):
+                candidate.score = score
+            outputs.append(batch)
+        return outputs
+
+    def _rank(self, item: Any) -> List[Any]:
+        if isinstance(item, Plan):
+            self._pending.setdefault(item.document, {"count": None, "candidates": []})["count"] = item.count
+            self._finish(item.document)
+            return []
+        for candidate in item:
+            self._pending.setdefault(candidate.document, {"count": None, "candidates": []})
+            self._pending[candidate.document]["candidates"].append(candidate)
+        for document in {candidate.document for candidate in item}:
+            self._finish(document)
+        return []
+
+    def _finish(self, document: int) -> None:
+        # A document is finished once its plan and all of its candidates have arrived.
+        pending = self._pending[document]
+        if pending["count"] is None or len(pending["candidates"]) < pending["count"]:
+            return
+
+        del self._pending[document]
+        o = self.options[document]
+        candidates = sorted(pending["candidates"], key=lambda c: c.index)
+        questions = [c.question for c in candidates]
+        answers = [c.answer for c in candidates]
+        if o["use_evaluator"] and self.generator.qa_cascade is not None:
+            # The evaluation stage computed screening scores; the borderline pairs are rescored here.
+            self.results[document] = self.generator._get_cascade_ranked_qa_pairs(
+                questions, answers, o["num_questions"], self.batch_size, [c.score for c in candidates]
+            )
+        elif o["use_evaluator"]:
+            self.results[document] = self.generator._get_ranked_qa_pairs(
+                questions, answers, [c.score for c in candidates], o["num_questions"]
+            )
+        else:
+            self.results[document] = self.generator._get_all_qa_pairs(questions, answers)
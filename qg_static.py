@@ -0,0 +1,262 @@
+#qg_static.py
+import hashlib
+import json
+import os
+import threading
+import time
+import torch
+import transformers
+from typing import Any, List, Mapping, Optional, Sequence
+
+# Input lengths the encoder is compiled for. Inputs are padded to the smallest bucket that fits
+# them, so every call runs one of a few fixed shapes. The last bucket must hold SEQ_LENGTH tokens.
+DEFAULT_BUCKETS = (64, 128, 256, 512)
+# Bumped whenever the compiled functions change, so that stale artifacts are not loaded.
+ARTIFACT_VERSION = 1
+ARTIFACT_FILE = "qg-static-{}.bin"
+
+# Generation settings under which greedy decoding by StaticT5Generator matches generate().
+GREEDY_DEFAULTS = {
+    "num_beams": 1,
+    "do_sample": False,
+    "repetition_penalty": 1.0,
+    "no_repeat_ngram_size": 0,
+    "min_length": 0,
+    "min_new_tokens": None,
+    "bad_words_ids": None,
+    "forced_bos_token_id": None,
+    "forced_eos_token_id": None,
+    "suppress_tokens": None,
+    "begin_suppress_tokens": None,
+}
+
+
+def supports_static_generation(model: Any) -> bool:
+    """Whether greedy decoding with StaticT5Generator gives what model.generate gives."""
+    config = model.generation_config
+    for name, default in GREEDY_DEFAULTS.items():
+        value = getattr(config, name, default)
+        if value != default and not (default == 0 and value is None):
+            return False
+    return not getattr(model.config, "pruned_heads", None)
+
+
+class StaticT5Generator:
+    """Greedy decoding for a T5ForConditionalGeneration with torch.compile'd encoder and decoder
+    steps over fixed shapes. Inputs are padded to a length bucket, and the decoder's self-attention
+    keys and values live in a static cache of max_length - 1 positions that each step writes into
+    at its position, so every decoder step of every question runs the same compiled graph instead
+    of generate() dispatching its Python-level ops, processors and growing cache per token.
+
+    warm_up compiles every bucket. With a cache_dir and a torch that can export them, the compiled
+    artifacts are saved there after the first warm-up and loaded by later processes, which then
+    skip most of the compilation. The
+    artifacts do not hold the model's weights, which the compiled graphs take as inputs, so they
+    are keyed by the model's configuration, the buckets and the torch and transformers versions.
+    """
+
+    def __init__(
+        self,
+        model: Any,
+        buckets: Sequence[int] = DEFAULT_BUCKETS,
+        max_length: int = 64,
+        cache_dir: Optional[str] = None
+    ) -> None:
+        self.model = model
+        self.config = model.config
+        self.buckets = sorted(buckets)
+        if not self.buckets:
+            raise ValueError("StaticT5Generator needs at least one input length bucket")
+        self.max_length = max_length
+        self.cache_dir = cache_dir
+        self.device = model.device
+        self.dtype = model.dtype
+        self.steps = max_length - 1
+        self.warm = False
+        self._lock = threading.Lock()
+        self.stats = {"questions": 0, "decoder_steps": 0, "warm_up_s": None, "artifacts_loaded": False}
+
+        decoder = model.decoder
+        # Relative position bias of every decoder position against every other, with the causal
+        # mask folded in; step i reads row i.
+        with torch.no_grad():
+            bias = decoder.block[0].layer[0].SelfAttention.compute_bias(self.steps, self.steps, self.device)
+            causal = torch.ones(self.steps, self.steps, dtype=torch.bool, device=self.device).triu(1)
+            self._self_bias = bias.to(self.dtype).masked_fill(causal, torch.finfo(self.dtype).min)
+
+        # dynamic=False: each bucket is compiled for its exact shapes. Positions are passed as
+        # tensors, so that steps do not each get a graph of their own.
+        torch._dynamo.config.cache_size_limit = max(torch._dynamo.config.cache_size_limit, 2 * len(self.buckets))
+        self._encode = torch.compile(self._encode_eager, dynamic=False)
+        self._step = torch.compile(self._step_eager, dynamic=False)
+
+    @torch.no_grad()
+    def generate(self, input_ids: torch.Tensor) -> List[int]:
+        """Returns the token IDs greedy decoding generates for one sequence of input_ids, starting
+        with the decoder start token, as model.generate(input_ids, max_length=max_length) would.
+        """
+        input_ids = input_ids.reshape(-1)
+        length = input_ids.shape[0]
+        bucket = next((b for b in self.buckets if b >= length), None)
+        if bucket is None:
+            raise ValueError("Input of {} tokens is longer than the largest bucket {}".format(length, self.buckets[-1]))
+
+        padded = torch.full((1, bucket), self.config.pad_token_id, dtype=torch.long, device=self.device)
+        padded[0, :length] = input_ids
+        mask = torch.zeros((1, bucket), dtype=torch.long, device=self.device)
+        mask[0, :length] = 1
+        cross_keys, cross_values, cross_bias = self._encode(padded, mask)
+
+        layers = self.config.num_decoder_layers
+        shape = (layers, 1, self.config.num_heads, self.steps, self.config.d_kv)
+        self_keys = torch.zeros(shape, dtype=self.dtype, device=self.device)
+        self_values = torch.zeros(shape, dtype=self.dtype, device=self.device)
+
+        tokens = [self.config.decoder_start_token_id]
+        token = torch.tensor([[tokens[0]]], device=self.device)
+        for position in range(self.steps):
+            token = self._step(
+                token, torch.tensor([position], device=self.device),
+                self_keys, self_values, cross_keys, cross_values, cross_bias
+            )
+            tokens.append(int(token))
+            if tokens[-1] == self.config.eos_token_id:
+                break
+
+        self.stats["questions"] += 1
+        self.stats["decoder_steps"] += len(tokens) - 1
+        return tokens
+
+    def warm_up(self) -> float:
+        """Compiles the encoder and decoder step for every bucket, loading saved artifacts first if
+        there are any and saving them otherwise. Returns the seconds it took.
+        """
+        with self._lock:
+            if self.warm:
+                return 0.0
+            start = time.perf_counter()
+            # Portable compile artifacts need torch 2.6 or later; older versions only have
+            # inductor's own cache in the temp directory.
+            path = self._artifact_path() if hasattr(torch.compiler, "save_cache_artifacts") else None
+            if path is not None and os.path.exists(path):
+                with open(path, "rb") as file:
+                    torch.compiler.load_cache_artifacts(file.read())
+                self.stats["artifacts_loaded"] = True
+
+            for bucket in self.buckets:
+                self.generate(torch.full((bucket,), self.config.eos_token_id, dtype=torch.long))
+
+            if path is not None and not self.stats["artifacts_loaded"]:
+                artifacts = torch.compiler.save_cache_artifacts()
+                if artifacts is not None:
+                    os.makedirs(self.cache_dir, exist_ok=True)
+                    with open(path + ".tmp", "wb") as file:
+                        file.write(artifacts[0])
+                    os.replace(path + ".tmp", path)
+
+            self.stats["questions"] = 0
+            self.stats["decoder_steps"] = 0
+            self.stats["warm_up_s"] = time.perf_counter() - start
+            self.warm = True
+            return self.stats["warm_up_s"]
+
+    def _artifact_path(self) -> Optional[str]:
+        if self.cache_dir is None:
+            return None
+        key = json.dumps({
+            "version": ARTIFACT_VERSION,
+            "torch": torch.__version__,
+            "transformers": transformers.__version__,
+            "config": self.config.to_dict(),
+            "buckets": self.buckets,
+            "max_length": self.max_length,
+            "dtype": str(self.dtype),
+            "device": self.device.type,
+        }, sort_keys=True, default=str)
+        return os.path.join(self.cache_dir, ARTIFACT_FILE.format(hashlib.sha1(key.encode("utf-8")).hexdigest()))
+
+    def _heads(self, states: torch.Tensor) -> torch.Tensor:
+        # (batch, length, inner_dim) -> (batch, heads, length, d_kv)
+        return states.view(states.shape[0], -1, self.config.num_heads, self.config.d_kv).transpose(1, 2)
+
+    def _attend(self, attention: Any, query: torch.Tensor, keys: torch.Tensor, values: torch.Tensor, bias: torch.Tensor) -> torch.Tensor:
+        # T5 does not scale its attention scores.
+        scores = torch.matmul(query, keys.transpose(3, 2)) + bias
+        weights = torch.nn.functional.softmax(scores.float(), dim=-1).type_as(scores)
+        output = torch.matmul(weights, values).transpose(1, 2).reshape(query.shape[0], -1, self.config.num_heads * self.config.d_kv)
+        return attention.o(output)
+
+    def _encode_eager(self, input_ids: torch.Tensor, attention_mask: torch.Tensor) -> Any:
+        hidden = self.model.encoder(input_ids=input_ids, attention_mask=attention_mask).last_hidden_state
+        cross_keys = []
+        cross_values = []
+        for block in self.model.decoder.block:
+            attention = block.layer[1].EncDecAttention
+            cross_keys.append(self._heads(attention.k(hidden)))
+            cross_values.append(self._heads(attention.v(hidden)))
+        cross_bias = (1.0 - attention_mask[:, None, None, :].to(self.dtype)) * torch.finfo(self.dtype).min
+        return torch.stack(cross_keys), torch.stack(cross_values), cross_bias
+
+    def _step_eager(
+        self,
+        token: torch.Tensor,
+        position: torch.Tensor,
+        self_keys: torch.Tensor,
+        self_values: torch.Tensor,
+        cross_keys: torch.Tensor,
+        cross_values: torch.Tensor,
+        cross_bias: torch.Tensor
+    ) -> torch.Tensor:
+        decoder = self.model.decoder
+        hidden = decoder.embed_tokens(token)
+        self_bias = self._self_bias.index_select(2, position)
+
+        for i, block in enumerate(decoder.block):
+            layer = block.layer[0]
+            normed = layer.layer_norm(hidden)
+            attention = layer.SelfAttention
+            self_keys[i].index_copy_(2, position, self._heads(attention.k(normed)))
+            self_values[i].index_copy_(2, position, self._heads(attention.v(normed)))
+            hidden = hidden + self._attend(attention, self._heads(attention.q(normed)), self_keys[i], self_values[i], self_bias)
+
+            layer = block.layer[1]
+            normed = layer.layer_norm(hidden)
+            attention = layer.EncDecAttention
+            hidden = hidden + self._attend(attention, self._heads(attention.q(normed)), cross_keys[i], cross_values[i], cross_bias)
+
+            hidden = block.layer[2](hidden)
+
+        hidden = decoder.final_layer_norm(hidden)
+        if self.config.tie_word_embeddings:
+            hidden = hidden * (self.config.d_model ** -0.5)
+        return self.model.lm_head(hidden)[:, -1].argmax(-1, keepdim=True)
+
+
+def compare_with_eager(
+    model: Any, generator: StaticT5Generator, inputs: List[torch.Tensor], max_length: int = 64
+) -> Mapping[str, float]:
+    """Times greedy generation of every input with model.generate and with generator, and counts
+    the inputs whose generated tokens differ.
+    """
+    with torch.no_grad():
+        start = time.perf_counter()
+        eager = [
+            model.generate(input_ids=ids.reshape(1, -1), max_length=max_length)[0].tolist() for ids in inputs
+        ]
+        eager_s = time.perf_counter() - start
+
+        start = time.perf_counter()
+        static = [generator.generate(ids) for ids in inputs]
+        static_s = time.perf_counter() - start
+
+    tokens = sum(len(t) - 1 for t in eager)
+    return {
+        "inputs": len(inputs),
+        "generated_tokens": tokens,
+        "eager_s": eager_s,
+        "static_s": static_s,
+        "eager_ms_per_token": 1000 * eager_s / max(tokens, 1),
+        "static_ms_per_token": 1000 * static_s / max(sum(len(t) - 1 for t in static), 1),
+        "speedup": eager_s / max(static_s, 1e-9),
+        "mismatched_outputs": sum(a != b for a, b in zip(eager, static)),
+    }
@@ -0,0 +1,66 @@
+#qg_tokenization.py
+import threading
+from collections import OrderedDict
+from transformers import AutoTokenizer, PreTrainedTokenizerFast
+from typing import Any, List, Optional, Sequence, Tuple
+
+
+def load_fast_tokenizer(model: str) -> PreTrainedTokenizerFast:
+    """Loads the Rust-backed tokenizer of a model, converting a sentencepiece or wordpiece
+    vocabulary if the checkpoint only ships the slow one."""
+    tokenizer = AutoTokenizer.from_pretrained(model, use_fast=True)
+    if not tokenizer.is_fast:
+        raise ValueError("No fast tokenizer is available for {}".format(model))
+    return tokenizer
+
+
+class TokenizationService:
+    """Encodes texts in batches with a fast tokenizer and caches the token IDs of every text,
+    so that a sentence, segment or model input used by several pipeline stages is only
+    tokenized once. Model inputs are always encoded from their full string: concatenating
+    the IDs of their parts does not reproduce the tokenizer's output (sentencepiece, for
+    one, emits a lone "▁" piece before special tokens such as <context>). A service
+    can be shared between threads.
+    """
+
+    def __init__(self, tokenizer: PreTrainedTokenizerFast, max_cached_texts: int = 50000) -> None:
+        self.tokenizer = tokenizer
+        self.max_cached_texts = max_cached_texts
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0}
+
+    def encode(self, texts: Sequence[str]) -> List[List[int]]:
+        """Returns the token IDs of each text, without special tokens. Texts that are not cached
+        are encoded together in a single batch call."""
+        return self._encode([(None, text) for text in texts], add_special_tokens=False)
+
+    def encode_inputs(self, texts: Sequence[str], max_length: int) -> List[List[int]]:
+        """Returns the token IDs of each text as a model input, with the model's special tokens
+        and truncated to max_length, exactly as tokenizing the text on its own would."""
+        return self._encode([(max_length, text) for text in texts], truncation=True, max_length=max_length)
+
+    def _encode(self, keys: Sequence[Tuple[Optional[int], str]], **kwargs: Any) -> List[List[int]]:
+        with self._lock:
+            found = {key: self._cache[key] for key in keys if key in self._cache}
+            for key in found:
+                self._cache.move_to_end(key)
+        missing = list(dict.fromkeys(key for key in keys if key not in found))
+
+        if missing:
+            encoded = self.tokenizer([text for _, text in missing], **kwargs)["input_ids"]
+            found.update(zip(missing, encoded))
+            with self._lock:
+                for key, ids in zip(missing, encoded):
+                    self._put(key, ids)
+
+        with self._lock:
+            self.stats["hits"] += len(keys) - len(missing)
+            self.stats["misses"] += len(missing)
+        return [found[key] for key in keys]
+
+    def _put(self, key: Tuple[Optional[int], str], ids: List[int]) -> None:
+        self._cache[key] = ids
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.max_cached_texts:
+            self._cache.popitem(last=False)
@@ -0,0 +1,210 @@
+# question_generationapp/admission.py
+import math
+import re
+import threading
+import time
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+# Same sentence pattern QuestionGenerator._split_text uses, so the estimate
+# tracks the number of inputs the generator will actually build.
+SENTENCE_PATTERN = re.compile(r'[^.!?]*[.!?]')
+# Capitalised runs and numbers not at the start of a sentence: a cheap stand-in
+# for the entities spaCy will find, each of which becomes a multiple-choice input.
+ENTITY_PATTERN = re.compile(r'(?<![.!?]\s)(?<!^)\b(?:[A-Z][\w-]+(?:\s+[A-Z][\w-]+)*|\d[\d,.]*)')
+MAX_SEGMENT_TOKENS = 512
+TOKENS_PER_WORD = 1.3
+
+
+def admission_setting(name):
+    # Limits, budgets and cost factors are all set in settings.QG_ADMISSION.
+    try:
+        return settings.QG_ADMISSION[name]
+    except (AttributeError, KeyError):
+        raise ImproperlyConfigured(f"QG_ADMISSION has no {name!r} entry.")
+
+
+class CostEstimate:
+    def __init__(self, paragraphs, sentences, tokens, qg_calls, eval_calls, qg_call_cost):
+        self.paragraphs = paragraphs
+        self.sentences = sentences
+        self.tokens = tokens
+        self.qg_calls = qg_calls
+        self.eval_calls = eval_calls
+        self.cost = qg_calls * qg_call_cost + eval_calls * admission_setting('EVALUATOR_COST')
+
+    def as_dict(self):
+        return {
+            'paragraphs': self.paragraphs,
+            'sentences': self.sentences,
+            'tokens': self.tokens,
+            'qg_calls': self.qg_calls,
+            'eval_calls': self.eval_calls,
+            'cost': round(self.cost, 2),
+        }
+
+
+def estimate_cost(text, answer_style='all', use_evaluator=True):
+    paragraphs = [p for p in text.split('\n') if p.strip()]
+    sentences = SENTENCE_PATTERN.findall(text)
+    tokens = int(len(text.split()) * TOKENS_PER_WORD)
+
+    qg_calls = 0
+    context_tokens = 0
+    if answer_style in ('sentences', 'all'):
+        # Every sentence is an input whose context is its whole segment.
+        qg_calls += len(sentences)
+        context_tokens += len(sentences) * min(tokens, MAX_SEGMENT_TOKENS)
+    if answer_style in ('multiple_choice', 'all'):
+        # One input per entity, with a single sentence as context.
+        entities = sum(len(ENTITY_PATTERN.findall(s.strip())) for s in sentences)
+        sentence_tokens = tokens / max(len(sentences), 1)
+        qg_calls += entities
+        context_tokens += int(entities * sentence_tokens)
+
+    # A decode step costs about the same regardless of context; the encoder
+    # pass scales with the context length.
+    qg_call_cost = 0.5 + 0.5 * (context_tokens / max(qg_calls, 1)) / MAX_SEGMENT_TOKENS
+    eval_calls = qg_calls if use_evaluator else 0
+    return CostEstimate(len(paragraphs), len(sentences), tokens, qg_calls, eval_calls, qg_call_cost)
+
+
+def combine_estimates(estimates):
+    combined = CostEstimate(0, 0, 0, 0, 0, 0)
+    for estimate in estimates:
+        combined.paragraphs += estimate.paragraphs
+        combined.sentences += estimate.sentences
+        combined.tokens += estimate.tokens
+        combined.qg_calls += estimate.qg_calls
+        combined.eval_calls += estimate.eval_calls
+        combined.cost += estimate.cost
+    combined.cost *= admission_setting('BATCH_COST_FACTOR')
+    return combined
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, status_code, detail, retry_after=None):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = retry_after
+
+
+class Admission:
+    """A granted slot of compute budget. Release it once generation is done."""
+
+    def __init__(self, controller, user_id, estimate, answer_style, use_evaluator, degraded):
+        self.controller = controller
+        self.user_id = user_id
+        self.estimate = estimate
+        self.answer_style = answer_style
+        self.use_evaluator = use_evaluator
+        self.degraded = degraded
+        self._released = False
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self.controller._release(self)
+
+
+class AdmissionController:
+    # Budgets are tracked per process; with several server workers each one
+    # enforces its own share of the node's capacity.
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._global_in_flight = 0.0
+        self._user_in_flight = {}
+
+    @property
+    def load(self):
+        return self._global_in_flight / admission_setting('GLOBAL_BUDGET')
+
+    def admit(self, user_id, text, answer_style, use_evaluator):
+        estimate = estimate_cost(text, answer_style, use_evaluator)
+        degraded_estimate = estimate_cost(text, 'multiple_choice', use_evaluator=False)
+        estimate, degraded = self._reserve(
+            user_id, estimate, degraded_estimate, admission_setting('MAX_REQUEST_COST'),
+            'Text is too large to generate questions from. Please submit a shorter passage.'
+        )
+
+        if degraded:
+            answer_style, use_evaluator = 'multiple_choice', False
+        return Admission(self, user_id, estimate, answer_style, use_evaluator, degraded)
+
+    def admit_batch(self, user_id, documents):
+        # documents are (text, answer_style, use_evaluator) tuples. A batch is
+        # admitted, and degraded, as a whole; answer_style and use_evaluator of
+        # the admission are None when every document keeps its own options.
+        estimate = combine_estimates([
+            estimate_cost(text, answer_style, use_evaluator)
+            for text, answer_style, use_evaluator in documents
+        ])
+        degraded_estimate = combine_estimates([
+            estimate_cost(text, 'multiple_choice', use_evaluator=False) for text, _, _ in documents
+        ])
+        estimate, degraded = self._reserve(
+            user_id, estimate, degraded_estimate, admission_setting('MAX_BATCH_COST'),
+            'Batch is too large to generate questions from. Please submit fewer or shorter passages.'
+        )
+
+        if degraded:
+            return Admission(self, user_id, estimate, 'multiple_choice', False, degraded)
+        return Admission(self, user_id, estimate, None, None, degraded)
+
+    def _reserve(self, user_id, estimate, degraded_estimate, max_cost, too_large_detail):
+        global_budget = admission_setting('GLOBAL_BUDGET')
+        degraded = False
+
+        if estimate.cost > max_cost:
+            if degraded_estimate.cost > max_cost:
+                raise AdmissionRejected(413, too_large_detail)
+            estimate, degraded = degraded_estimate, True
+
+        deadline = time.monotonic() + admission_setting('QUEUE_TIMEOUT')
+        with self._condition:
+            while True:
+                user_in_flight = self._user_in_flight.get(user_id, 0.0)
+                if user_in_flight + estimate.cost > admission_setting('USER_BUDGET'):
+                    raise AdmissionRejected(
+                        429, 'Too many generation requests in progress.',
+                        self._retry_after(user_in_flight)
+                    )
+
+                projected = self._global_in_flight + estimate.cost
+                if not degraded and projected > global_budget * admission_setting('DEGRADE_AT'):
+                    estimate, degraded = degraded_estimate, True
+                    continue
+                if projected <= global_budget:
+                    break
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise AdmissionRejected(
+                        503, 'Question generation is overloaded. Please retry later.',
+                        self._retry_after(projected - global_budget)
+                    )
+                self._condition.wait(remaining)
+
+            self._global_in_flight += estimate.cost
+            self._user_in_flight[user_id] = user_in_flight + estimate.cost
+
+        return estimate, degraded
+
+    def _release(self, admission):
+        with self._condition:
+            self._global_in_flight = max(0.0, self._global_in_flight - admission.estimate.cost)
+            remaining = self._user_in_flight.get(admission.user_id, 0.0) - admission.estimate.cost
+            if remaining > 0:
+                self._user_in_flight[admission.user_id] = remaining
+            else:
+                self._user_in_flight.pop(admission.user_id, None)
+            self._condition.notify_all()
+
+    def _retry_after(self, cost):
+        return max(1, math.ceil(cost * admission_setting('SECONDS_PER_COST_UNIT')))
+
+
+admission_controller = AdmissionController()
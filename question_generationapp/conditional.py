@@ -0,0 +1,113 @@
+# question_generationapp/conditional.py
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+
+from .models import GeneratedQuestions, UserProfile
+
+# Cache keys. History versions are scoped to one user's generations, or to
+# every generation ('all') for admin reads.
+PROFILE_KEY = 'qg:profile:{}'
+HISTORY_KEY = 'qg:history:{}'
+HISTORY_RESPONSE_KEY = 'qg:history-response:{}:{}:{}:{}'
+ALL_USERS = 'all'
+
+
+def response_cache():
+    return caches[getattr(settings, 'QG_RESPONSE_CACHE', 'default')]
+
+
+def cache_timeout():
+    return getattr(settings, 'QG_RESPONSE_CACHE_TIMEOUT', 300)
+
+
+def cached(key, load):
+    cache = response_cache()
+    entry = cache.get(key)
+    if entry is None:
+        entry = load()
+        cache.set(key, entry, cache_timeout())
+    return entry
+
+
+def _version(tag, last_modified):
+    # Weak ETags: the same version can be rendered as JSON or as the browsable API.
+    return {'etag': 'W/"{}"'.format(tag), 'last_modified': last_modified}
+
+
+def profile_entry(user, serialize):
+    # The user's serialized profile and its version, cached until the profile is saved.
+    def load():
+        profile = UserProfile.objects.get(user=user)
+        tag = '{}-{}'.format(profile.pk, int(profile.updated_at.timestamp() * 1e6))
+        return dict(_version(tag, profile.updated_at), data=dict(serialize(profile)))
+    return cached(PROFILE_KEY.format(user.pk), load)
+
+
+def history_version(user_id=None):
+    # Version of the generations visible to user_id (all of them for None).
+    # The count is part of the tag, so deleting an older generation also
+    # changes it.
+    scope = ALL_USERS if user_id is None else user_id
+
+    def load():
+        queryset = GeneratedQuestions.objects.all()
+        if user_id is not None:
+            queryset = queryset.filter(user_id=user_id)
+        summary = queryset.aggregate(count=Count('id'), last_modified=Max('updated_at'))
+        last_modified = summary['last_modified']
+        stamp = int(last_modified.timestamp() * 1e6) if last_modified else 0
+        return _version('{}-{}-{}'.format(scope, summary['count'], stamp), last_modified)
+    return cached(HISTORY_KEY.format(scope), load)
+
+
+def history_variant(version, *parts):
+    # Version of one rendering of the history, e.g. an export format with its
+    # filters or a search query and page: parts are hashed into the ETag, so
+    # a client's validator for one rendering never matches another.
+    digest = hashlib.md5(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()[:16]
+    return dict(version, etag='{}-{}"'.format(version['etag'][:-1], digest))
+
+
+def cached_history_response(request, name, user_id, version, load):
+    # Response data for a history read, keyed by its version (see
+    # history_variant) so a write makes every older entry unreachable.
+    scope = ALL_USERS if user_id is None else user_id
+    url = hashlib.md5(request.build_absolute_uri().encode()).hexdigest()
+    key = HISTORY_RESPONSE_KEY.format(name, scope, hashlib.md5(version['etag'].encode()).hexdigest(), url)
+    return cached(key, load)
+
+
+def invalidate_profile(user_id):
+    # Deferred to commit so a concurrent read cannot re-cache the old row.
+    transaction.on_commit(lambda: response_cache().delete(PROFILE_KEY.format(user_id)))
+
+
+def invalidate_history(user_id):
+    transaction.on_commit(
+        lambda: response_cache().delete_many([HISTORY_KEY.format(user_id), HISTORY_KEY.format(ALL_USERS)])
+    )
+
+
+def conditional_response(request, version, build):
+    """Answers a GET with 304 Not Modified when the client's If-None-Match or
+    If-Modified-Since matches version, and otherwise with build(). Either way the
+    response carries the version's validators and asks clients to revalidate on
+    every use, so polling costs a cache lookup rather than a query and a render.
+    """
+    last_modified = version['last_modified']
+    timestamp = int(last_modified.timestamp()) if last_modified else None
+    response = get_conditional_response(request, etag=version['etag'], last_modified=timestamp)
+    if response is None:
+        response = build()
+    response['ETag'] = version['etag']
+    if timestamp is not None:
+        response['Last-Modified'] = http_date(timestamp)
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
@@ -0,0 +1,104 @@
+# question_generationapp/export.py
+import csv
+import io
+import json
+import zlib
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+
+EXPORT_FIELDS = ('id', 'user_id', 'user__email', 'entered_text', 'generated_questions', 'created_at')
+CSV_COLUMNS = ['generation_id', 'user_id', 'user_email', 'created_at', 'question', 'answer', 'options', 'score']
+# After the first line, which is sent at once so the response starts right
+# away, rows are collected into chunks of about this many bytes before they
+# are sent (and compressed) instead of being written one tiny row at a time.
+FLUSH_BYTES = 64 * 1024
+
+
+def export_rows(queryset):
+    # Only the exported columns are fetched, as dicts rather than model
+    # instances, and at most chunk_size rows are held in memory at a time.
+    chunk_size = getattr(settings, 'QG_EXPORT_CHUNK_SIZE', 2000)
+    return queryset.order_by('id').values(*EXPORT_FIELDS).iterator(chunk_size=chunk_size)
+
+
+def ndjson_lines(rows):
+    # One GeneratedQuestions row per line, with its questions as stored.
+    for row in rows:
+        yield json.dumps({
+            'id': row['id'],
+            'user_id': row['user_id'],
+            'user_email': row['user__email'],
+            'created_at': row['created_at'],
+            'entered_text': row['entered_text'],
+            'generated_questions': row['generated_questions'],
+        }, cls=DjangoJSONEncoder) + '\n'
+
+
+def csv_lines(rows):
+    # One line per generated question. Multiple choice answers are exported as
+    # the correct option, with every option in the options column.
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def flush():
+        line = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return line
+
+    writer.writerow(CSV_COLUMNS)
+    yield flush()
+    for row in rows:
+        for qa in row['generated_questions'] or []:
+            answer = qa.get('answer')
+            options = ''
+            if isinstance(answer, list):
+                options = ' | '.join(option['answer'] for option in answer)
+                answer = next((option['answer'] for option in answer if option['correct']), '')
+            writer.writerow([
+                row['id'],
+                row['user_id'],
+                row['user__email'],
+                row['created_at'].isoformat(),
+                qa.get('question', ''),
+                answer,
+                options,
+                qa.get('score', ''),
+            ])
+        yield flush()
+
+
+def buffered(lines, flush_bytes=FLUSH_BYTES):
+    lines = iter(lines)
+    for line in lines:
+        yield line.encode('utf-8')
+        break
+
+    chunk = []
+    size = 0
+    for line in lines:
+        chunk.append(line)
+        size += len(line)
+        if size >= flush_bytes:
+            yield ''.join(chunk).encode('utf-8')
+            chunk = []
+            size = 0
+    if chunk:
+        yield ''.join(chunk).encode('utf-8')
+
+
+def gzipped(chunks):
+    # A gzip stream compressed chunk by chunk, so nothing beyond the current
+    # chunk and the compressor's window is held in memory.
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    first = True
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if first:
+            # Flush the first chunk so the client receives bytes immediately.
+            compressed += compressor.flush(zlib.Z_SYNC_FLUSH)
+            first = False
+        if compressed:
+            yield compressed
+    yield compressor.flush()
@@ -0,0 +1,121 @@
+# question_generationapp/inference.py
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+from .admission import admission_controller
+from .thread_budget import configure_thread_budget
+
+_generators = {}
+_generator_lock = threading.Lock()
+_executor = None
+_executor_lock = threading.Lock()
+# Keys every tier needs once the settings are merged into the defaults.
+REQUIRED_TIER_KEYS = ('qg_model', 'qa_eval_model', 'latency_ms_per_question')
+
+
+def get_model_tiers():
+    # Settings can override the model paths (or any other key) of the default
+    # tiers and add new ones; tiers are ordered from cheapest to best.
+    from questiongenerator import MODEL_TIERS
+
+    tiers = {name: dict(config) for name, config in MODEL_TIERS.items()}
+    for name, config in getattr(settings, 'QG_MODEL_TIERS', {}).items():
+        tiers.setdefault(name, {}).update(config)
+    for name, config in tiers.items():
+        missing = [key for key in REQUIRED_TIER_KEYS if config.get(key) is None]
+        if missing:
+            raise ImproperlyConfigured(
+                f"Model tier {name!r} is missing {', '.join(missing)} in QG_MODEL_TIERS."
+            )
+    return dict(sorted(tiers.items(), key=lambda item: item[1]['latency_ms_per_question']))
+
+
+def get_question_generator(tier=None):
+    # Loading t5-large and bert-large takes seconds and gigabytes, so every
+    # request in this process shares one QuestionGenerator per tier.
+    tier = tier or settings.QG_DEFAULT_TIER
+    if tier not in _generators:
+        with _generator_lock:
+            if tier not in _generators:
+                if getattr(settings, 'QG_STUB_GENERATOR', False):
+                    from .stub_generator import StubQuestionGenerator
+                    _generators[tier] = StubQuestionGenerator(get_model_tiers()[tier]['latency_ms_per_question'])
+                    return _generators[tier]
+                # Size torch's and the BLAS thread pools to this process's
+                # share of the node before the models create them.
+                configure_thread_budget()
+                from questiongenerator import QuestionGenerator
+                _generators[tier] = QuestionGenerator.from_tier(tier, get_model_tiers())
+    return _generators[tier]
+
+
+def preload_generators(tiers=None):
+    # Builds the generators of the given tiers, by default QG_PRELOAD_TIERS,
+    # when a server process starts, so that no request waits for a tier's
+    # models to load or, with static_generation, for its compilation.
+    tiers = getattr(settings, 'QG_PRELOAD_TIERS', []) if tiers is None else tiers
+    return {tier: get_question_generator(tier) for tier in tiers}
+
+
+def select_tier(estimate, tier=None, latency_target_ms=None):
+    # An explicit tier wins; otherwise pick the best tier whose estimated
+    # latency for this request meets the target. Under load the router then
+    # steps down to cheaper tiers instead of queueing behind the large models.
+    tiers = get_model_tiers()
+    names = list(tiers)
+    if tier is None and latency_target_ms is not None:
+        within_target = [
+            name for name in names
+            if tiers[name]['latency_ms_per_question'] * max(estimate.qg_calls, 1) <= latency_target_ms
+        ]
+        tier = within_target[-1] if within_target else names[0]
+    tier = tier or settings.QG_DEFAULT_TIER
+
+    steps_down = sum(admission_controller.load >= level for level in settings.QG_TIER_FALLBACK_LOADS)
+    return names[max(names.index(tier) - steps_down, 0)]
+
+
+def generation_method(question_generator):
+    # With QG_INCREMENTAL, text the process has seen before (a resubmission
+    # after a small edit, or another user's copy of the same passage) reuses
+    # the questions and scores cached for its unchanged sentences.
+    if getattr(settings, 'QG_INCREMENTAL', False):
+        return question_generator.generate_incremental
+    return question_generator.generate
+
+
+def run_generation(tier, text, num_questions, answer_style, use_evaluator, prerank_factor=None):
+    # Module-level so it can be pickled and run by a ProcessPoolExecutor;
+    # each worker process then loads and keeps its own generators.
+    return generation_method(get_question_generator(tier))(
+        article=text,
+        num_questions=num_questions,
+        answer_style=answer_style,
+        use_evaluator=use_evaluator,
+        prerank_factor=prerank_factor
+    )
+
+
+def get_executor() -> Executor:
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                workers = getattr(settings, 'QG_EXECUTOR_WORKERS', 1)
+                if getattr(settings, 'QG_EXECUTOR', 'thread') == 'process':
+                    _executor = ProcessPoolExecutor(max_workers=workers, initializer=_initialize_worker)
+                else:
+                    _executor = ThreadPoolExecutor(
+                        max_workers=workers, thread_name_prefix='question-generation'
+                    )
+    return _executor
+
+
+def _initialize_worker():
+    # Each worker process runs one generation at a time, and loads its own
+    # generators before taking any.
+    configure_thread_budget(1)
+    preload_generators()
@@ -0,0 +1,91 @@
+# question_generationapp/management/commands/benchmark_search.py
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+
+from question_generationapp.models import Account, GeneratedQuestions
+from question_generationapp.search import SearchResults
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares the full-text search index with a LIKE scan over synthetic "
+        "generations. Rows are inserted in a transaction that is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=100000)
+        parser.add_argument('--page_size', type=int, default=20)
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--vocabulary', type=int, default=20000)
+        parser.add_argument('--words_per_text', type=int, default=150)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        vocabulary = [self._word(rng) for _ in range(options['vocabulary'])]
+        # Zipf-like word frequencies, so queries range from common to rare terms.
+        weights = [1 / (rank + 1) for rank in range(len(vocabulary))]
+
+        with transaction.atomic():
+            user = Account.objects.create_user(
+                'Search', 'Benchmark', 'search-benchmark', 'search-benchmark@example.com'
+            )
+            start = time.perf_counter()
+            for offset in range(0, options['rows'], 2000):
+                GeneratedQuestions.objects.bulk_create([
+                    self._generation(user, rng, vocabulary, weights, options['words_per_text'])
+                    for _ in range(min(2000, options['rows'] - offset))
+                ])
+            self.stdout.write(
+                f"Inserted {options['rows']} rows in {time.perf_counter() - start:.1f}s (index kept in sync)"
+            )
+
+            queries = {
+                'common term': vocabulary[5],
+                'mid-frequency term': vocabulary[500],
+                'rare term': vocabulary[-1],
+                'two terms': f'{vocabulary[10]} {vocabulary[200]}',
+            }
+            for name, query in queries.items():
+                indexed = self._time(options['repeat'], lambda: self._indexed(query, options['page_size']))
+                scan = self._time(options['repeat'], lambda: self._scan(query, options['page_size']))
+                self.stdout.write(
+                    f"{name} ({query!r}): index {indexed:.1f} ms, LIKE scan {scan:.1f} ms, "
+                    f"speedup {scan / max(indexed, 1e-3):.0f}x"
+                )
+
+            transaction.set_rollback(True)
+
+    def _word(self, rng):
+        return ''.join(rng.choice('abcdefghijklmnopqrstuvwxyz') for _ in range(rng.randint(4, 10)))
+
+    def _generation(self, user, rng, vocabulary, weights, words_per_text):
+        words = rng.choices(vocabulary, weights, k=words_per_text)
+        questions = [
+            {'question': ' '.join(rng.choices(vocabulary, weights, k=8)) + '?', 'answer': ' '.join(words[:10])}
+            for _ in range(5)
+        ]
+        return GeneratedQuestions(user=user, entered_text=' '.join(words), generated_questions=questions)
+
+    def _indexed(self, query, page_size):
+        results = SearchResults(query)
+        return results.count(), results[:page_size]
+
+    def _scan(self, query, page_size):
+        queryset = GeneratedQuestions.objects.all()
+        for term in query.split():
+            queryset = queryset.filter(Q(entered_text__icontains=term) | Q(generated_questions__icontains=term))
+        return queryset.count(), list(queryset.order_by('-id')[:page_size])
+
+    def _time(self, repeat, fn):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            fn()
+            timings.append(1000 * (time.perf_counter() - start))
+        return statistics.median(timings)
@@ -0,0 +1,132 @@
+# question_generationapp/management/commands/benchmark_threads.py
+import multiprocessing
+import queue
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from question_generationapp.thread_budget import ThreadBudget, available_cores
+
+PASSAGE = (
+    "The Amazon rainforest covers much of the Amazon basin of South America. "
+    "The basin encompasses seven million square kilometres, of which five and a half million "
+    "are covered by the rainforest. The region includes territory belonging to nine nations, "
+    "and the majority of the forest is contained within Brazil. Deforestation increased "
+    "sharply in the 1970s as roads were built through the forest."
+)
+
+
+def _run_worker(slot, cores, threads, pin, tier, text, num_questions, duration, barrier, results):
+    # Runs in a spawned process, so Django is set up again and the thread limits
+    # are applied before torch and the BLAS libraries create their pools.
+    import django
+    django.setup()
+    process_cores = [cores[(slot * threads + offset) % len(cores)] for offset in range(threads)]
+    ThreadBudget(process_cores).apply(pin=pin)
+
+    from questiongenerator import QuestionGenerator
+    from question_generationapp.inference import get_model_tiers
+
+    generator = QuestionGenerator.from_tier(tier, get_model_tiers())
+    generator.generate(text, num_questions=num_questions, use_evaluator=False)  # warm-up
+    barrier.wait()
+    latencies = []
+    start = time.perf_counter()
+    while time.perf_counter() - start < duration:
+        call_start = time.perf_counter()
+        generator.generate(text, num_questions=num_questions, use_evaluator=False)
+        latencies.append(time.perf_counter() - call_start)
+    results.put(latencies)
+
+
+class Command(BaseCommand):
+    help = (
+        "Measures generation throughput for different splits of the cores between "
+        "processes and threads, e.g. --splits 1x4 2x2 4x1 4x4 (processes x threads "
+        "per process; the last one oversubscribes a 4-core node)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--splits', nargs='+', default=None)
+        parser.add_argument('--tier', default=settings.QG_DEFAULT_TIER)
+        parser.add_argument('--duration', type=float, default=30.0)
+        parser.add_argument('--num_questions', type=int, default=5)
+        parser.add_argument('--text_file', default=None)
+        parser.add_argument('--pin', action='store_true')
+        # Seconds a split may take beyond --duration to load and warm up its models.
+        parser.add_argument('--timeout', type=float, default=600.0)
+
+    def handle(self, *args, **options):
+        cores = available_cores()
+        text = PASSAGE
+        if options['text_file']:
+            with open(options['text_file']) as f:
+                text = f.read()
+        splits = options['splits'] or self._default_splits(len(cores))
+
+        self.stdout.write(f"{len(cores)} cores, tier {options['tier']}, {options['duration']:.0f}s per split")
+        context = multiprocessing.get_context('spawn')
+        failed = []
+        for split in splits:
+            try:
+                processes, threads = (int(part) for part in split.split('x'))
+            except ValueError:
+                raise CommandError(f"Splits look like 2x4 (processes x threads), got {split!r}.")
+            barrier = context.Barrier(processes)
+            results = context.Queue()
+            workers = [
+                context.Process(target=_run_worker, args=(
+                    slot, cores, threads, options['pin'], options['tier'], text,
+                    options['num_questions'], options['duration'], barrier, results
+                ))
+                for slot in range(processes)
+            ]
+            for worker in workers:
+                worker.start()
+            latencies = self._collect(workers, results, options['duration'] + options['timeout'])
+            if latencies is None:
+                for worker in workers:
+                    worker.terminate()
+            for worker in workers:
+                worker.join()
+            if latencies is None:
+                failed.append(split)
+                self.stderr.write(
+                    f"{split}: failed, worker exit codes {[worker.exitcode for worker in workers]}"
+                )
+                continue
+
+            throughput = len(latencies) / options['duration']
+            oversubscribed = ' (oversubscribed)' if processes * threads > len(cores) else ''
+            self.stdout.write(
+                f"{split}{oversubscribed}: {throughput:.2f} passages/s, "
+                f"mean latency {1000 * sum(latencies) / max(len(latencies), 1):.0f} ms"
+            )
+
+        if failed:
+            raise CommandError(f"Splits failed: {' '.join(failed)}")
+
+    def _collect(self, workers, results, timeout):
+        # Gathers every worker's latencies, or returns None as soon as a worker
+        # exits without reporting them or the split runs past timeout seconds.
+        latencies = []
+        remaining = len(workers)
+        deadline = time.monotonic() + timeout
+        while remaining:
+            try:
+                latencies.extend(results.get(timeout=1.0))
+                remaining -= 1
+            except queue.Empty:
+                crashed = any(worker.exitcode not in (None, 0) for worker in workers)
+                if crashed or time.monotonic() > deadline:
+                    return None
+        return latencies
+
+    def _default_splits(self, cores):
+        # Every processes x threads split that fills the node exactly, plus one
+        # process per core with every process sized to the whole node.
+        splits = [f'{processes}x{cores // processes}' for processes in range(1, cores + 1) if cores % processes == 0]
+        if cores > 1:
+            splits.append(f'{cores}x{cores}')
+        return splits
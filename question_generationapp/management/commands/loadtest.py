@@ -0,0 +1,319 @@
+# question_generationapp/management/commands/loadtest.py
+import http.client
+import json
+import logging
+import math
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+
+GENERATE_PATH = '/api/generate-questions/'
+
+
+def percentile(sorted_values, fraction):
+    # Nearest-rank percentile of an already sorted list.
+    if not sorted_values:
+        return None
+    return sorted_values[max(math.ceil(fraction * len(sorted_values)) - 1, 0)]
+
+
+def load_corpus(path):
+    """Reads a JSONL corpus of requests. A line with a "path" is sent as is:
+    {"method": "POST", "path": "/api/generate-questions/batch/", "body": {...}}.
+    Any other line is a passage for the generation endpoint, taken from its
+    "text" or, as in a backlog file, its "body" field; the remaining generation
+    fields (num_questions, answer_style, use_evaluator, tier) are passed along.
+    """
+    requests = []
+    with open(path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            if 'path' in entry:
+                requests.append((entry.get('method', 'POST'), entry['path'], entry.get('body')))
+                continue
+            body = {'text': entry.get('text') or entry.get('body') or ''}
+            for field in ('num_questions', 'answer_style', 'use_evaluator', 'tier'):
+                if field in entry:
+                    body[field] = entry[field]
+            requests.append(('POST', GENERATE_PATH, body))
+    if not requests:
+        raise CommandError(f"No requests in {path}.")
+    return requests
+
+
+class Client:
+    """JWT-authenticated JSON client for one server. Each thread keeps its own
+    keep-alive connection; an expired access token is renewed by logging in
+    again through LoginView and the request retried once.
+    """
+
+    def __init__(self, url, email, password, timeout):
+        parts = urlsplit(url)
+        self.host = parts.hostname
+        self.port = parts.port or (443 if parts.scheme == 'https' else 80)
+        self.https = parts.scheme == 'https'
+        self.email = email
+        self.password = password
+        self.timeout = timeout
+        self.access = None
+        self._local = threading.local()
+        self._login_lock = threading.Lock()
+
+    def register(self):
+        status, _ = self.request('POST', '/api/register/', {
+            'email': self.email, 'password': self.password,
+            'username': self.email.split('@')[0], 'first_name': 'Load', 'last_name': 'Test',
+        }, authenticate=False)
+        return status
+
+    def login(self):
+        with self._login_lock:
+            status, body = self.request(
+                'POST', '/api/login/', {'email': self.email, 'password': self.password}, authenticate=False
+            )
+            if status != 200:
+                raise CommandError(f"Login as {self.email} failed with {status}: {body[:200]!r}")
+            self.access = json.loads(body)['access']
+
+    def request(self, method, path, body=None, authenticate=True):
+        status, data = self._send(method, path, body, authenticate)
+        if status == 401 and authenticate:
+            self.login()
+            status, data = self._send(method, path, body, authenticate)
+        return status, data
+
+    def _send(self, method, path, body, authenticate):
+        headers = {'Content-Type': 'application/json', 'Accept': 'application/json'}
+        if authenticate:
+            headers['Authorization'] = f'Bearer {self.access}'
+        payload = json.dumps(body).encode() if body is not None else None
+        for attempt in range(2):
+            connection = self._connection()
+            try:
+                connection.request(method, path, body=payload, headers=headers)
+                response = connection.getresponse()
+                return response.status, response.read()
+            except (http.client.HTTPException, ConnectionError):
+                # The server closed the kept-alive connection; reconnect once.
+                self._local.connection = None
+                if attempt:
+                    raise
+
+    def _connection(self):
+        if getattr(self._local, 'connection', None) is None:
+            connection_class = http.client.HTTPSConnection if self.https else http.client.HTTPConnection
+            self._local.connection = connection_class(self.host, self.port, timeout=self.timeout)
+        return self._local.connection
+
+
+class Step:
+    # Outcomes of one load level.
+
+    def __init__(self, mode, load):
+        self.mode = mode
+        self.load = load
+        self.latencies = []
+        self.statuses = {}
+        self._lock = threading.Lock()
+
+    def record(self, status, latency):
+        with self._lock:
+            self.statuses[status] = self.statuses.get(status, 0) + 1
+            if status is not None and 200 <= status < 300:
+                self.latencies.append(latency)
+
+    def summary(self, duration):
+        latencies = sorted(self.latencies)
+        requests = sum(self.statuses.values())
+        ok = len(latencies)
+        return {
+            'mode': self.mode,
+            'concurrency' if self.mode == 'closed' else 'arrival_rate': self.load,
+            'duration_s': round(duration, 3),
+            'requests': requests,
+            'ok': ok,
+            'errors': {str(status): count for status, count in self.statuses.items() if not (status and 200 <= status < 300)},
+            'error_rate': round((requests - ok) / max(requests, 1), 4),
+            'throughput_rps': round(ok / max(duration, 1e-9), 3),
+            'latency_ms': {
+                'p50': self._ms(percentile(latencies, 0.50)),
+                'p95': self._ms(percentile(latencies, 0.95)),
+                'p99': self._ms(percentile(latencies, 0.99)),
+                'mean': self._ms(sum(latencies) / ok if ok else None),
+                'max': self._ms(latencies[-1] if latencies else None),
+            },
+        }
+
+    def _ms(self, seconds):
+        return None if seconds is None else round(1000 * seconds, 1)
+
+
+class Command(BaseCommand):
+    help = (
+        "Replays a JSONL corpus of requests against the API at increasing load "
+        "and reports latency percentiles, throughput and error rates per level, "
+        "plus where the server saturates. Closed-loop levels (--concurrency) keep "
+        "N requests in flight; open-loop levels (--rates) send requests at Poisson "
+        "arrival times whether or not earlier ones have finished. Without --url an "
+        "in-process server is started; run it with QG_STUB_GENERATOR=1 (or tiny "
+        "QG_MODEL_TIERS) to test without model downloads or a GPU."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--corpus', required=True)
+        parser.add_argument('--url', default=None)
+        parser.add_argument('--email', default='loadtest@example.com')
+        parser.add_argument('--password', default='loadtest-password')
+        parser.add_argument('--register', action='store_true', help="Create the user through /api/register/ first.")
+        parser.add_argument('--concurrency', type=int, nargs='*', default=[1, 2, 4, 8])
+        parser.add_argument('--rates', type=float, nargs='*', default=[])
+        parser.add_argument('--duration', type=float, default=30.0)
+        parser.add_argument('--max_in_flight', type=int, default=64)
+        parser.add_argument('--timeout', type=float, default=120.0)
+        parser.add_argument('--slo_p99_ms', type=float, default=None)
+        parser.add_argument('--max_error_rate', type=float, default=0.01)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', default=None)
+
+    def handle(self, *args, **options):
+        corpus = load_corpus(options['corpus'])
+        server = None
+        url = options['url']
+        if url is None:
+            server, url = self._start_server()
+        try:
+            client = Client(url, options['email'], options['password'], options['timeout'])
+            if options['register']:
+                client.register()
+            client.login()
+
+            rng = random.Random(options['seed'])
+            cursor = {'next': 0}
+            cursor_lock = threading.Lock()
+
+            def next_request():
+                # Requests are replayed in corpus order, wrapping around.
+                with cursor_lock:
+                    request = corpus[cursor['next'] % len(corpus)]
+                    cursor['next'] += 1
+                return request
+
+            steps = []
+            for concurrency in options['concurrency']:
+                steps.append(self._closed_loop(client, next_request, concurrency, options['duration']))
+                self._report(steps[-1])
+            for rate in options['rates']:
+                steps.append(self._open_loop(
+                    client, next_request, rate, options['duration'], options['max_in_flight'], rng
+                ))
+                self._report(steps[-1])
+        finally:
+            if server is not None:
+                server.shutdown()
+                server.server_close()
+
+        report = {
+            'target': url,
+            'corpus': options['corpus'],
+            'steps': steps,
+            'saturation': self._saturation(steps, options['slo_p99_ms'], options['max_error_rate']),
+        }
+        text = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(text)
+        self.stdout.write(text)
+
+    def _start_server(self):
+        from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler, get_internal_wsgi_application
+
+        class QuietHandler(WSGIRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+        # Rejections (429/503) are expected under load; keep them out of the report.
+        logging.getLogger('django.request').setLevel(logging.ERROR)
+        server = ThreadedWSGIServer(('127.0.0.1', 0), QuietHandler)
+        server.set_app(get_internal_wsgi_application())
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server, f'http://127.0.0.1:{server.server_address[1]}'
+
+    def _call(self, client, step, request, start):
+        method, path, body = request
+        try:
+            status, _ = client.request(method, path, body)
+        except (OSError, http.client.HTTPException):
+            status = None
+        step.record(status, time.perf_counter() - start)
+
+    def _closed_loop(self, client, next_request, concurrency, duration):
+        step = Step('closed', concurrency)
+        start = time.perf_counter()
+
+        def worker():
+            while time.perf_counter() - start < duration:
+                self._call(client, step, next_request(), time.perf_counter())
+
+        threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return step.summary(time.perf_counter() - start)
+
+    def _open_loop(self, client, next_request, rate, duration, max_in_flight, rng):
+        # Latency is measured from each request's scheduled arrival, so time
+        # spent waiting for a free client thread counts as the server's delay.
+        step = Step('open', rate)
+        start = time.perf_counter()
+        arrival = start
+        with ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+            while True:
+                arrival += rng.expovariate(rate)
+                if arrival - start >= duration:
+                    break
+                time.sleep(max(arrival - time.perf_counter(), 0))
+                executor.submit(self._call, client, step, next_request(), arrival)
+        return step.summary(time.perf_counter() - start)
+
+    def _report(self, step):
+        load = step.get('concurrency', step.get('arrival_rate'))
+        self.stderr.write(
+            f"{step['mode']} {load}: {step['throughput_rps']} req/s, p50 {step['latency_ms']['p50']} ms, "
+            f"p99 {step['latency_ms']['p99']} ms, errors {step['error_rate']:.1%}"
+        )
+
+    def _saturation(self, steps, slo_p99_ms, max_error_rate):
+        # Per mode, the last level before throughput stopped growing by at least
+        # 5%, the error rate passed max_error_rate or p99 missed the SLO.
+        saturation = {}
+        for mode in ('closed', 'open'):
+            levels = [step for step in steps if step['mode'] == mode]
+            capacity, reason, best = None, None, 0.0
+            for step in levels:
+                p99 = step['latency_ms']['p99']
+                if step['error_rate'] > max_error_rate:
+                    reason = 'error rate'
+                elif slo_p99_ms is not None and (p99 is None or p99 > slo_p99_ms):
+                    reason = 'p99 latency'
+                elif capacity is not None and step['throughput_rps'] < best * 1.05:
+                    reason = 'throughput plateau'
+                if reason:
+                    break
+                capacity, best = step, max(best, step['throughput_rps'])
+            if levels:
+                saturation[mode] = {
+                    'capacity': None if capacity is None else {
+                        'load': capacity.get('concurrency', capacity.get('arrival_rate')),
+                        'throughput_rps': capacity['throughput_rps'],
+                        'p99_ms': capacity['latency_ms']['p99'],
+                    },
+                    'saturated_by': reason,
+                }
+        return saturation
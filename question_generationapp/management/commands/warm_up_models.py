@@ -0,0 +1,39 @@
+# question_generationapp/management/commands/warm_up_models.py
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from question_generationapp.inference import get_model_tiers, preload_generators
+
+
+class Command(BaseCommand):
+    help = (
+        "Loads the generators of the given tiers (by default QG_PRELOAD_TIERS) "
+        "and reports how long each took. Run at deploy time, before the servers "
+        "start, so that static_generation tiers save their compiled artifacts to "
+        "their cache_dir and server processes only load them."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tiers', nargs='*', default=None)
+
+    def handle(self, *args, **options):
+        tiers = options['tiers']
+        if tiers is None:
+            tiers = getattr(settings, 'QG_PRELOAD_TIERS', [])
+        unknown = set(tiers) - set(get_model_tiers())
+        if unknown:
+            raise CommandError(f"Unknown tiers: {sorted(unknown)}")
+
+        for tier in tiers:
+            start = time.perf_counter()
+            generator = preload_generators([tier])[tier]
+            static = getattr(generator, 'qg_static', None)
+            detail = ''
+            if static is not None:
+                detail = (
+                    f", compiled buckets {static.buckets} in {static.stats['warm_up_s']:.1f} s"
+                    f"{' from saved artifacts' if static.stats['artifacts_loaded'] else ''}"
+                )
+            self.stdout.write(f"{tier}: ready in {time.perf_counter() - start:.1f} s{detail}")
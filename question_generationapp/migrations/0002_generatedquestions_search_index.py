@@ -0,0 +1,86 @@
+from django.db import migrations
+
+# Full-text index over GeneratedQuestions.entered_text and the text of the
+# generated questions. On SQLite it is an FTS5 table kept in sync by triggers;
+# on PostgreSQL a GIN expression index, which question_generationapp.search
+# queries with the same expression. Other backends get no index and search
+# falls back to a LIKE scan.
+
+SQLITE_QUESTIONS = (
+    "(SELECT group_concat(json_extract(value, '$.question'), char(10)) "
+    "FROM json_each({row}.generated_questions))"
+)
+
+# SQLite drops these triggers whenever a migration rebuilds the
+# generatedquestions table (most AddField/AlterField operations), so such
+# migrations must create them again; see 0003.
+SQLITE_TRIGGERS = [
+    "CREATE TRIGGER question_generationapp_generatedquestions_fts_insert "
+    "AFTER INSERT ON question_generationapp_generatedquestions BEGIN "
+    "INSERT INTO question_generationapp_generatedquestions_fts(rowid, entered_text, questions) "
+    f"VALUES (new.id, new.entered_text, {SQLITE_QUESTIONS.format(row='new')}); "
+    "END",
+    "CREATE TRIGGER question_generationapp_generatedquestions_fts_delete "
+    "AFTER DELETE ON question_generationapp_generatedquestions BEGIN "
+    "DELETE FROM question_generationapp_generatedquestions_fts WHERE rowid = old.id; "
+    "END",
+    "CREATE TRIGGER question_generationapp_generatedquestions_fts_update "
+    "AFTER UPDATE OF entered_text, generated_questions ON question_generationapp_generatedquestions BEGIN "
+    "DELETE FROM question_generationapp_generatedquestions_fts WHERE rowid = old.id; "
+    "INSERT INTO question_generationapp_generatedquestions_fts(rowid, entered_text, questions) "
+    f"VALUES (new.id, new.entered_text, {SQLITE_QUESTIONS.format(row='new')}); "
+    "END",
+]
+
+SQLITE_FORWARD = [
+    "CREATE VIRTUAL TABLE question_generationapp_generatedquestions_fts "
+    "USING fts5(entered_text, questions, tokenize='porter unicode61')",
+    *SQLITE_TRIGGERS,
+    "INSERT INTO question_generationapp_generatedquestions_fts(rowid, entered_text, questions) "
+    f"SELECT id, entered_text, {SQLITE_QUESTIONS.format(row='question_generationapp_generatedquestions')} "
+    "FROM question_generationapp_generatedquestions",
+]
+
+SQLITE_DROP_TRIGGERS = [
+    "DROP TRIGGER IF EXISTS question_generationapp_generatedquestions_fts_update",
+    "DROP TRIGGER IF EXISTS question_generationapp_generatedquestions_fts_delete",
+    "DROP TRIGGER IF EXISTS question_generationapp_generatedquestions_fts_insert",
+]
+
+SQLITE_BACKWARD = [
+    *SQLITE_DROP_TRIGGERS,
+    "DROP TABLE IF EXISTS question_generationapp_generatedquestions_fts",
+]
+
+POSTGRESQL_FORWARD = [
+    "CREATE INDEX question_generationapp_generatedquestions_search "
+    "ON question_generationapp_generatedquestions USING GIN (("
+    "to_tsvector('english', entered_text) || "
+    "to_tsvector('english', jsonb_path_query_array(generated_questions, '$[*].question'))"
+    "))",
+]
+
+POSTGRESQL_BACKWARD = [
+    "DROP INDEX IF EXISTS question_generationapp_generatedquestions_search",
+]
+
+
+def run(statements):
+    def apply(apps, schema_editor):
+        for statement in statements.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(statement, params=None)
+    return apply
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('question_generationapp', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run({'sqlite': SQLITE_FORWARD, 'postgresql': POSTGRESQL_FORWARD}),
+            run({'sqlite': SQLITE_BACKWARD, 'postgresql': POSTGRESQL_BACKWARD}),
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.0.14 on 2026-10-19 03:02
+
+from importlib import import_module
+
+from django.db import migrations, models
+
+search_index = import_module('question_generationapp.migrations.0002_generatedquestions_search_index')
+# Adding or removing a column rebuilds the table on SQLite, which drops the
+# full-text index triggers from 0002, so they are created again afterwards in
+# both directions.
+restore_search_triggers = search_index.run(
+    {'sqlite': search_index.SQLITE_DROP_TRIGGERS + search_index.SQLITE_TRIGGERS}
+)
+
+
+def backfill_generation_updated_at(apps, schema_editor):
+    # Existing generations have not changed since they were created.
+    GeneratedQuestions = apps.get_model('question_generationapp', 'GeneratedQuestions')
+    GeneratedQuestions.objects.update(updated_at=models.F('created_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('question_generationapp', '0002_generatedquestions_search_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(migrations.RunPython.noop, restore_search_triggers),
+        migrations.AddField(
+            model_name='generatedquestions',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.RunPython(backfill_generation_updated_at, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='generatedquestions',
+            index=models.Index(fields=['user', 'updated_at'], name='question_ge_user_id_860699_idx'),
+        ),
+        migrations.RunPython(restore_search_triggers, migrations.RunPython.noop),
+    ]
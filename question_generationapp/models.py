@@ -79,6 +79,8 @@ class UserProfile(models.Model):
     blood_group = models.CharField(max_length=3, blank=True)
     date_of_birth = models.DateField(null=True, blank=True)
     age_years = models.PositiveIntegerField(null=True, blank=True)
+    # Drives the ETag/Last-Modified of the profile endpoint.
+    updated_at = models.DateTimeField(auto_now=True)
     
     def __str__(self):
         return f'{self.user.first_name} {self.user.last_name}'
@@ -89,6 +91,11 @@ class GeneratedQuestions(models.Model):
     generated_questions = models.JSONField()  # Assuming you're storing the generated questions as JSON
 
     created_at = models.DateTimeField(auto_now_add=True)
+    # Drives the ETag/Last-Modified of history reads; see conditional.py.
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['user', 'updated_at'])]
 
     def __str__(self):
         return f"Generated Questions for {self.user.username} at {self.created_at}"
@@ -0,0 +1,211 @@
+# question_generationapp/search.py
+import html
+import re
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+
+from .models import GeneratedQuestions
+
+# Snippets are HTML: the stored text is escaped and every match is wrapped in
+# <mark>...</mark>, the only markup a snippet can contain. The database marks
+# matches with private-use characters, which become the tags after escaping.
+SNIPPET_START = '<mark>'
+SNIPPET_END = '</mark>'
+MATCH_START = '\ue000'
+MATCH_END = '\ue001'
+SNIPPET_TOKENS = 16
+TERM_PATTERN = re.compile(r'\w+')
+
+# CROSS JOIN keeps the FTS table as the outer loop; otherwise SQLite may walk a
+# user's rows and evaluate the MATCH once per row. Ordering by the FTS5 rank
+# column (BM25) lets FTS5 rank matches without computing every snippet.
+SQLITE_SEARCH = """
+    SELECT g.id, g.user_id, g.created_at,
+           snippet(question_generationapp_generatedquestions_fts, 0, %s, %s, '…', %s),
+           snippet(question_generationapp_generatedquestions_fts, 1, %s, %s, '…', %s),
+           question_generationapp_generatedquestions_fts.rank
+    FROM question_generationapp_generatedquestions_fts
+    CROSS JOIN question_generationapp_generatedquestions g ON g.id = question_generationapp_generatedquestions_fts.rowid
+    WHERE question_generationapp_generatedquestions_fts MATCH %s {user_filter}
+    ORDER BY {order}
+    LIMIT %s OFFSET %s
+"""
+SQLITE_RANKED = 'question_generationapp_generatedquestions_fts.rank'
+SQLITE_NEWEST = 'question_generationapp_generatedquestions_fts.rowid DESC'
+SQLITE_COUNT = """
+    SELECT count(*)
+    FROM question_generationapp_generatedquestions_fts
+    WHERE question_generationapp_generatedquestions_fts MATCH %s
+"""
+SQLITE_USER_COUNT = """
+    SELECT count(*)
+    FROM question_generationapp_generatedquestions_fts
+    CROSS JOIN question_generationapp_generatedquestions g ON g.id = question_generationapp_generatedquestions_fts.rowid
+    WHERE question_generationapp_generatedquestions_fts MATCH %s AND g.user_id = %s
+"""
+
+# The document expression must stay identical to the GIN index created by
+# migration 0002, or PostgreSQL cannot use the index.
+POSTGRESQL_DOCUMENT = (
+    "(to_tsvector('english', g.entered_text) || "
+    "to_tsvector('english', jsonb_path_query_array(g.generated_questions, '$[*].question')))"
+)
+POSTGRESQL_SEARCH = """
+    SELECT g.id, g.user_id, g.created_at,
+           ts_headline('english', g.entered_text, query, %s),
+           ts_headline('english', jsonb_path_query_array(g.generated_questions, '$[*].question')::text, query, %s),
+           -ts_rank({document}, query) AS score
+    FROM question_generationapp_generatedquestions g, websearch_to_tsquery('english', %s) query
+    WHERE {document} @@ query {user_filter}
+    ORDER BY {order}
+    LIMIT %s OFFSET %s
+"""
+POSTGRESQL_RANKED = 'score'
+POSTGRESQL_NEWEST = 'g.id DESC'
+POSTGRESQL_COUNT = """
+    SELECT count(*)
+    FROM question_generationapp_generatedquestions g, websearch_to_tsquery('english', %s) query
+    WHERE {document} @@ query {user_filter}
+"""
+
+
+def snippet_html(snippet):
+    if snippet is None:
+        return None
+    return html.escape(snippet).replace(MATCH_START, SNIPPET_START).replace(MATCH_END, SNIPPET_END)
+
+
+class SearchResults:
+    """Ranked full-text matches for a query, optionally limited to one user's
+    generations. Slicing runs one query for just that page and len() a count,
+    so instances can be handed to Django's and DRF's paginators.
+
+    Ranking means scoring every match, and terms found in most rows carry almost
+    no ranking signal, so queries with more than QG_SEARCH_RANKED_MATCHES matches
+    are returned newest first instead.
+    """
+
+    def __init__(self, query, user_id=None):
+        self.query = query
+        self.user_id = user_id
+        self.terms = TERM_PATTERN.findall(query)
+        self._count = None
+
+    def count(self):
+        if self._count is None:
+            self._count = self._run_count() if self.terms else 0
+        return self._count
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, item):
+        if not isinstance(item, slice):
+            return self[item:item + 1][0]
+        start = item.start or 0
+        stop = item.stop if item.stop is not None else self.count()
+        if not self.terms or stop <= start:
+            return []
+        return self._run_search(stop - start, start)
+
+    def _user_filter(self):
+        if self.user_id is None:
+            return '', []
+        return 'AND g.user_id = %s', [self.user_id]
+
+    def _ranked(self):
+        return self.count() <= getattr(settings, 'QG_SEARCH_RANKED_MATCHES', 20000)
+
+    def _run_count(self):
+        user_filter, user_params = self._user_filter()
+        if connection.vendor == 'sqlite':
+            sql = SQLITE_COUNT if self.user_id is None else SQLITE_USER_COUNT
+            params = [self._fts5_query()] + user_params
+        elif connection.vendor == 'postgresql':
+            sql = POSTGRESQL_COUNT.format(document=POSTGRESQL_DOCUMENT, user_filter=user_filter)
+            params = [self.query] + user_params
+        else:
+            return self._like_queryset().count()
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.fetchone()[0]
+
+    def _run_search(self, limit, offset):
+        user_filter, user_params = self._user_filter()
+        if connection.vendor == 'sqlite':
+            order = SQLITE_RANKED if self._ranked() else SQLITE_NEWEST
+            sql = SQLITE_SEARCH.format(user_filter=user_filter, order=order)
+            snippet = [MATCH_START, MATCH_END, SNIPPET_TOKENS]
+            params = snippet + snippet + [self._fts5_query()] + user_params + [limit, offset]
+        elif connection.vendor == 'postgresql':
+            order = POSTGRESQL_RANKED if self._ranked() else POSTGRESQL_NEWEST
+            sql = POSTGRESQL_SEARCH.format(document=POSTGRESQL_DOCUMENT, user_filter=user_filter, order=order)
+            options = f'StartSel={MATCH_START}, StopSel={MATCH_END}, MaxWords={SNIPPET_TOKENS}, MinWords=5'
+            params = [options, options, self.query] + user_params + [limit, offset]
+        else:
+            return self._like_search(limit, offset)
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            rows = cursor.fetchall()
+        return [
+            {
+                'id': row[0],
+                'user': row[1],
+                'created_at': row[2],
+                'text_snippet': snippet_html(row[3]),
+                'questions_snippet': snippet_html(row[4]),
+                'rank': -row[5],
+            }
+            for row in rows
+        ]
+
+    def _fts5_query(self):
+        # Every term must match; terms are quoted so user input cannot use
+        # FTS5 query syntax, and the last one also matches as a prefix.
+        quoted = ['"{}"'.format(term) for term in self.terms]
+        quoted[-1] += '*'
+        return ' '.join(quoted)
+
+    def _like_queryset(self):
+        # Backends without a full-text index: every term must appear in the
+        # text or the questions. This is a full scan, as before the index.
+        queryset = GeneratedQuestions.objects.all()
+        if self.user_id is not None:
+            queryset = queryset.filter(user_id=self.user_id)
+        for term in self.terms:
+            queryset = queryset.filter(Q(entered_text__icontains=term) | Q(generated_questions__icontains=term))
+        return queryset
+
+    def _like_search(self, limit, offset):
+        rows = self._like_queryset().order_by('-id')[offset:offset + limit]
+        return [
+            {
+                'id': row.id,
+                'user': row.user_id,
+                'created_at': row.created_at,
+                'text_snippet': self._like_snippet(row.entered_text),
+                'questions_snippet': self._like_snippet(
+                    ' '.join(qa.get('question', '') for qa in row.generated_questions or [])
+                ),
+                'rank': 0.0,
+            }
+            for row in rows
+        ]
+
+    def _like_snippet(self, text):
+        # SNIPPET_TOKENS words from the first one that matches a term, marked
+        # like the snippets of the full-text backends.
+        pattern = re.compile('|'.join(re.escape(term) for term in self.terms), re.IGNORECASE)
+        words = text.split()
+        start = next((i for i, word in enumerate(words) if pattern.search(word)), 0)
+        snippet = ' '.join(
+            pattern.sub(lambda match: MATCH_START + match.group(0) + MATCH_END, word)
+            for word in words[start:start + SNIPPET_TOKENS]
+        )
+        if start > 0:
+            snippet = '…' + snippet
+        if start + SNIPPET_TOKENS < len(words):
+            snippet += '…'
+        return snippet_html(snippet)
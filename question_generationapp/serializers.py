@@ -1,5 +1,7 @@
 from rest_framework import serializers
 from .models import Account, UserProfile, GeneratedQuestions
+from .admission import admission_setting
+from .inference import get_model_tiers
 
 class AccountSerializer(serializers.ModelSerializer):
     class Meta:
@@ -49,9 +51,55 @@ class GeneratedQuestionsSerializer(serializers.ModelSerializer):
         fields = ['id', 'user', 'entered_text', 'generated_questions', 'created_at']
 
 
-class QuestionGenerationSerializer(serializers.Serializer):
-    text = serializers.CharField()
+class DocumentSerializer(serializers.Serializer):
+    text = serializers.CharField(max_length=admission_setting('MAX_TEXT_LENGTH'))
     use_evaluator = serializers.BooleanField(default=True)
-    num_questions = serializers.IntegerField(required=False, default=10)
+    num_questions = serializers.IntegerField(
+        required=False, default=10, min_value=1, max_value=admission_setting('MAX_NUM_QUESTIONS')
+    )
     answer_style = serializers.ChoiceField(choices=["all", "sentences", "multiple_choice"], default="all")
-     
\ No newline at end of file
+    # Only the prerank_factor * num_questions most promising candidate answers, by cheap
+    # lexical features, go through question generation and evaluation.
+    prerank_factor = serializers.IntegerField(required=False, default=None, allow_null=True, min_value=1)
+
+
+class QuestionGenerationSerializer(DocumentSerializer):
+    tier = serializers.ChoiceField(choices=list(get_model_tiers()), required=False)
+    latency_target_ms = serializers.IntegerField(required=False, min_value=1)
+
+
+class BatchQuestionGenerationSerializer(serializers.Serializer):
+    documents = DocumentSerializer(
+        many=True, allow_empty=False, max_length=admission_setting('MAX_BATCH_DOCUMENTS')
+    )
+    tier = serializers.ChoiceField(choices=list(get_model_tiers()), required=False)
+    latency_target_ms = serializers.IntegerField(required=False, min_value=1)
+
+
+class GenerationExportSerializer(serializers.Serializer):
+    # Query parameters of the export endpoints; user can be repeated.
+    user = serializers.ListField(child=serializers.IntegerField(min_value=1), required=False)
+    user_type = serializers.CharField(required=False)
+    start = serializers.DateTimeField(required=False)
+    end = serializers.DateTimeField(required=False)
+    gzip = serializers.BooleanField(default=False)
+
+    def validate(self, data):
+        if 'start' in data and 'end' in data and data['start'] > data['end']:
+            raise serializers.ValidationError("start must not be after end.")
+        return data
+
+
+class GenerationSearchSerializer(serializers.Serializer):
+    q = serializers.CharField(max_length=200)
+
+
+class SearchResultSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    user = serializers.IntegerField()
+    created_at = serializers.DateTimeField()
+    # HTML: the generation's text is escaped and matches are wrapped in <mark>
+    # tags, on every database backend (see search.py).
+    text_snippet = serializers.CharField()
+    questions_snippet = serializers.CharField(allow_null=True)
+    rank = serializers.FloatField()
@@ -1,8 +1,9 @@
 # question_generationapp/signals.py
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 from django.contrib.auth.models import User
-from .models import UserProfile
+from .conditional import invalidate_history, invalidate_profile
+from .models import GeneratedQuestions, UserProfile
 
 @receiver(post_save, sender=User)
 def create_user_profile(sender, instance, created, **kwargs):
@@ -12,3 +13,13 @@ def create_user_profile(sender, instance, created, **kwargs):
 @receiver(post_save, sender=User)
 def save_user_profile(sender, instance, **kwargs):
     instance.user_profile.save()
+
+# Drop cached responses and versions when their rows change. bulk_create and
+# QuerySet.update() send no signals, so their callers invalidate explicitly.
+@receiver([post_save, post_delete], sender=UserProfile)
+def invalidate_cached_profile(sender, instance, **kwargs):
+    invalidate_profile(instance.user_id)
+
+@receiver([post_save, post_delete], sender=GeneratedQuestions)
+def invalidate_cached_history(sender, instance, **kwargs):
+    invalidate_history(instance.user_id)
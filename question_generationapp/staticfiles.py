@@ -0,0 +1,203 @@
+# question_generationapp/staticfiles.py
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+from email.utils import formatdate
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified
+
+MANIFEST_NAME = 'staticfiles.json'
+# Precompressed siblings, in order of preference.
+ENCODINGS = [('br', '.br'), ('gzip', '.gz')]
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+REVALIDATE_CACHE_CONTROL = 'public, max-age=0, must-revalidate'
+HASHED_NAME_PATTERN = re.compile(r'\.[0-9a-f]{12}\.')
+COMPRESSIBLE_TYPES = ('application/javascript', 'application/json', 'image/svg+xml')
+# Compressible files without a .gz sibling are gzipped in memory at startup.
+MIN_COMPRESS_SIZE = 1024
+
+
+def load_manifest(root):
+    # The manifest was written on Windows, so its paths use backslashes.
+    path = os.path.join(root, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        paths = json.load(f).get('paths', {})
+    return {name.replace('\\', '/'): hashed.replace('\\', '/') for name, hashed in paths.items()}
+
+
+class Representation:
+    # One encoding of a static file, read from path or, if path is None, held in content.
+    def __init__(self, path, size, etag, encoding=None, content=None):
+        self.path = path
+        self.size = size
+        self.etag = etag
+        self.encoding = encoding
+        self.content = content
+
+
+class StaticFile:
+    def __init__(self, path, name, immutable):
+        with open(path, 'rb') as f:
+            data = f.read()
+        digest = hashlib.md5(data).hexdigest()
+        self.identity = Representation(path, len(data), '"{}"'.format(digest))
+        self.last_modified = formatdate(os.path.getmtime(path), usegmt=True)
+        self.content_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+        self.cache_control = IMMUTABLE_CACHE_CONTROL if immutable else REVALIDATE_CACHE_CONTROL
+
+        # Each representation needs its own ETag.
+        self.variants = {}
+        for encoding, suffix in ENCODINGS:
+            if os.path.exists(path + suffix):
+                self.variants[encoding] = Representation(
+                    path + suffix, os.path.getsize(path + suffix), '"{}-{}"'.format(digest, encoding), encoding
+                )
+        compressible = self.content_type.startswith('text/') or self.content_type in COMPRESSIBLE_TYPES
+        if 'gzip' not in self.variants and compressible and len(data) >= MIN_COMPRESS_SIZE:
+            content = gzip.compress(data, mtime=0)
+            if len(content) < len(data):
+                self.variants['gzip'] = Representation(
+                    None, len(content), '"{}-gzip"'.format(digest), 'gzip', content
+                )
+
+
+def build_index(root):
+    # Every servable file under root, keyed by its URL path relative to
+    # STATIC_URL. Fingerprinted names (the manifest's values) never change
+    # content, so they are cached for a year; original names are revalidated.
+    hashed_names = set(load_manifest(root).values())
+    compressed_suffixes = tuple(suffix for _, suffix in ENCODINGS)
+    index = {}
+    for directory, _, filenames in os.walk(root):
+        for filename in filenames:
+            if filename.endswith(compressed_suffixes) or filename == MANIFEST_NAME:
+                continue
+            path = os.path.join(directory, filename)
+            name = os.path.relpath(path, root).replace(os.sep, '/')
+            immutable = name in hashed_names or bool(HASHED_NAME_PATTERN.search(filename))
+            index[name] = StaticFile(path, name, immutable)
+    return index
+
+
+def accepted_encodings(header):
+    # Codings the client accepts, from an Accept-Encoding header; q=0 refuses one.
+    accepted = set()
+    refused = set()
+    for part in header.split(','):
+        coding, _, params = part.strip().partition(';')
+        coding = coding.strip().lower()
+        q = 1.0
+        for param in params.split(';'):
+            key, _, value = param.strip().partition('=')
+            if key == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        (accepted if q > 0 else refused).add(coding)
+    if '*' in accepted:
+        accepted.update(encoding for encoding, _ in ENCODINGS)
+    return accepted - refused
+
+
+def etag_matches(header, etag):
+    if header.strip() == '*':
+        return True
+    # If-None-Match uses weak comparison.
+    tags = [tag.strip() for tag in header.split(',')]
+    return etag in tags or 'W/' + etag in tags
+
+
+class PrecompressedStaticMiddleware:
+    """Serves STATIC_URL from QG_STATIC_ROOT inside the Django process. The directory is
+    indexed once at startup, so a request is answered from memory plus at most one open()
+    of the chosen file: the precompressed variant the client accepts, with an ETag and a
+    far-future Cache-Control for fingerprinted names. Put it right after
+    SecurityMiddleware so static requests skip sessions and authentication.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'QG_SERVE_STATIC', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.prefix = settings.STATIC_URL if settings.STATIC_URL.startswith('/') else '/' + settings.STATIC_URL
+        self.index = build_index(getattr(settings, 'QG_STATIC_ROOT', settings.STATIC_ROOT))
+
+    def __call__(self, request):
+        if request.method not in ('GET', 'HEAD') or not request.path_info.startswith(self.prefix):
+            return self.get_response(request)
+        static_file = self.index.get(request.path_info[len(self.prefix):])
+        if static_file is None:
+            return self.get_response(request)
+        return self.serve(request, static_file)
+
+    def serve(self, request, static_file):
+        representation = static_file.identity
+        accepted = accepted_encodings(request.headers.get('Accept-Encoding', ''))
+        for encoding, _ in ENCODINGS:
+            if encoding in static_file.variants and encoding in accepted:
+                representation = static_file.variants[encoding]
+                break
+
+        if etag_matches(request.headers.get('If-None-Match', ''), representation.etag):
+            response = HttpResponseNotModified()
+        else:
+            if request.method == 'HEAD':
+                response = HttpResponse(content_type=static_file.content_type)
+            elif representation.path is None:
+                response = HttpResponse(representation.content, content_type=static_file.content_type)
+            else:
+                response = FileResponse(open(representation.path, 'rb'), content_type=static_file.content_type)
+                # The file on disk may be the .gz sibling; browsers should not see its name.
+                del response['Content-Disposition']
+            response['Content-Length'] = str(representation.size)
+            if representation.encoding is not None:
+                response['Content-Encoding'] = representation.encoding
+
+        response['ETag'] = representation.etag
+        response['Last-Modified'] = static_file.last_modified
+        response['Cache-Control'] = static_file.cache_control
+        if static_file.variants:
+            response['Vary'] = 'Accept-Encoding'
+        return response
+
+
+class PrecompressedManifestStorage(ManifestStaticFilesStorage):
+    """Resolves {% static %} to the fingerprinted names in QG_STATIC_ROOT's manifest, which
+    PrecompressedStaticMiddleware serves with far-future caching. Names missing from the
+    manifest fall back to the original name.
+    """
+    manifest_strict = False
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('location', getattr(settings, 'QG_STATIC_ROOT', settings.STATIC_ROOT))
+        super().__init__(*args, **kwargs)
+
+    def stored_name(self, name):
+        try:
+            return super().stored_name(name)
+        except ValueError:
+            return name
+
+    def hashed_name(self, name, content=None, filename=None):
+        # Some vendored plugins reference source maps they do not ship; collectstatic
+        # leaves such references as they are instead of failing.
+        try:
+            return super().hashed_name(name, content, filename)
+        except ValueError:
+            if content is not None:
+                raise
+            return name
+
+    def load_manifest(self):
+        hashed_files, manifest_hash = super().load_manifest()
+        hashed_files = {name.replace('\\', '/'): hashed.replace('\\', '/') for name, hashed in hashed_files.items()}
+        return hashed_files, manifest_hash
@@ -0,0 +1,69 @@
+# question_generationapp/stub_generator.py
+import re
+import time
+
+from django.conf import settings
+
+from .admission import SENTENCE_PATTERN, combine_estimates, estimate_cost
+
+WORD_PATTERN = re.compile(r'[A-Za-z][\w-]+')
+
+
+class StubQuestionGenerator:
+    """Stands in for QuestionGenerator when QG_STUB_GENERATOR is on, so the API
+    can be load tested without model downloads or a GPU. Each call sleeps for
+    as long as the tier would take by its latency_ms_per_question and the
+    request's estimated cost, scaled by QG_STUB_LATENCY_SCALE, and returns
+    questions with the same shape as the real generator's. Sleeping releases
+    the GIL the way torch does, so the web stack, admission control and the
+    database are exercised as in production but model compute is not.
+    """
+
+    def __init__(self, latency_ms_per_question):
+        self.latency_ms_per_question = latency_ms_per_question
+
+    def generate(self, article, use_evaluator=True, num_questions=10, answer_style='all', prerank_factor=None):
+        self._wait(estimate_cost(article, answer_style, use_evaluator))
+        return self._questions(article, use_evaluator, num_questions, answer_style)
+
+    def generate_incremental(self, article, use_evaluator=True, num_questions=10, answer_style='all', prerank_factor=None):
+        return self.generate(article, use_evaluator, num_questions, answer_style, prerank_factor)
+
+    def generate_batch(self, documents, batch_size=16):
+        options = [
+            {'use_evaluator': True, 'num_questions': 10, 'answer_style': 'all', **document}
+            for document in documents
+        ]
+        self._wait(combine_estimates([
+            estimate_cost(o['text'], o['answer_style'], o['use_evaluator']) for o in options
+        ]))
+        return [
+            self._questions(o['text'], o['use_evaluator'], o['num_questions'], o['answer_style'])
+            for o in options
+        ]
+
+    def generate_pipelined(self, documents, batch_size=16, queue_size=4):
+        return self.generate_batch(documents, batch_size)
+
+    def _wait(self, estimate):
+        scale = getattr(settings, 'QG_STUB_LATENCY_SCALE', 1.0)
+        time.sleep(estimate.cost * self.latency_ms_per_question * scale / 1000)
+
+    def _questions(self, text, use_evaluator, num_questions, answer_style):
+        sentences = [s.strip() for s in SENTENCE_PATTERN.findall(text) if s.strip()]
+        words = list(dict.fromkeys(WORD_PATTERN.findall(text))) or ['answer']
+        qa_list = []
+        for i, sentence in enumerate(sentences):
+            if answer_style in ('sentences', 'all'):
+                qa_list.append({'question': f'What does the text say in sentence {i + 1}?', 'answer': sentence})
+            if answer_style in ('multiple_choice', 'all'):
+                options = [words[(i + j) % len(words)] for j in range(min(4, len(words)))]
+                qa_list.append({
+                    'question': f'Which term appears in sentence {i + 1}?',
+                    'answer': [{'answer': option, 'correct': j == 0} for j, option in enumerate(options)],
+                })
+        if not use_evaluator:
+            return qa_list
+        for i, qa in enumerate(qa_list):
+            qa['score'] = 1.0 / (i + 1)
+        return qa_list[:num_questions]
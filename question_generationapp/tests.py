@@ -1,3 +1,576 @@
-from django.test import TestCase
+import csv
+import gzip
+import io
+import json
+import os
+from datetime import timedelta
+from unittest import SkipTest
 
-# Create your tests here.
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.test import AsyncClient, SimpleTestCase, TestCase, override_settings
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+
+from qg_cache import ContentCache
+
+from . import inference
+from .admission import AdmissionController, AdmissionRejected, admission_controller, estimate_cost
+from .inference import generation_method, get_model_tiers
+from .models import Account, GeneratedQuestions
+from .search import SearchResults
+
+PASSAGE = (
+    "Marie Curie was born in Warsaw in 1867. She moved to Paris to study physics. "
+    "In 1903 she shared the Nobel Prize in Physics with Pierre Curie."
+)
+OTHER_PASSAGE = "Photosynthesis turns light into chemical energy. Plants store it as sugar."
+
+
+def admission_settings(**overrides):
+    return override_settings(QG_ADMISSION={**settings.QG_ADMISSION, **overrides})
+
+
+class QGInputEncodingTests(SimpleTestCase):
+    # The tokenizer of the question generation model; set QG_TEST_TOKENIZER to a local
+    # checkpoint to run these tests offline.
+    TOKENIZER = os.environ.get('QG_TEST_TOKENIZER', 't5-base')
+
+    @classmethod
+    def setUpClass(cls):
+        from qg_tokenization import TokenizationService, load_fast_tokenizer
+        from questiongenerator import QuestionGenerator
+
+        try:
+            cls.qg_tokenizer = load_fast_tokenizer(cls.TOKENIZER)
+        except OSError as e:
+            raise SkipTest(f"Tokenizer {cls.TOKENIZER} is not available: {e}")
+        super().setUpClass()
+
+        # Only the tokenization of the generator is needed, not its models.
+        cls.qg = QuestionGenerator.__new__(QuestionGenerator)
+        cls.qg.ANSWER_TOKEN = "<answer>"
+        cls.qg.CONTEXT_TOKEN = "<context>"
+        cls.qg.SEQ_LENGTH = 512
+        cls.qg.qg_tokenizer = cls.qg_tokenizer
+        cls.qg.qg_tokens = TokenizationService(cls.qg_tokenizer)
+
+    def assert_encoded_like_tokenizer(self, qg_input):
+        expected = self.qg_tokenizer(qg_input, truncation=True, max_length=512)['input_ids']
+        self.assertEqual(self.qg._encode_qg_input(qg_input)['input_ids'][0].tolist(), expected)
+
+    def test_encode_qg_input_matches_tokenizer(self):
+        context = "Marie Curie won the Nobel Prize in Physics in 1903. She was born in Warsaw."
+        for qg_input in [
+            f"<answer> Marie Curie won the Nobel Prize in Physics in 1903. <context> {context}",
+            f"<answer> Warsaw <context> {context}",
+            "a question generation input without answer or context tokens",
+        ]:
+            self.assert_encoded_like_tokenizer(qg_input)
+
+    def test_encode_qg_input_truncates_like_tokenizer(self):
+        context = " ".join(["The quick brown fox jumps over the lazy dog."] * 100)
+        self.assert_encoded_like_tokenizer(f"<answer> The lazy dog. <context> {context}")
+
+    def test_encoded_inputs_are_cached(self):
+        qg_input = "<answer> Warsaw <context> She was born in Warsaw."
+        first = self.qg._encode_qg_input(qg_input)['input_ids'][0].tolist()
+        hits = self.qg.qg_tokens.stats['hits']
+        self.assertEqual(self.qg._encode_qg_input(qg_input)['input_ids'][0].tolist(), first)
+        self.assertEqual(self.qg.qg_tokens.stats['hits'], hits + 1)
+
+
+class PrerankTests(SimpleTestCase):
+    def setUp(self):
+        from questiongenerator import QuestionGenerator
+
+        self.qg = QuestionGenerator.__new__(QuestionGenerator)
+        self.qg.ANSWER_TOKEN = "<answer>"
+        self.qg.CONTEXT_TOKEN = "<context>"
+
+    def test_ranks_salient_sentences_first(self):
+        text = (
+            "Marie Curie studied radioactivity in Paris. Radioactivity made Curie famous in Paris. "
+            "It rained."
+        )
+        answers = ["Marie Curie studied radioactivity in Paris.", "It rained."]
+        qg_inputs = [f"<answer> {answer} <context> {text}" for answer in answers]
+        scores = self.qg.get_prerank_scores(text, qg_inputs, answers)
+        self.assertGreater(scores[0], scores[1])
+
+    def test_empty_vocabulary_falls_back_to_lexical_features(self):
+        text = "a b c. d e f."
+        answers = ["a b c.", "d e f."]
+        qg_inputs = [f"<answer> {answer} <context> {text}" for answer in answers]
+        self.assertEqual(len(self.qg.get_prerank_scores(text, qg_inputs, answers)), 2)
+        kept, _ = self.qg._prerank_qg_inputs(text, qg_inputs, answers, 1)
+        self.assertEqual(len(kept), 1)
+
+
+class ModelTierTests(SimpleTestCase):
+    @override_settings(QG_MODEL_TIERS={'fast': {'qg_model': '/models/qg'}})
+    def test_settings_override_default_tiers(self):
+        tiers = get_model_tiers()
+        self.assertEqual(list(tiers), ['fast', 'standard', 'best'])
+        self.assertEqual(tiers['fast']['qg_model'], '/models/qg')
+        self.assertEqual(tiers['fast']['qa_eval_model'], 'bert-base-cased')
+
+    @override_settings(QG_MODEL_TIERS={'custom': {'qg_model': 't5-small', 'qa_eval_model': 'bert-base-cased'}})
+    def test_tier_without_latency_is_rejected(self):
+        with self.assertRaisesMessage(ImproperlyConfigured, "latency_ms_per_question"):
+            get_model_tiers()
+
+
+class AdmissionControllerTests(SimpleTestCase):
+    def setUp(self):
+        self.controller = AdmissionController()
+        self.cost = estimate_cost(PASSAGE).cost
+        self.degraded_cost = estimate_cost(PASSAGE, 'multiple_choice', use_evaluator=False).cost
+
+    def test_admits_and_releases(self):
+        admission = self.controller.admit(1, PASSAGE, 'all', True)
+        self.assertFalse(admission.degraded)
+        self.assertEqual((admission.answer_style, admission.use_evaluator), ('all', True))
+        self.assertGreater(self.controller.load, 0)
+        admission.release()
+        admission.release()
+        self.assertEqual(self.controller.load, 0)
+        self.assertEqual(self.controller._user_in_flight, {})
+
+    def test_rejects_requests_over_the_user_budget(self):
+        with admission_settings(USER_BUDGET=self.cost * 1.5):
+            admission = self.controller.admit(1, PASSAGE, 'all', True)
+            with self.assertRaises(AdmissionRejected) as rejected:
+                self.controller.admit(1, PASSAGE, 'all', True)
+            self.assertEqual(rejected.exception.status_code, 429)
+            self.assertGreaterEqual(rejected.exception.retry_after, 1)
+            # Other users have budgets of their own.
+            self.controller.admit(2, PASSAGE, 'all', True).release()
+            admission.release()
+            self.controller.admit(1, PASSAGE, 'all', True).release()
+
+    def test_degrades_requests_that_are_too_large(self):
+        with admission_settings(MAX_REQUEST_COST=(self.cost + self.degraded_cost) / 2):
+            admission = self.controller.admit(1, PASSAGE, 'all', True)
+        self.assertTrue(admission.degraded)
+        self.assertEqual((admission.answer_style, admission.use_evaluator), ('multiple_choice', False))
+        self.assertEqual(admission.estimate.cost, self.degraded_cost)
+
+    def test_rejects_requests_too_large_even_degraded(self):
+        with admission_settings(MAX_REQUEST_COST=self.degraded_cost / 2):
+            with self.assertRaises(AdmissionRejected) as rejected:
+                self.controller.admit(1, PASSAGE, 'all', True)
+        self.assertEqual(rejected.exception.status_code, 413)
+
+    def test_degrades_under_global_load(self):
+        with admission_settings(GLOBAL_BUDGET=self.cost * 2, DEGRADE_AT=0.75):
+            first = self.controller.admit(1, PASSAGE, 'all', True)
+            second = self.controller.admit(2, PASSAGE, 'all', True)
+        self.assertFalse(first.degraded)
+        self.assertTrue(second.degraded)
+        first.release()
+        second.release()
+        self.assertEqual(self.controller.load, 0)
+
+    def test_rejects_when_overloaded_after_the_queue_timeout(self):
+        with admission_settings(GLOBAL_BUDGET=self.cost, DEGRADE_AT=1.0, QUEUE_TIMEOUT=0):
+            admission = self.controller.admit(1, PASSAGE, 'all', True)
+            with self.assertRaises(AdmissionRejected) as rejected:
+                self.controller.admit(2, PASSAGE, 'all', True)
+            admission.release()
+        self.assertEqual(rejected.exception.status_code, 503)
+
+    def test_batches_are_admitted_as_a_whole(self):
+        documents = [(PASSAGE, 'all', True), (OTHER_PASSAGE, 'sentences', False)]
+        admission = self.controller.admit_batch(1, documents)
+        self.assertFalse(admission.degraded)
+        self.assertIsNone(admission.answer_style)
+        admission.release()
+        self.assertEqual(self.controller.load, 0)
+
+    def test_missing_setting_is_reported(self):
+        with override_settings(QG_ADMISSION={}):
+            with self.assertRaisesMessage(ImproperlyConfigured, 'QG_ADMISSION has no'):
+                self.controller.admit(1, PASSAGE, 'all', True)
+
+
+class APITestCase(TestCase):
+    def setUp(self):
+        caches[settings.QG_RESPONSE_CACHE].clear()
+        self.user = self.create_user('user')
+        self.other_user = self.create_user('other')
+        self.admin = self.create_user('admin')
+        self.admin.is_admin = True
+        self.admin.save()
+
+    def create_user(self, username):
+        return Account.objects.create_user(username, username, username, f'{username}@example.com', 'password')
+
+    def auth(self, user):
+        return {'HTTP_AUTHORIZATION': f'Bearer {RefreshToken.for_user(user).access_token}'}
+
+    def get(self, url, user, **extra):
+        return self.client.get(url, **self.auth(user), **extra)
+
+    def post(self, url, data, user):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(url, data, content_type='application/json', **self.auth(user))
+
+
+@override_settings(QG_STUB_GENERATOR=True, QG_STUB_LATENCY_SCALE=0, QG_INCREMENTAL=False)
+class GenerationEndpointTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        inference._generators.clear()
+        self.addCleanup(inference._generators.clear)
+
+    def generate(self, data, user=None):
+        return self.post('/api/generate-questions/', data, user or self.user)
+
+    def test_generates_and_saves_questions(self):
+        response = self.generate({'text': PASSAGE, 'num_questions': 3})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['questions']), 3)
+        self.assertFalse(response.json()['degraded'])
+        self.assertEqual(GeneratedQuestions.objects.filter(user=self.user).count(), 1)
+        self.assertEqual(admission_controller.load, 0)
+
+    def test_rejects_requests_over_the_user_budget(self):
+        held = admission_controller.admit(self.user.id, PASSAGE, 'all', True)
+        try:
+            with admission_settings(USER_BUDGET=held.estimate.cost * 1.5):
+                response = self.generate({'text': PASSAGE})
+        finally:
+            held.release()
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response)
+        self.assertFalse(GeneratedQuestions.objects.exists())
+        self.assertEqual(admission_controller.load, 0)
+
+    def test_degraded_requests_only_get_multiple_choice_questions(self):
+        cost = estimate_cost(PASSAGE).cost
+        degraded_cost = estimate_cost(PASSAGE, 'multiple_choice', use_evaluator=False).cost
+        with admission_settings(MAX_REQUEST_COST=(cost + degraded_cost) / 2):
+            response = self.generate({'text': PASSAGE, 'num_questions': 2})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()['degraded'])
+        questions = response.json()['questions']
+        self.assertTrue(questions)
+        self.assertLessEqual(len(questions), 2)
+        self.assertTrue(all(isinstance(qa['answer'], list) for qa in questions))
+        self.assertEqual(admission_controller.load, 0)
+
+    def test_batch_matches_single_requests(self):
+        documents = [
+            {'text': PASSAGE, 'num_questions': 2, 'answer_style': 'sentences'},
+            {'text': OTHER_PASSAGE, 'num_questions': 3},
+        ]
+        response = self.post('/api/generate-questions/batch/', {'documents': documents, 'tier': 'fast'}, self.user)
+        self.assertEqual(response.status_code, 200)
+        results = response.json()['results']
+        self.assertEqual(len(results), len(documents))
+
+        for document, result in zip(documents, results):
+            single = self.generate(dict(document, tier='fast'))
+            self.assertEqual(result['questions'], single.json()['questions'])
+        self.assertEqual(GeneratedQuestions.objects.filter(user=self.user).count(), 4)
+        self.assertEqual(admission_controller.load, 0)
+
+    def test_batch_too_large_is_rejected(self):
+        with admission_settings(MAX_BATCH_COST=0.01):
+            response = self.post('/api/generate-questions/batch/', {'documents': [{'text': PASSAGE}]}, self.user)
+        self.assertEqual(response.status_code, 413)
+        self.assertFalse(GeneratedQuestions.objects.exists())
+
+    def test_invalid_requests_are_rejected(self):
+        self.assertEqual(self.generate({'text': PASSAGE, 'num_questions': 0}).status_code, 400)
+        self.assertEqual(self.generate({'text': PASSAGE, 'tier': 'unknown'}).status_code, 400)
+        response = self.post('/api/generate-questions/batch/', {'documents': []}, self.user)
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(QG_STUB_GENERATOR=True, QG_STUB_LATENCY_SCALE=0, QG_INCREMENTAL=False)
+class AsyncGenerationEndpointTests(APITestCase):
+    url = '/api/generate-questions/async/'
+
+    def setUp(self):
+        super().setUp()
+        inference._generators.clear()
+        self.addCleanup(inference._generators.clear)
+
+    async def generate(self, data, token=None, client=None):
+        headers = {'Authorization': f'Bearer {token}'} if token is not None else {}
+        body = data if isinstance(data, str) else json.dumps(data)
+        return await (client or self.async_client).post(
+            self.url, body, content_type='application/json', headers=headers
+        )
+
+    def token(self):
+        return str(AccessToken.for_user(self.user))
+
+    async def test_generates_and_saves_questions(self):
+        response = await self.generate({'text': PASSAGE, 'num_questions': 2}, self.token())
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['questions']), 2)
+        self.assertEqual(await GeneratedQuestions.objects.filter(user=self.user).acount(), 1)
+        self.assertEqual(admission_controller.load, 0)
+
+    async def test_requires_credentials(self):
+        response = await self.generate({'text': PASSAGE})
+        self.assertEqual(response.status_code, 401)
+        self.assertIn('WWW-Authenticate', response)
+
+    async def test_invalid_and_expired_tokens_are_unauthorized(self):
+        expired = AccessToken.for_user(self.user)
+        expired.set_exp(lifetime=-timedelta(minutes=1))
+        for token in ['not-a-token', str(expired)]:
+            response = await self.generate({'text': PASSAGE}, token)
+            self.assertEqual(response.status_code, 401)
+            self.assertEqual(response['Content-Type'], 'application/json')
+            self.assertIn('detail', response.json())
+
+    async def test_malformed_json_is_a_bad_request(self):
+        response = await self.generate('{"text": ', self.token())
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('detail', response.json())
+
+    async def test_invalid_options_are_a_bad_request(self):
+        response = await self.generate({'text': PASSAGE, 'num_questions': 0}, self.token())
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('num_questions', response.json())
+
+    async def test_session_posts_need_a_csrf_token(self):
+        client = AsyncClient(enforce_csrf_checks=True)
+        await client.aforce_login(self.user)
+        response = await self.generate({'text': PASSAGE}, client=client)
+        self.assertEqual(response.status_code, 403)
+        self.assertIn('CSRF', response.json()['detail'])
+
+    async def test_rejects_requests_over_the_user_budget(self):
+        held = admission_controller.admit(self.user.id, PASSAGE, 'all', True)
+        try:
+            with admission_settings(USER_BUDGET=held.estimate.cost * 1.5):
+                response = await self.generate({'text': PASSAGE}, self.token())
+        finally:
+            held.release()
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response)
+        self.assertFalse(await GeneratedQuestions.objects.aexists())
+
+
+class HistoryTestCase(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.own = GeneratedQuestions.objects.create(
+            user=self.user, entered_text=PASSAGE, generated_questions=[
+                {'question': 'Where was Marie Curie born?', 'answer': 'Warsaw', 'score': 0.9},
+                {'question': 'Who shared the prize?', 'answer': [
+                    {'answer': 'Pierre Curie', 'correct': True}, {'answer': 'Warsaw', 'correct': False},
+                ]},
+            ]
+        )
+        self.others = GeneratedQuestions.objects.create(
+            user=self.other_user, entered_text=OTHER_PASSAGE,
+            generated_questions=[{'question': 'What do plants store?', 'answer': 'sugar'}]
+        )
+
+    def export(self, export_format, as_user=None, headers=None, **params):
+        response = self.get(
+            f'/api/generated-questions/export/{export_format}/', as_user or self.user, data=params, **(headers or {})
+        )
+        if response.status_code == 200:
+            response.body = b''.join(response.streaming_content)
+        return response
+
+    def search(self, q, as_user=None, **extra):
+        return self.get('/api/generated-questions/search/', as_user or self.user, data={'q': q}, **extra)
+
+
+class ExportTests(HistoryTestCase):
+    def test_ndjson(self):
+        response = self.export('ndjson')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        rows = [json.loads(line) for line in response.body.decode().splitlines()]
+        self.assertEqual([row['id'] for row in rows], [self.own.id])
+        self.assertEqual(rows[0]['generated_questions'], self.own.generated_questions)
+
+    def test_csv(self):
+        response = self.export('csv')
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        rows = list(csv.DictReader(io.StringIO(response.body.decode())))
+        self.assertEqual([row['question'] for row in rows], ['Where was Marie Curie born?', 'Who shared the prize?'])
+        self.assertEqual(rows[1]['answer'], 'Pierre Curie')
+        self.assertEqual(rows[1]['options'], 'Pierre Curie | Warsaw')
+
+    def test_gzip(self):
+        for export_format in ('ndjson', 'csv'):
+            plain = self.export(export_format).body
+            response = self.export(export_format, gzip='true')
+            self.assertEqual(response['Content-Type'], 'application/gzip')
+            self.assertIn(f'.{export_format}.gz', response['Content-Disposition'])
+            self.assertEqual(gzip.decompress(response.body), plain)
+
+    def test_admins_export_every_user_with_filters(self):
+        rows = self.export('ndjson', self.admin).body.decode().splitlines()
+        self.assertEqual(len(rows), 2)
+        rows = self.export('ndjson', self.admin, user=self.other_user.id).body.decode().splitlines()
+        self.assertEqual([json.loads(row)['id'] for row in rows], [self.others.id])
+
+    def test_invalid_exports(self):
+        self.assertEqual(self.export('xml').status_code, 404)
+        response = self.export('ndjson', start='2024-02-01T00:00:00Z', end='2024-01-01T00:00:00Z')
+        self.assertEqual(response.status_code, 400)
+
+
+class SearchTests(HistoryTestCase):
+    def test_finds_own_generations(self):
+        response = self.search('Warsaw')
+        self.assertEqual(response.status_code, 200)
+        results = response.json()['results']
+        self.assertEqual([result['id'] for result in results], [self.own.id])
+        self.assertIn('<mark>Warsaw</mark>', results[0]['text_snippet'])
+
+    def test_searches_questions(self):
+        self.assertEqual(self.search('prize').json()['count'], 1)
+
+    def test_other_users_generations_are_only_visible_to_admins(self):
+        self.assertEqual(self.search('plants').json()['count'], 0)
+        self.assertEqual(self.search('plants', self.other_user).json()['count'], 1)
+        self.assertEqual(self.search('plants', self.admin).json()['count'], 1)
+
+    def test_query_is_required(self):
+        self.assertEqual(self.get('/api/generated-questions/search/', self.user).status_code, 400)
+
+    def test_snippets_escape_stored_text(self):
+        GeneratedQuestions.objects.create(
+            user=self.user, entered_text='<img src=x onerror=alert(1)> Krakow & <b>Gdansk</b>',
+            generated_questions=[{'question': '<script>alert(1)</script> Is Krakow old?', 'answer': 'Yes'}]
+        )
+        result = self.search('Krakow').json()['results'][0]
+        self.assertEqual(
+            result['text_snippet'], '&lt;img src=x onerror=alert(1)&gt; <mark>Krakow</mark> &amp; &lt;b&gt;Gdansk&lt;/b&gt;'
+        )
+        self.assertNotIn('<script>', result['questions_snippet'])
+        self.assertIn('<mark>Krakow</mark>', result['questions_snippet'])
+
+    def test_fallback_snippets_have_the_same_format(self):
+        GeneratedQuestions.objects.create(
+            user=self.user, entered_text='<i>Old</i> ' * 20 + 'Krakow is old.', generated_questions=[]
+        )
+        result = SearchResults('krakow', user_id=self.user.id)._like_search(10, 0)[0]
+        self.assertEqual(result['text_snippet'], '…<mark>Krakow</mark> is old.')
+        self.assertEqual(result['questions_snippet'], '')
+        result = SearchResults('old', user_id=self.user.id)._like_search(10, 0)[0]
+        self.assertTrue(result['text_snippet'].startswith('&lt;i&gt;<mark>Old</mark>&lt;/i&gt;'))
+        self.assertTrue(result['text_snippet'].endswith('…'))
+
+
+class ConditionalResponseTests(HistoryTestCase):
+    def test_profile_not_modified_until_saved(self):
+        response = self.get('/api/user-detail/', self.user)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        self.assertEqual(self.get('/api/user-detail/', self.user, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(
+                '/api/user-detail/', {'city': 'Nairobi'}, content_type='application/json', **self.auth(self.user)
+            )
+        self.assertEqual(response.status_code, 200)
+        response = self.get('/api/user-detail/', self.user, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.json()['city'], 'Nairobi')
+
+    def test_history_not_modified_until_written(self):
+        response = self.search('Curie')
+        etag = response['ETag']
+        self.assertIn('no-cache', response['Cache-Control'])
+        self.assertEqual(self.search('Curie', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        export_etag = self.export('ndjson')['ETag']
+        not_modified = self.export('ndjson', headers={'HTTP_IF_NONE_MATCH': export_etag})
+        self.assertEqual(not_modified.status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            GeneratedQuestions.objects.create(user=self.user, entered_text='Curie died in 1934.', generated_questions=[])
+        response = self.search('Curie', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.json()['count'], 2)
+        response = self.export('ndjson', headers={'HTTP_IF_NONE_MATCH': export_etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.body.decode().splitlines()), 2)
+
+    def test_history_renderings_have_their_own_etags(self):
+        renderings = [
+            lambda headers: self.export('ndjson', headers=headers),
+            lambda headers: self.export('csv', headers=headers),
+            lambda headers: self.export('ndjson', headers=headers, gzip='true'),
+            lambda headers: self.export('ndjson', headers=headers, start='2020-01-01T00:00:00Z'),
+            lambda headers: self.search('Curie', **headers),
+            lambda headers: self.search('Warsaw', **headers),
+        ]
+        etags = [render({})['ETag'] for render in renderings]
+        self.assertEqual(len(set(etags)), len(etags))
+        for render, etag in zip(renderings, etags):
+            for other in etags:
+                status = render({'HTTP_IF_NONE_MATCH': other}).status_code
+                self.assertEqual(status, 304 if other == etag else 200)
+
+    def test_cached_search_responses_are_per_query(self):
+        self.assertEqual(self.search('Curie').json()['count'], 1)
+        self.assertEqual(self.search('plants').json()['count'], 0)
+        self.assertEqual(self.search('Curie').json()['count'], 1)
+
+    def test_other_users_writes_keep_history_current(self):
+        etag = self.search('Curie')['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            GeneratedQuestions.objects.create(user=self.other_user, entered_text='Curie.', generated_questions=[])
+        self.assertEqual(self.search('Curie', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        admin_etag = self.search('Curie', self.admin)['ETag']
+        self.assertNotEqual(admin_etag, etag)
+
+    def test_deletes_invalidate_history(self):
+        etag = self.search('Curie')['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.own.delete()
+        response = self.search('Curie', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['count'], 0)
+
+
+class ContentCacheTests(SimpleTestCase):
+    def test_stores_and_reuses_by_content(self):
+        cache = ContentCache()
+        self.assertEqual(cache.lookup('question', [['a', 'ctx'], ['b', 'ctx']]), [None, None])
+        cache.store('question', [['a', 'ctx']], ['What is a?'])
+        self.assertEqual(cache.lookup('question', [['a', 'ctx'], ['b', 'ctx']]), ['What is a?', None])
+        # Kinds do not share entries.
+        self.assertEqual(cache.lookup('score', [['a', 'ctx']]), [None])
+
+        stats = cache.get_stats()
+        self.assertEqual(stats['question']['reused'], 1)
+        self.assertEqual(stats['question']['computed'], 3)
+        self.assertEqual(stats['question']['reuse_rate'], 0.25)
+
+    def test_evicts_least_recently_used(self):
+        cache = ContentCache(max_entries=2)
+        cache.store('entities', ['one', 'two'], [1, 2])
+        cache.lookup('entities', ['one'])
+        cache.store('entities', ['three'], [3])
+        self.assertEqual(cache.lookup('entities', ['one', 'two', 'three']), [1, None, 3])
+
+    def test_generation_method_follows_setting(self):
+        class Generator:
+            def generate(self):
+                pass
+
+            def generate_incremental(self):
+                pass
+
+        generator = Generator()
+        with override_settings(QG_INCREMENTAL=True):
+            self.assertEqual(generation_method(generator), generator.generate_incremental)
+        with override_settings(QG_INCREMENTAL=False):
+            self.assertEqual(generation_method(generator), generator.generate)
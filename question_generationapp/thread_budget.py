@@ -0,0 +1,169 @@
+# question_generationapp/thread_budget.py
+import hashlib
+import os
+import tempfile
+import threading
+
+from django.conf import settings
+
+try:
+    import fcntl
+except ImportError:  # Windows: no slot locks, so no pinning or remainder cores
+    fcntl = None
+
+DEFAULT_THREAD_BUDGET = {
+    # Cores shared by every inference process on the node; None uses every
+    # core this process may run on.
+    'CORES': None,
+    # Processes on the node that run models: web workers, times the executor's
+    # workers when QG_EXECUTOR is "process".
+    'PROCESSES': 1,
+    'INTEROP_THREADS': 1,
+    # Pin each process to its own cores (Linux only).
+    'PIN': False,
+    # Where processes claim their slot; None uses the system temp directory.
+    'SLOT_DIR': None,
+}
+# Read by OpenMP, MKL and the BLAS libraries when they create their pools; set
+# too so libraries loaded later and child processes inherit the budget.
+THREAD_ENV_VARS = (
+    'OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'NUMEXPR_NUM_THREADS', 'VECLIB_MAXIMUM_THREADS'
+)
+SLOT_FILE = '{}-cpu-slot-{}.lock'
+
+_budget = None
+_budget_lock = threading.Lock()
+_slot_file = None
+# threadpoolctl restores the old limits when its limiter is garbage collected.
+_threadpool_limiter = None
+
+
+def thread_budget_setting(name):
+    return getattr(settings, 'QG_THREAD_BUDGET', {}).get(name, DEFAULT_THREAD_BUDGET[name])
+
+
+def available_cores():
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+class ThreadBudget:
+    """One process's share of a node's cores. The cores are split evenly between
+    processes, the first slots taking one extra core each when they do not
+    divide, and a process's share is split again between the inference calls
+    it runs concurrently, so that every thread pool together stays within the
+    budget instead of each sizing itself to the whole machine.
+    """
+
+    def __init__(self, cores, processes=1, concurrency=1, interop_threads=1, slot=None):
+        self.cores = list(cores)
+        self.processes = max(processes, 1)
+        self.concurrency = max(concurrency, 1)
+        self.interop_threads = max(interop_threads, 1)
+        self.slot = slot
+
+    @property
+    def process_cores(self):
+        slot = self.slot or 0
+        if len(self.cores) < self.processes:
+            return [self.cores[slot % len(self.cores)]]
+        base, extra = divmod(len(self.cores), self.processes)
+        # Without a claimed slot a process cannot know whether it is owed an
+        # extra core, so it assumes not.
+        count = base + (1 if self.slot is not None and slot < extra else 0)
+        start = slot * base + min(slot, extra)
+        return self.cores[start:start + count]
+
+    @property
+    def intra_op_threads(self):
+        return max(1, len(self.process_cores) // self.concurrency)
+
+    def apply(self, pin=False):
+        global _threadpool_limiter
+        import torch
+        from threadpoolctl import threadpool_limits
+
+        threads = self.intra_op_threads
+        for name in THREAD_ENV_VARS:
+            os.environ[name] = str(threads)
+        torch.set_num_threads(threads)
+        try:
+            torch.set_num_interop_threads(self.interop_threads)
+        except RuntimeError:
+            # Only allowed before the first inter-op parallel work in the process.
+            pass
+        _threadpool_limiter = threadpool_limits(limits=threads)
+        # Without a slot, every process of a multi-process budget would pin
+        # itself to the first slot's cores, so only a sole process pins then.
+        owns_cores = self.slot is not None or self.processes == 1
+        if pin and owns_cores and hasattr(os, 'sched_setaffinity'):
+            os.sched_setaffinity(0, self.process_cores)
+        return self
+
+    def as_dict(self):
+        return {
+            'slot': self.slot,
+            'processes': self.processes,
+            'process_cores': self.process_cores,
+            'concurrency': self.concurrency,
+            'intra_op_threads': self.intra_op_threads,
+            'interop_threads': self.interop_threads,
+        }
+
+
+def slot_file_prefix():
+    # Slot locks are only shared by the processes of one deployment: named
+    # after the user and the project directory, so that other projects (or
+    # other users' checkouts) using the same temp directory count their own.
+    project = hashlib.blake2b(str(settings.BASE_DIR).encode('utf-8'), digest_size=4).hexdigest()
+    return f'qg-{os.getuid()}-{project}'
+
+
+def claim_slot(processes, slot_dir=None):
+    # Each process takes the first slot whose lock file no live process holds;
+    # the lock goes away with the process, so a restarted worker reuses its slot.
+    global _slot_file
+    if fcntl is None or processes <= 1:
+        return None
+    slot_dir = slot_dir or tempfile.gettempdir()
+    prefix = slot_file_prefix()
+    for slot in range(processes):
+        slot_file = open(os.path.join(slot_dir, SLOT_FILE.format(prefix, slot)), 'a')
+        try:
+            fcntl.flock(slot_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            slot_file.close()
+            continue
+        _slot_file = slot_file
+        return slot
+    return None
+
+
+def configure_thread_budget(concurrency=None):
+    """Applies this process's share of QG_THREAD_BUDGET once, before its first
+    model is loaded. concurrency is the number of inference calls the process
+    runs at once; by default the executor's threads, or one per worker process,
+    doubled when QG_PIPELINED overlaps generation and evaluation.
+    """
+    global _budget
+    if _budget is None:
+        with _budget_lock:
+            if _budget is None:
+                if concurrency is None:
+                    concurrency = 1
+                    if getattr(settings, 'QG_EXECUTOR', 'thread') == 'thread':
+                        concurrency = getattr(settings, 'QG_EXECUTOR_WORKERS', 1)
+                    if getattr(settings, 'QG_PIPELINED', False):
+                        # The pipeline's generation and evaluation stages overlap.
+                        concurrency *= 2
+                processes = thread_budget_setting('PROCESSES')
+                cores = thread_budget_setting('CORES')
+                _budget = ThreadBudget(
+                    available_cores()[:cores] if cores else available_cores(),
+                    processes=processes,
+                    concurrency=concurrency,
+                    interop_threads=thread_budget_setting('INTEROP_THREADS'),
+                    slot=claim_slot(processes, thread_budget_setting('SLOT_DIR')),
+                ).apply(pin=thread_budget_setting('PIN'))
+    return _budget
@@ -1,10 +1,14 @@
 from django.urls import path
-from .views import RegisterView, LoginView, UserDetailView, QuestionGenerationView
+from .views import RegisterView, LoginView, UserDetailView, QuestionGenerationView, AsyncQuestionGenerationView, BatchQuestionGenerationView, GenerationExportView, GenerationSearchView
 
 urlpatterns = [
     path('api/register/', RegisterView.as_view(), name='register'),
     path('api/login/', LoginView.as_view(), name='login'),
     path('api/user-detail/', UserDetailView.as_view(), name='user-detail'),
     path('api/generate-questions/', QuestionGenerationView.as_view(), name='generate-questions'),
+    path('api/generate-questions/batch/', BatchQuestionGenerationView.as_view(), name='generate-questions-batch'),
+    path('api/generate-questions/async/', AsyncQuestionGenerationView.as_view(), name='generate-questions-async'),
+    path('api/generated-questions/search/', GenerationSearchView.as_view(), name='generated-questions-search'),
+    path('api/generated-questions/export/<str:export_format>/', GenerationExportView.as_view(), name='generated-questions-export'),
 ]
 
@@ -1,17 +1,55 @@
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import Http404, JsonResponse, StreamingHttpResponse
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
 from rest_framework import generics, status
+from rest_framework.exceptions import APIException, NotAuthenticated
+from rest_framework.request import Request
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.views import APIView
 from django.contrib.auth import authenticate, get_user_model
 from rest_framework.authtoken.models import Token
-from .serializers import RegisterSerializer, LoginSerializer, UserDetailSerializer, QuestionGenerationSerializer, GeneratedQuestionsSerializer
+from .serializers import RegisterSerializer, LoginSerializer, UserDetailSerializer, QuestionGenerationSerializer, GeneratedQuestionsSerializer, BatchQuestionGenerationSerializer, GenerationExportSerializer, GenerationSearchSerializer, SearchResultSerializer
 from .models import Account, GeneratedQuestions
-from questiongenerator import QuestionGenerator
+from .admission import AdmissionRejected, admission_controller
+from .export import buffered, csv_lines, export_rows, gzipped, ndjson_lines
+from .search import SearchResults
+from .conditional import cached_history_response, conditional_response, history_variant, history_version, invalidate_history, profile_entry
+from .inference import generation_method, get_executor, get_question_generator, run_generation, select_tier
 from rest_framework.generics import RetrieveUpdateAPIView
+from rest_framework.pagination import PageNumberPagination
 from rest_framework_simplejwt.tokens import RefreshToken
 
 User = get_user_model()
 
+
+def _retry_after_headers(rejection):
+    if rejection.retry_after is None:
+        return {}
+    return {'Retry-After': str(rejection.retry_after)}
+
+
+def _api_exception_response(request, exc):
+    # What DRF's exception handler answers for an APIView, for views that
+    # build their own Request: the error as JSON and, for a 401, the first
+    # authenticator's WWW-Authenticate challenge.
+    data = exc.detail if isinstance(exc.detail, (dict, list)) else {'detail': exc.detail}
+    response = JsonResponse(data, status=exc.status_code, safe=False)
+    if isinstance(exc, NotAuthenticated) or exc.status_code == status.HTTP_401_UNAUTHORIZED:
+        challenge = request.authenticators[0].authenticate_header(request) if request.authenticators else None
+        if challenge:
+            response['WWW-Authenticate'] = challenge
+    if getattr(exc, 'wait', None):
+        response['Retry-After'] = '%d' % exc.wait
+    return response
+
+
 class RegisterView(generics.CreateAPIView):
     queryset = Account.objects.all()
     permission_classes = (AllowAny,)
@@ -51,6 +89,12 @@ class UserDetailView(RetrieveUpdateAPIView):
 
     def get_object(self):
         return self.request.user.user_profile  # Get the related UserProfile object
+
+    def retrieve(self, request, *args, **kwargs):
+        # Polled by the frontend: served from the per-user cache, or as a 304
+        # when the client already has the current version.
+        entry = profile_entry(request.user, lambda profile: self.get_serializer(profile).data)
+        return conditional_response(request, entry, lambda: Response(entry['data']))
     
     
 class QuestionGenerationView(APIView):
@@ -64,13 +108,33 @@ class QuestionGenerationView(APIView):
             num_questions = serializer.validated_data.get('num_questions', 10)
             answer_style = serializer.validated_data['answer_style']
 
-            question_generator = QuestionGenerator()
-            qa_list = question_generator.generate(
-                article=text,
-                num_questions=num_questions,
-                answer_style=answer_style,
-                use_evaluator=use_evaluator
+            try:
+                admission = admission_controller.admit(request.user.id, text, answer_style, use_evaluator)
+            except AdmissionRejected as rejection:
+                return Response(
+                    {"error": rejection.detail},
+                    status=rejection.status_code,
+                    headers=_retry_after_headers(rejection)
+                )
+
+            tier = select_tier(
+                admission.estimate,
+                serializer.validated_data.get('tier'),
+                serializer.validated_data.get('latency_target_ms')
             )
+            try:
+                question_generator = get_question_generator(tier)
+                qa_list = generation_method(question_generator)(
+                    article=text,
+                    num_questions=num_questions,
+                    answer_style=admission.answer_style,
+                    use_evaluator=admission.use_evaluator,
+                    prerank_factor=serializer.validated_data['prerank_factor']
+                )
+            finally:
+                admission.release()
+            if admission.degraded:
+                qa_list = qa_list[:num_questions]
 
             questions = qa_list
 
@@ -85,5 +149,239 @@ class QuestionGenerationView(APIView):
 
             return Response({
                 'questions': questions,
+                'degraded': admission.degraded,
+                'tier': tier,
             }, status=status.HTTP_200_OK)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
+class BatchQuestionGenerationView(APIView):
+    # Generates questions for a list of passages with one combined pipeline:
+    # NER over all passages at once, then T5 and evaluator batches that mix
+    # passages. Results come back in the order of the submitted documents.
+    # With QG_PIPELINED the stages run concurrently, joined by bounded queues.
+    permission_classes = (IsAuthenticated,)
+
+    def post(self, request, *args, **kwargs):
+        serializer = BatchQuestionGenerationSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        documents = [dict(document) for document in serializer.validated_data['documents']]
+        try:
+            admission = admission_controller.admit_batch(
+                request.user.id,
+                [(d['text'], d['answer_style'], d['use_evaluator']) for d in documents]
+            )
+        except AdmissionRejected as rejection:
+            return Response(
+                {"error": rejection.detail},
+                status=rejection.status_code,
+                headers=_retry_after_headers(rejection)
+            )
+
+        if admission.degraded:
+            for document in documents:
+                document['answer_style'] = admission.answer_style
+                document['use_evaluator'] = admission.use_evaluator
+
+        tier = select_tier(
+            admission.estimate,
+            serializer.validated_data.get('tier'),
+            serializer.validated_data.get('latency_target_ms')
+        )
+        try:
+            question_generator = get_question_generator(tier)
+            if getattr(settings, 'QG_PIPELINED', False):
+                qa_lists = question_generator.generate_pipelined(
+                    documents,
+                    batch_size=getattr(settings, 'QG_BATCH_SIZE', 16),
+                    queue_size=getattr(settings, 'QG_PIPELINE_QUEUE_SIZE', 4)
+                )
+            else:
+                qa_lists = question_generator.generate_batch(
+                    documents, batch_size=getattr(settings, 'QG_BATCH_SIZE', 16)
+                )
+        finally:
+            admission.release()
+        if admission.degraded:
+            qa_lists = [
+                qa_list[:document['num_questions']] for qa_list, document in zip(qa_lists, documents)
+            ]
+
+        GeneratedQuestions.objects.bulk_create([
+            GeneratedQuestions(
+                user=request.user,
+                entered_text=document['text'],
+                generated_questions=qa_list
+            )
+            for document, qa_list in zip(documents, qa_lists)
+        ])
+        invalidate_history(request.user.id)
+
+        return Response({
+            'results': [{'questions': qa_list} for qa_list in qa_lists],
+            'degraded': admission.degraded,
+            'tier': tier,
+        }, status=status.HTTP_200_OK)
+
+
+class GenerationExportView(APIView):
+    # Streams generation history as NDJSON (one generation per line) or CSV
+    # (one question per line). Rows are read in chunks and written as they
+    # are read, so memory stays flat however many rows match. Admins can
+    # export anyone's history; other users only get their own. A client that
+    # already has the current version of the same export (format and filters)
+    # gets a 304.
+    permission_classes = (IsAuthenticated,)
+    formats = {
+        'ndjson': (ndjson_lines, 'application/x-ndjson'),
+        'csv': (csv_lines, 'text/csv'),
+    }
+
+    def get(self, request, export_format, *args, **kwargs):
+        if export_format not in self.formats:
+            raise Http404
+        serializer = GenerationExportSerializer(data=request.query_params)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        filters = serializer.validated_data
+
+        user_id = None if (request.user.is_admin or request.user.is_staff) else request.user.id
+        version = history_variant(history_version(user_id), 'export', export_format, filters)
+        return conditional_response(request, version, lambda: self.export(export_format, filters, user_id))
+
+    def export(self, export_format, filters, user_id):
+        queryset = GeneratedQuestions.objects.all()
+        if user_id is not None:
+            queryset = queryset.filter(user_id=user_id)
+        if filters.get('user'):
+            queryset = queryset.filter(user__in=filters['user'])
+        if 'user_type' in filters:
+            queryset = queryset.filter(user__user_type=filters['user_type'])
+        if 'start' in filters:
+            queryset = queryset.filter(created_at__gte=filters['start'])
+        if 'end' in filters:
+            queryset = queryset.filter(created_at__lte=filters['end'])
+
+        lines, content_type = self.formats[export_format]
+        chunks = buffered(lines(export_rows(queryset)))
+        filename = f'generated-questions.{export_format}'
+        if filters['gzip']:
+            chunks = gzipped(chunks)
+            content_type = 'application/gzip'
+            filename += '.gz'
+
+        response = StreamingHttpResponse(chunks, content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
+
+class SearchPagination(PageNumberPagination):
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+
+class GenerationSearchView(APIView):
+    # Ranked keyword search over earlier generations' passages and questions,
+    # backed by the full-text index from migration 0002. Admins search every
+    # user's generations; other users only their own.
+    permission_classes = (IsAuthenticated,)
+
+    def get(self, request, *args, **kwargs):
+        serializer = GenerationSearchSerializer(data=request.query_params)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        user_id = None if (request.user.is_admin or request.user.is_staff) else request.user.id
+        # The query, page and page size all change the response.
+        version = history_variant(history_version(user_id), 'search', sorted(request.query_params.lists()))
+
+        def search():
+            results = SearchResults(serializer.validated_data['q'], user_id=user_id)
+            paginator = SearchPagination()
+            page = paginator.paginate_queryset(results, request, view=self)
+            return paginator.get_paginated_response(SearchResultSerializer(page, many=True).data).data
+
+        return conditional_response(
+            request, version,
+            lambda: Response(cached_history_response(request, 'search', user_id, version, search))
+        )
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class AsyncQuestionGenerationView(View):
+    # Async counterpart of QuestionGenerationView for ASGI deployments. Model
+    # work is awaited on the bounded inference executor and the DB write runs
+    # through the async ORM, so the event loop stays free for cheap requests.
+    http_method_names = ['post', 'options']
+
+    async def post(self, request, *args, **kwargs):
+        drf_request = Request(
+            request,
+            parsers=[parser() for parser in api_settings.DEFAULT_PARSER_CLASSES],
+            authenticators=[auth() for auth in api_settings.DEFAULT_AUTHENTICATION_CLASSES],
+        )
+        # Invalid or expired tokens, CSRF failures and unparsable bodies raise
+        # here, and are answered as DRF would answer them for an APIView.
+        try:
+            # Authenticators hit the DB (tokens, sessions), so resolve the user off the loop.
+            user = await sync_to_async(lambda: drf_request.user)()
+            if not user or not user.is_authenticated:
+                raise NotAuthenticated()
+            data = drf_request.data
+        except APIException as exc:
+            return _api_exception_response(drf_request, exc)
+
+        serializer = QuestionGenerationSerializer(data=data)
+        if not serializer.is_valid():
+            return JsonResponse(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        text = serializer.validated_data['text']
+        num_questions = serializer.validated_data.get('num_questions', 10)
+        try:
+            # Admission may wait in the queue for budget, so keep it off the loop.
+            admission = await sync_to_async(admission_controller.admit, thread_sensitive=False)(
+                user.id, text, serializer.validated_data['answer_style'],
+                serializer.validated_data['use_evaluator']
+            )
+        except AdmissionRejected as rejection:
+            response = JsonResponse({"error": rejection.detail}, status=rejection.status_code)
+            for header, value in _retry_after_headers(rejection).items():
+                response[header] = value
+            return response
+
+        tier = select_tier(
+            admission.estimate,
+            serializer.validated_data.get('tier'),
+            serializer.validated_data.get('latency_target_ms')
+        )
+        loop = asyncio.get_running_loop()
+        try:
+            qa_list = await loop.run_in_executor(
+                get_executor(),
+                run_generation,
+                tier,
+                text,
+                num_questions,
+                admission.answer_style,
+                admission.use_evaluator,
+                serializer.validated_data['prerank_factor'],
+            )
+        finally:
+            admission.release()
+        if admission.degraded:
+            qa_list = qa_list[:num_questions]
+
+        await GeneratedQuestions.objects.acreate(
+            user=user,
+            entered_text=text,
+            generated_questions=qa_list
+        )
+
+        return JsonResponse({
+            'questions': qa_list,
+            'degraded': admission.degraded,
+            'tier': tier,
+        }, status=status.HTTP_200_OK)
@@ -3,9 +3,38 @@ import json
 import numpy as np
 import random
 import re
+import threading
 import torch
-from transformers import T5Tokenizer, T5ForConditionalGeneration, BertTokenizer, BertForSequenceClassification
-from typing import Any, List, Mapping, Tuple
+from sklearn.feature_extraction.text import TfidfVectorizer
+from transformers import AutoConfig, BatchEncoding, T5ForConditionalGeneration, BertForSequenceClassification
+from typing import Any, List, Mapping, Optional, Tuple
+
+from qg_cache import CachedDoc, CachedEntity, ContentCache
+from qg_cascade import LexicalQAScorer, QACascade
+from qg_pipeline import GenerationPipeline
+from qg_static import StaticT5Generator, supports_static_generation
+from qg_tokenization import TokenizationService, load_fast_tokenizer
+
+# Named model tiers, from cheapest to most accurate. Model entries can be hub names or paths
+# to local checkpoints, e.g. the outputs of training/qg_train.py and training/qa_eval_train.py.
+# latency_ms_per_question is a rough CPU estimate used for routing requests to a tier.
+MODEL_TIERS = {
+    "fast": {
+        "qg_model": "t5-small",
+        "qa_eval_model": "bert-base-cased",
+        "latency_ms_per_question": 60,
+    },
+    "standard": {
+        "qg_model": "t5-base",
+        "qa_eval_model": "bert-base-cased",
+        "latency_ms_per_question": 150,
+    },
+    "best": {
+        "qg_model": "t5-large",
+        "qa_eval_model": "bert-large-cased",
+        "latency_ms_per_question": 450,
+    },
+}
 
 class QuestionGenerator:
     """A transformer-based NLP system for generating reading comprehension-style questions from texts.
@@ -16,34 +45,106 @@ class QuestionGenerator:
     by setting use_evaluator=False.
     """
 
-    def __init__(self) -> None:
-        QG_PRETRAINED = "t5-large"
+    def __init__(
+        self,
+        qg_model: str = "t5-large",
+        qa_eval_model: str = "bert-large-cased",
+        draft_model: Optional[str] = None,
+        num_assistant_tokens: int = 5,
+        screen_eval_model: Optional[str] = None,
+        cascade: Optional[Mapping[str, float]] = None,
+        content_cache_size: int = 100000,
+        static_generation: Optional[Mapping[str, Any]] = None
+    ) -> None:
         self.ANSWER_TOKEN = "<answer>"
         self.CONTEXT_TOKEN = "<context>"
         self.SEQ_LENGTH = 512
 
         self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-        self.qg_tokenizer = T5Tokenizer.from_pretrained(QG_PRETRAINED, use_fast=False)
-        self.qg_model = T5ForConditionalGeneration.from_pretrained(QG_PRETRAINED)
+        self.qg_tokenizer = load_fast_tokenizer(qg_model)
+        self.qg_tokens = TokenizationService(self.qg_tokenizer)
+        self.qg_model = T5ForConditionalGeneration.from_pretrained(qg_model)
         self.qg_model.to(self.device)
         self.qg_model.eval()
 
-        self.qa_evaluator = QAEvaluator()
+        self.qg_draft_model = None
+        self._assisted_decoding_lock = threading.Lock()
+        self._reset_assisted_decoding_stats()
+        if draft_model is not None:
+            self._load_draft_model(draft_model, num_assistant_tokens)
+
+        # static_generation holds the arguments of a StaticT5Generator (buckets, cache_dir) that
+        # replaces qg_model.generate for one question at a time. Every bucket is compiled here,
+        # which takes minutes, so servers should build such generators before taking requests
+        # (see QG_PRELOAD_TIERS). Models whose generation config is not plain greedy decoding, and
+        # assisted decoding, keep the eager path.
+        self.qg_static = None
+        if static_generation is not None and self.qg_draft_model is None and supports_static_generation(self.qg_model):
+            self.qg_static = StaticT5Generator(self.qg_model, max_length=64, **static_generation)
+            if self.qg_static.buckets[-1] < self.SEQ_LENGTH:
+                raise ValueError(
+                    "The largest static generation bucket {} cannot hold inputs of {} tokens".format(
+                        self.qg_static.buckets[-1], self.SEQ_LENGTH
+                    )
+                )
+            print("Compiling question generation for input lengths {}...\n".format(self.qg_static.buckets))
+            self.qg_static.warm_up()
+
+        self.qa_evaluator = QAEvaluator(qa_eval_model)
+        # With a screen_eval_model, QA pairs are ranked by a QACascade: the screening evaluator
+        # scores every pair and qa_evaluator only rescores those near the top-k cut-off. cascade
+        # holds the QACascade's thresholds and score calibration.
+        self.qa_cascade = None
+        if screen_eval_model is not None:
+            self.qa_cascade = QACascade(load_screen_evaluator(screen_eval_model), self.qa_evaluator, **(cascade or {}))
+        self._spacy_nlp = None
+        self.pipeline_stats = {}
+        self.content_cache = ContentCache(content_cache_size)
+
+    @classmethod
+    def from_tier(
+        cls, tier: str, tiers: Optional[Mapping[str, Mapping[str, Any]]] = None
+    ) -> "QuestionGenerator":
+        """Builds a QuestionGenerator from a named entry of MODEL_TIERS, or of tiers if given."""
+        tiers = MODEL_TIERS if tiers is None else tiers
+        if tier not in tiers:
+            raise ValueError(
+                "Invalid model tier {}. Please choose from {}".format(tier, list(tiers))
+            )
+
+        config = tiers[tier]
+        return cls(
+            qg_model=config["qg_model"],
+            qa_eval_model=config["qa_eval_model"],
+            draft_model=config.get("draft_model"),
+            num_assistant_tokens=config.get("num_assistant_tokens", 5),
+            screen_eval_model=config.get("screen_eval_model"),
+            cascade=config.get("cascade"),
+            content_cache_size=config.get("content_cache_size", 100000),
+            static_generation=config.get("static_generation"),
+        )
 
     def generate(
         self,
         article: str,
         use_evaluator: bool = True,
         num_questions: int = 10,
-        answer_style: str = "all"
+        answer_style: str = "all",
+        prerank_factor: Optional[int] = None
     ) -> List:
         """Takes an article and generates a set of question and answer pairs. If use_evaluator
         is True, then QA pairs will be ranked and filtered based on their quality. answer_style
-        should be selected from ["all", "sentences", "multiple_choice"].
+        should be selected from ["all", "sentences", "multiple_choice"]. If prerank_factor is set,
+        only the prerank_factor * num_questions most promising candidate answers (by cheap lexical
+        features) are passed on to question generation.
         """
         print("Generating questions...\n")
 
         qg_inputs, qg_answers = self.generate_qg_inputs(article, answer_style)
+        if prerank_factor is not None:
+            qg_inputs, qg_answers = self._prerank_qg_inputs(
+                article, qg_inputs, qg_answers, prerank_factor * num_questions
+            )
         generated_questions = self.generate_questions_from_inputs(qg_inputs)
 
         message = "{} questions don't match {} answers".format(
@@ -51,7 +152,10 @@ class QuestionGenerator:
         )
         assert len(generated_questions) == len(qg_answers), message
 
-        if use_evaluator:
+        if use_evaluator and self.qa_cascade is not None:
+            print("Evaluating QA pairs (cascade)...\n")
+            qa_list = self._get_cascade_ranked_qa_pairs(generated_questions, qg_answers, num_questions)
+        elif use_evaluator:
             print("Evaluating QA pairs...\n")
             encoded_qa_pairs = self.qa_evaluator.encode_qa_pairs(
                 generated_questions, qg_answers
@@ -67,13 +171,226 @@ class QuestionGenerator:
 
         return qa_list
 
-    def generate_qg_inputs(self, text: str, answer_style: str) -> Tuple[List[str], List[str]]:
+    def generate_batch(self, documents: List[Mapping[str, Any]], batch_size: int = 16) -> List[List]:
+        """Generates questions for several documents with one combined pipeline. Each document is a
+        mapping with a "text" and optionally the use_evaluator, num_questions, answer_style and
+        prerank_factor arguments of generate. Named entities are extracted from all documents in a
+        single pass, and questions are generated and evaluated in batches that mix documents.
+        Returns the QA list of each document, in the order of documents.
+        """
+        print("Generating questions for {} documents...\n".format(len(documents)))
+
+        options = [
+            {"use_evaluator": True, "num_questions": 10, "answer_style": "all", "prerank_factor": None, **document}
+            for document in documents
+        ]
+        entity_docs = self._extract_entities([
+            self._split_text(o["text"]) if o["answer_style"] in ["multiple_choice", "all"] else []
+            for o in options
+        ])
+
+        qg_inputs, qg_answers, owners = [], [], []
+        for i, (o, docs) in enumerate(zip(options, entity_docs)):
+            inputs, answers = self.generate_qg_inputs(o["text"], o["answer_style"], docs)
+            if o["prerank_factor"] is not None:
+                inputs, answers = self._prerank_qg_inputs(
+                    o["text"], inputs, answers, o["prerank_factor"] * o["num_questions"]
+                )
+            qg_inputs.extend(inputs)
+            qg_answers.extend(answers)
+            owners.extend([i] * len(inputs))
+
+        generated_questions = self.generate_questions_from_inputs(qg_inputs, batch_size)
+
+        evaluated = [j for j, i in enumerate(owners) if options[i]["use_evaluator"]]
+        scores = {}
+        if evaluated:
+            print("Evaluating QA pairs...\n")
+            # With a cascade these are the screening scores; each document's borderline pairs are
+            # rescored when it is ranked.
+            evaluated_scores = self._first_stage_evaluator().get_batched_scores(
+                [generated_questions[j] for j in evaluated], [qg_answers[j] for j in evaluated], batch_size
+            )
+            scores = dict(zip(evaluated, evaluated_scores))
+
+        results = []
+        for i, o in enumerate(options):
+            indices = [j for j, owner in enumerate(owners) if owner == i]
+            questions = [generated_questions[j] for j in indices]
+            answers = [qg_answers[j] for j in indices]
+            if o["use_evaluator"] and self.qa_cascade is not None:
+                results.append(self._get_cascade_ranked_qa_pairs(
+                    questions, answers, o["num_questions"], batch_size, [scores[j] for j in indices]
+                ))
+            elif o["use_evaluator"]:
+                results.append(self._get_ranked_qa_pairs(
+                    questions, answers, [scores[j] for j in indices], o["num_questions"]
+                ))
+            else:
+                results.append(self._get_all_qa_pairs(questions, answers))
+
+        return results
+
+    def generate_pipelined(
+        self, documents: List[Mapping[str, Any]], batch_size: int = 16, queue_size: int = 4
+    ) -> List[List]:
+        """Takes the same documents as generate_batch and returns their QA lists, but runs text
+        preparation, NER, question generation, evaluation and ranking as concurrent stages joined
+        by queues of at most queue_size items (see qg_pipeline.GenerationPipeline). Each stage's
+        utilization and the time it spent blocked by the next one are kept in pipeline_stats.
+        """
+        print("Generating questions for {} documents (pipelined)...\n".format(len(documents)))
+
+        pipeline = GenerationPipeline(self, batch_size, queue_size)
+        results = pipeline.run(documents)
+        self.pipeline_stats = pipeline.stats
+        return results
+
+    def generate_incremental(
+        self,
+        article: str,
+        use_evaluator: bool = True,
+        num_questions: int = 10,
+        answer_style: str = "all",
+        prerank_factor: Optional[int] = None
+    ) -> List:
+        """Same as generate, but the sentences of each segment, the entities of each sentence, the
+        question for each answer and context, the distractors of each multiple choice answer and
+        the score of each QA pair are kept in content_cache, keyed by the content they depend on.
+        When an article is submitted again after an edit, only the segments and sentences that
+        changed go through NER, question generation and evaluation. Distractors are drawn again
+        only if the article's entities, and so the pool they are drawn from, changed. The ranking
+        is always rebuilt. get_incremental_stats reports how much was reused.
+        """
+        print("Generating questions (incremental)...\n")
+        self._check_answer_style(answer_style)
+
+        qg_inputs = []
+        qg_answers = []
+
+        if answer_style in ["sentences", "all"]:
+            segments = self._split_into_segments(article)
+            for segment, sentences in zip(segments, self._cached(
+                "segment", segments, lambda missing: [self._split_text(segment) for segment in missing]
+            )):
+                prepped_inputs, prepped_answers = self._prepare_qg_inputs(sentences, segment)
+                qg_inputs.extend(prepped_inputs)
+                qg_answers.extend(prepped_answers)
+
+        if answer_style in ["multiple_choice", "all"]:
+            sentences = self._split_text(article)
+            docs = [
+                CachedDoc(sentence, [CachedEntity(*entity) for entity in entities])
+                for sentence, entities in zip(sentences, self._cached("entities", sentences, self._tag_sentences))
+            ]
+            # Every distractor is drawn from the entities of the whole article.
+            pool = sorted({(e.text, e.label_) for doc in docs for e in doc.ents})
+
+            def get_answers(entity: Any, docs: List[Any]) -> List[Mapping[str, Any]]:
+                return self._cached(
+                    "distractors", [[entity.text, entity.label_, pool]], lambda _: [self._get_MC_answers(entity, docs)]
+                )[0]
+
+            prepped_inputs, prepped_answers = self._prepare_qg_inputs_MC(docs, get_answers)
+            qg_inputs.extend(prepped_inputs)
+            qg_answers.extend(prepped_answers)
+
+        if prerank_factor is not None:
+            qg_inputs, qg_answers = self._prerank_qg_inputs(
+                article, qg_inputs, qg_answers, prerank_factor * num_questions
+            )
+        generated_questions = self._cached("question", qg_inputs, self.generate_questions_from_inputs)
+
+        if use_evaluator:
+            print("Evaluating QA pairs...\n")
+            pairs = [
+                [question, self.qa_evaluator._get_answer_text(answer)]
+                for question, answer in zip(generated_questions, qg_answers)
+            ]
+
+            def score(missing: List[List[str]]) -> List[float]:
+                return self.qa_evaluator.get_scores(
+                    self.qa_evaluator.encode_qa_pairs([q for q, _ in missing], [a for _, a in missing])
+                )
+
+            if self.qa_cascade is not None:
+                screen_scores = self._cached(
+                    "screen", [list(pair) for pair in zip(generated_questions, qg_answers)],
+                    lambda missing: self.qa_cascade.screen.get_batched_scores(
+                        [q for q, _ in missing], [a for _, a in missing]
+                    )
+                )
+                qa_list = self._get_cascade_ranked_qa_pairs(
+                    generated_questions, qg_answers, num_questions, screen_scores=screen_scores,
+                    rescore=lambda indices: self._cached("score", [pairs[i] for i in indices], score)
+                )
+            else:
+                scores = self._cached("score", pairs, score)
+                qa_list = self._get_ranked_qa_pairs(generated_questions, qg_answers, scores, num_questions)
+        else:
+            print("Skipping evaluation step.\n")
+            qa_list = self._get_all_qa_pairs(generated_questions, qg_answers)
+
+        return qa_list
+
+    def get_incremental_stats(self) -> Mapping[str, Mapping[str, float]]:
+        """Returns, per cached step of generate_incremental, how many results were reused from
+        earlier calls and how many were computed.
+        """
+        return self.content_cache.get_stats()
+
+    def _cached(self, kind: str, contents: List[Any], compute: Any) -> List[Any]:
+        """Looks contents up in content_cache and calls compute once, with the distinct contents
+        that were not cached, to fill in the rest.
+        """
+        values = self.content_cache.lookup(kind, contents)
+        missing = list(dict.fromkeys(
+            json.dumps(content) for content, value in zip(contents, values) if value is None
+        ))
+        if missing:
+            missing = [json.loads(content) for content in missing]
+            computed = compute(missing)
+            self.content_cache.store(kind, missing, computed)
+            computed = dict(zip(map(json.dumps, missing), computed))
+            values = [
+                computed[json.dumps(content)] if value is None else value
+                for content, value in zip(contents, values)
+            ]
+        return values
+
+    def _tag_sentences(self, sentences: List[str]) -> List[List[Tuple[str, str]]]:
+        """Returns the (text, label) of the entities NER finds in each sentence."""
+        docs = self._extract_entities([sentences])[0]
+        return [[(e.text, e.label_) for e in doc.ents] for doc in docs]
+
+    def generate_qg_inputs(
+        self, text: str, answer_style: str, entity_docs: Optional[List[Any]] = None
+    ) -> Tuple[List[str], List[str]]:
         """Given a text, returns a list of model inputs and a list of corresponding answers.
         Model inputs take the form "answer_token <answer text> context_token <context text>" where
         the answer is a string extracted from the text, and the context is the wider text surrounding
-        the context.
+        the context. entity_docs can hold the spaCy docs of the text's sentences if they were
+        already extracted.
         """
 
+        self._check_answer_style(answer_style)
+
+        inputs = []
+        answers = []
+
+        if answer_style in ["sentences", "all"]:
+            inputs, answers = self._generate_sentence_qg_inputs(text)
+
+        if answer_style in ["multiple_choice", "all"]:
+            if entity_docs is None:
+                entity_docs = self._extract_entities([self._split_text(text)])[0]
+            prepped_inputs, prepped_answers = self._prepare_qg_inputs_MC(entity_docs)
+            inputs.extend(prepped_inputs)
+            answers.extend(prepped_answers)
+
+        return inputs, answers
+
+    def _check_answer_style(self, answer_style: str) -> None:
         VALID_ANSWER_STYLES = ["all", "sentences", "multiple_choice"]
 
         if answer_style not in VALID_ANSWER_STYLES:
@@ -83,38 +400,44 @@ class QuestionGenerator:
                 )
             )
 
+    def _generate_sentence_qg_inputs(self, text: str) -> Tuple[List[str], List[str]]:
+        """Returns the model inputs and answers that use the text's sentences as answers and the
+        segment around them as context.
+        """
         inputs = []
         answers = []
 
-        if answer_style in ["sentences", "all"]:
-            segments = self._split_into_segments(text)
-
-            for segment in segments:
-                sentences = self._split_text(segment)
-                prepped_inputs, prepped_answers = self._prepare_qg_inputs(
-                    sentences, segment
-                )
-                inputs.extend(prepped_inputs)
-                answers.extend(prepped_answers)
-
-        if answer_style in ["multiple_choice", "all"]:
-            sentences = self._split_text(text)
-            prepped_inputs, prepped_answers = self._prepare_qg_inputs_MC(sentences)
+        for segment in self._split_into_segments(text):
+            sentences = self._split_text(segment)
+            prepped_inputs, prepped_answers = self._prepare_qg_inputs(
+                sentences, segment
+            )
             inputs.extend(prepped_inputs)
             answers.extend(prepped_answers)
 
         return inputs, answers
 
-    def generate_questions_from_inputs(self, qg_inputs: List) -> List[str]:
+    def generate_questions_from_inputs(self, qg_inputs: List, batch_size: int = 1) -> List[str]:
         """Given a list of concatenated answers and contexts, with the form:
         "answer_token <answer text> context_token <context text>", generates a list of 
-        questions.
+        questions. With a batch_size above 1, inputs of similar length are generated together.
         """
-        generated_questions = []
+        # Tokenize every input that is not cached yet in one batch.
+        self.qg_tokens.encode_inputs(qg_inputs, self.SEQ_LENGTH)
+
+        if batch_size == 1 or self.qg_draft_model is not None:
+            # Assisted decoding only supports one sequence at a time.
+            return [self._generate_question(qg_input) for qg_input in qg_inputs]
+
+        encoded_inputs = [self._encode_qg_input(qg_input)["input_ids"][0] for qg_input in qg_inputs]
+        order = sorted(range(len(qg_inputs)), key=lambda i: len(encoded_inputs[i]))
+        generated_questions = [None] * len(qg_inputs)
 
-        for qg_input in qg_inputs:
-            question = self._generate_question(qg_input)
-            generated_questions.append(question)
+        for start in range(0, len(order), batch_size):
+            batch = order[start:start + batch_size]
+            questions = self._generate_question_batch([encoded_inputs[i] for i in batch])
+            for i, question in zip(batch, questions):
+                generated_questions[i] = question
 
         return generated_questions
 
@@ -139,21 +462,21 @@ class QuestionGenerator:
         Segments are used as context for question generation.
         """
         MAX_TOKENS = 490
-        paragraphs = text.split("\n")
-        tokenized_paragraphs = [
-            self.qg_tokenizer(p)["input_ids"] for p in paragraphs if len(p) > 0
-        ]
+        paragraphs = [p.strip() for p in text.split("\n") if len(p) > 0]
+        # Each paragraph also counts its end of sequence token, as when they were encoded one by one.
+        lengths = [len(ids) + 1 for ids in self.qg_tokens.encode(paragraphs)]
         segments = []
 
-        while len(tokenized_paragraphs) > 0:
+        while len(paragraphs) > 0:
             segment = []
+            segment_length = 0
 
-            while len(segment) < MAX_TOKENS and len(tokenized_paragraphs) > 0:
-                paragraph = tokenized_paragraphs.pop(0)
-                segment.extend(paragraph)
-            segments.append(segment)
+            while segment_length < MAX_TOKENS and len(paragraphs) > 0:
+                segment.append(paragraphs.pop(0))
+                segment_length += lengths.pop(0)
+            segments.append(" ".join(segment))
 
-        return [self.qg_tokenizer.decode(s, skip_special_tokens=True) for s in segments]
+        return segments
 
     def _prepare_qg_inputs(
         self,
@@ -173,22 +496,41 @@ class QuestionGenerator:
 
         return inputs, answers
 
-    def _prepare_qg_inputs_MC(self, sentences: List[str]) -> Tuple[List[str], List[str]]:
-        """Performs NER on the text, and uses extracted entities as candidate answers for multiple-choice
+    def _extract_entities(self, sentence_lists: List[List[str]]) -> List[List[Any]]:
+        """Runs NER over the sentences of several texts in one pass and returns the spaCy docs of
+        each text. The spaCy model is loaded on first use and kept.
+        """
+        if self._spacy_nlp is None:
+            self._spacy_nlp = en_core_web_sm.load()
+
+        sentences = [sentence for sentence_list in sentence_lists for sentence in sentence_list]
+        docs = list(self._spacy_nlp.pipe(sentences, disable=["parser"]))
+        entity_docs = []
+        for sentence_list in sentence_lists:
+            entity_docs.append(docs[:len(sentence_list)])
+            docs = docs[len(sentence_list):]
+
+        return entity_docs
+
+    def _prepare_qg_inputs_MC(
+        self, docs: List[Any], get_answers: Optional[Any] = None
+    ) -> Tuple[List[str], List[str]]:
+        """Uses the entities found by NER in the text's sentences as candidate answers for multiple-choice
         questions. Sentences are used as context, and entities as answers. Returns a tuple of (model inputs, answers). 
-        Model inputs are "answer_token <answer text> context_token <context text>"
+        Model inputs are "answer_token <answer text> context_token <context text>". get_answers replaces
+        _get_MC_answers to choose each entity's options.
         """
-        spacy_nlp = en_core_web_sm.load()
-        docs = list(spacy_nlp.pipe(sentences, disable=["parser"]))
+        get_answers = get_answers or self._get_MC_answers
         inputs_from_text = []
         answers_from_text = []
 
-        for doc, sentence in zip(docs, sentences):
+        for doc in docs:
+            sentence = doc.text
             entities = doc.ents
             if entities:
                 for entity in entities:
                     qg_input = f"{self.ANSWER_TOKEN} {entity.text} {self.CONTEXT_TOKEN} {sentence}"
-                    answers = self._get_MC_answers(entity, docs)
+                    answers = get_answers(entity, docs)
                     inputs_from_text.append(qg_input)
                     answers_from_text.append(answers)
 
@@ -229,18 +571,160 @@ class QuestionGenerator:
         random.shuffle(final_choices)
         return final_choices
 
+    def _prerank_qg_inputs(
+        self, text: str, qg_inputs: List[str], qg_answers: List[Any], limit: int
+    ) -> Tuple[List[str], List[Any]]:
+        """Keeps the limit highest scoring candidates from get_prerank_scores, in their original order,
+        so that the expensive question generation and evaluation steps only see promising answers.
+        """
+        if len(qg_inputs) <= limit:
+            return qg_inputs, qg_answers
+
+        scores = self.get_prerank_scores(text, qg_inputs, qg_answers)
+        keep = sorted(np.argsort(scores)[::-1][:limit])
+
+        return [qg_inputs[i] for i in keep], [qg_answers[i] for i in keep]
+
+    def get_prerank_scores(self, text: str, qg_inputs: List[str], qg_answers: List[Any]) -> List[float]:
+        """Scores candidate answers with cheap lexical features: TF-IDF salience of the answer
+        sentence against the whole document, how close the sentence length is to a typical question
+        answer, and the density of entity-like tokens. Multiple choice candidates are scored on the
+        sentence they were taken from, plus the salience of the entity itself.
+        """
+        PRERANK_WEIGHTS = {"salience": 0.6, "length": 0.25, "entity_density": 0.15}
+
+        sentences = self._split_text(text) or [text]
+        vectorizer = TfidfVectorizer(lowercase=True, sublinear_tf=True)
+        try:
+            vectorizer.fit(sentences)
+        except ValueError:
+            # The vocabulary is empty when no word of the text has two or more characters; the
+            # candidates are then ranked on their length and entity density alone.
+            vectorizer = None
+        vocabulary = vectorizer.vocabulary_ if vectorizer is not None else {}
+        idf = vectorizer.idf_ if vectorizer is not None else None
+
+        candidate_sentences = []
+        entity_salience = []
+        for qg_input, answer in zip(qg_inputs, qg_answers):
+            if isinstance(answer, list):
+                candidate_sentences.append(qg_input.split(self.CONTEXT_TOKEN, 1)[-1].strip())
+                correct = [a["answer"] for a in answer if a["correct"]][0]
+                terms = [vocabulary[t] for t in correct.lower().split() if t in vocabulary]
+                entity_salience.append(np.mean(idf[terms]) / idf.max() if terms else 0.0)
+            else:
+                candidate_sentences.append(answer)
+                entity_salience.append(0.0)
+
+        if vectorizer is not None:
+            document_vector = vectorizer.transform([text])
+            candidate_vectors = vectorizer.transform(candidate_sentences)
+            # Rows are L2-normalised by the vectorizer, so the dot product is the cosine similarity.
+            salience = (candidate_vectors @ document_vector.T).toarray().ravel()
+        else:
+            salience = np.zeros(len(candidate_sentences))
+
+        scores = []
+        for i, sentence in enumerate(candidate_sentences):
+            words = sentence.split()
+            length_score = min(len(words) / 8, 1.0) * min(40 / max(len(words), 1), 1.0)
+            entity_like = [w for w in words[1:] if w[:1].isupper() or w[:1].isdigit()]
+            entity_density = len(entity_like) / max(len(words), 1)
+            if isinstance(qg_answers[i], list):
+                salience_score = (salience[i] + entity_salience[i]) / 2
+            else:
+                salience_score = salience[i]
+            score = (
+                PRERANK_WEIGHTS["salience"] * salience_score
+                + PRERANK_WEIGHTS["length"] * length_score
+                + PRERANK_WEIGHTS["entity_density"] * min(entity_density * 4, 1.0)
+            )
+            scores.append(float(score))
+
+        return scores
+
+    def _load_draft_model(self, draft_model: str, num_assistant_tokens: int) -> None:
+        """Loads a small T5 checkpoint used to draft tokens for assisted (speculative) decoding.
+        The draft model must share the question generator's vocabulary. Forward passes of both
+        models are counted so that acceptance statistics can be reported. The counts are kept per
+        thread, as a question is generated within one thread while other threads generate theirs.
+        """
+        self.qg_draft_model = T5ForConditionalGeneration.from_pretrained(draft_model)
+        self.qg_draft_model.generation_config.num_assistant_tokens = num_assistant_tokens
+        self.qg_draft_model.generation_config.num_assistant_tokens_schedule = "constant"
+        self.qg_draft_model.to(self.device)
+        self.qg_draft_model.eval()
+
+        self._forward_passes = threading.local()
+
+        def count_pass(name: str) -> Any:
+            def hook(module: Any, inputs: Any, outputs: Any) -> None:
+                passes = self._forward_passes
+                setattr(passes, name, getattr(passes, name, 0) + 1)
+            return hook
+
+        self.qg_model.register_forward_hook(count_pass("target"))
+        self.qg_draft_model.register_forward_hook(count_pass("draft"))
+
+    def _reset_assisted_decoding_stats(self) -> None:
+        with self._assisted_decoding_lock:
+            self.assisted_decoding_stats = {
+                "questions": 0,
+                "generated_tokens": 0,
+                "target_forward_passes": 0,
+                "draft_tokens_proposed": 0,
+            }
+
+    def get_assisted_decoding_stats(self) -> Mapping[str, float]:
+        """Returns how well the draft model's proposals were accepted by the question generator.
+        Each target forward pass verifies the drafted tokens and contributes one token of its own,
+        so every generated token beyond one per target pass is an accepted draft token.
+        """
+        with self._assisted_decoding_lock:
+            stats = dict(self.assisted_decoding_stats)
+        accepted = max(stats["generated_tokens"] - stats["target_forward_passes"], 0)
+        stats["draft_tokens_accepted"] = accepted
+        stats["acceptance_rate"] = accepted / max(stats["draft_tokens_proposed"], 1)
+        stats["tokens_per_target_pass"] = (
+            stats["generated_tokens"] / max(stats["target_forward_passes"], 1)
+        )
+        return stats
+
     @torch.no_grad()
     def _generate_question(self, qg_input: str) -> str:
         """Takes qg_input which is the concatenated answer and context, and uses it to generate
-        a question sentence. The generated question is decoded and then returned.
+        a question sentence. The generated question is decoded and then returned. If a draft model
+        was loaded, decoding is assisted by it; greedy outputs are identical to unassisted decoding.
+        With static generation, the compiled StaticT5Generator decodes instead.
         """
         encoded_input = self._encode_qg_input(qg_input)
         encoded_input = encoded_input.to(self.device)
-        encoded_output = self.qg_model.generate(
-            input_ids=encoded_input["input_ids"],
-            attention_mask=encoded_input["attention_mask"],
-            max_length=64,
-        )
+
+        if self.qg_static is not None:
+            encoded_output = [self.qg_static.generate(encoded_input["input_ids"][0])]
+        elif self.qg_draft_model is None:
+            encoded_output = self.qg_model.generate(
+                input_ids=encoded_input["input_ids"],
+                attention_mask=encoded_input["attention_mask"],
+                max_length=64,
+            )
+        else:
+            passes = self._forward_passes
+            passes.target = passes.draft = 0
+            encoded_output = self.qg_model.generate(
+                input_ids=encoded_input["input_ids"],
+                attention_mask=encoded_input["attention_mask"],
+                max_length=64,
+                do_sample=False,
+                assistant_model=self.qg_draft_model,
+            )
+            with self._assisted_decoding_lock:
+                stats = self.assisted_decoding_stats
+                stats["questions"] += 1
+                # The first position of the output is the decoder start token.
+                stats["generated_tokens"] += encoded_output.shape[-1] - 1
+                stats["target_forward_passes"] += passes.target
+                stats["draft_tokens_proposed"] += passes.draft
 
         question = self.qg_tokenizer.decode(
             encoded_output[0],
@@ -249,14 +733,31 @@ class QuestionGenerator:
 
         return question
 
+    @torch.no_grad()
+    def _generate_question_batch(self, input_ids: List[torch.Tensor]) -> List[str]:
+        """Generates questions for a batch of encoded inputs, padded to the longest of them."""
+        attention_mask = [torch.ones_like(ids) for ids in input_ids]
+        input_ids = torch.nn.utils.rnn.pad_sequence(
+            input_ids, batch_first=True, padding_value=self.qg_tokenizer.pad_token_id
+        )
+        attention_mask = torch.nn.utils.rnn.pad_sequence(attention_mask, batch_first=True)
+
+        encoded_output = self.qg_model.generate(
+            input_ids=input_ids.to(self.device),
+            attention_mask=attention_mask.to(self.device),
+            max_length=64,
+        )
+
+        return self.qg_tokenizer.batch_decode(encoded_output, skip_special_tokens=True)
+
     def _encode_qg_input(self, qg_input: str) -> Any:
-        """Encodes qg_input into tokens IDs that can be input into a transformer model."""
-        return self.qg_tokenizer(
-            qg_input,
-            truncation=True,
-            padding="max_length",
-            max_length=self.SEQ_LENGTH,
-            return_tensors="pt"
+        """Encodes qg_input into tokens IDs that can be input into a transformer model. The IDs are
+        those of tokenizing the whole string, cached by the tokenization service.
+        """
+        input_ids = self.qg_tokens.encode_inputs([qg_input], self.SEQ_LENGTH)[0]
+        return BatchEncoding(
+            {"input_ids": [input_ids], "attention_mask": [[1] * len(input_ids)]},
+            tensor_type="pt"
         )
 
     def _get_ranked_qa_pairs(
@@ -274,6 +775,23 @@ class QuestionGenerator:
 
         return qa_list
 
+    def _get_cascade_ranked_qa_pairs(
+        self,
+        questions: List[str],
+        answers: List[Any],
+        num_questions: int,
+        batch_size: int = 16,
+        screen_scores: Optional[List[float]] = None,
+        rescore: Optional[Any] = None
+    ) -> List[Mapping[str, Any]]:
+        """Ranks and returns the top k question/answer pairs with qa_cascade (see QACascade.rank)."""
+        ranked = self.qa_cascade.rank(questions, answers, num_questions, batch_size, screen_scores, rescore)
+        return [{"question": questions[i], "answer": answers[i], "score": score} for i, score in ranked]
+
+    def _first_stage_evaluator(self) -> Any:
+        """Returns the evaluator that scores every QA pair: the cascade's screen, if there is one."""
+        return self.qa_evaluator if self.qa_cascade is None else self.qa_cascade.screen
+
     def _get_all_qa_pairs(
         self, questions: List[str], answers: List[str]
     ) -> List[Mapping[str, Any]]:
@@ -286,34 +804,93 @@ class QAEvaluator:
     Higher scores indicate better question-answer quality.
     """
 
-    def __init__(self):
-        QAE_PRETRAINED = "bert-large-cased"
+    def __init__(self, model: str = "bert-large-cased") -> None:
         self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-        self.qa_evaluator_tokenizer = BertTokenizer.from_pretrained(QAE_PRETRAINED)
+        self.qa_evaluator_tokenizer = load_fast_tokenizer(model)
+        # Checkpoints fine-tuned by training/qa_eval_train.py are two-class classifiers; anything
+        # else gets a single regression head.
+        config = AutoConfig.from_pretrained(model)
+        is_classifier = "BertForSequenceClassification" in (config.architectures or [])
         self.qa_evaluator = BertForSequenceClassification.from_pretrained(
-            QAE_PRETRAINED, num_labels=1
+            model, num_labels=config.num_labels if is_classifier else 1
         )
         self.qa_evaluator.to(self.device)
         self.qa_evaluator.eval()
 
     @torch.no_grad()
     def encode_qa_pairs(self, questions: List[str], answers: List[str]) -> Any:
-        """Encodes QA pairs for evaluation using a BERT model."""
+        """Encodes QA pairs for evaluation using a BERT model. Multiple choice answers are
+        evaluated using their correct option. All pairs are encoded in one batch and padded to
+        the longest of them.
+        """
+        answers = [self._get_answer_text(a) for a in answers]
         encoded_qa_pairs = self.qa_evaluator_tokenizer(
             questions,
             answers,
             truncation=True,
-            padding="max_length",
+            padding="longest",
             max_length=512,
             return_tensors="pt"
         )
 
         return encoded_qa_pairs
 
+    def get_batched_scores(self, questions: List[str], answers: List[Any], batch_size: int = 16) -> List[float]:
+        """Scores QA pairs in batches of similar length, so that large sets of pairs are not
+        padded and evaluated all at once. Scores are returned in the order of the pairs.
+        """
+        order = sorted(
+            range(len(questions)), key=lambda i: len(questions[i]) + len(self._get_answer_text(answers[i]))
+        )
+        scores = [None] * len(questions)
+
+        for start in range(0, len(order), batch_size):
+            batch = order[start:start + batch_size]
+            encoded_qa_pairs = self.encode_qa_pairs([questions[i] for i in batch], [answers[i] for i in batch])
+            for i, score in zip(batch, self.get_scores(encoded_qa_pairs)):
+                scores[i] = score
+
+        return scores
+
+    def _get_answer_text(self, answer: Any) -> str:
+        """Returns the text of the correct option if answer is a list of multiple choice options."""
+        if isinstance(answer, list):
+            return [a["answer"] for a in answer if a["correct"]][0]
+        return answer
+
     @torch.no_grad()
     def get_scores(self, encoded_qa_pairs: Any) -> Any:
         """Given a list of encoded QA pairs, returns scores for them."""
         encoded_qa_pairs = encoded_qa_pairs.to(self.device)
-        outputs = self.qa_evaluator(**encoded_qa_pairs)
+        logits = self.qa_evaluator(**encoded_qa_pairs)[0]
 
-        return outputs[0].squeeze(-1).tolist()
+        if logits.shape[-1] == 2:
+            # Two-class classifiers score a pair by the margin of the "good pair" class.
+            return (logits[:, 1] - logits[:, 0]).tolist()
+        return logits.squeeze(-1).tolist()
+
+
+def load_screen_evaluator(model: str) -> Any:
+    """Returns the first stage of a QACascade: a LexicalQAScorer for "lexical", otherwise a
+    QAEvaluator, usually with a much smaller BERT than the full evaluator.
+    """
+    if model == "lexical":
+        return LexicalQAScorer()
+    return QAEvaluator(model)
+
+
+def print_qa(qa_list: List[Mapping[str, Any]], show_answers: bool = True) -> None:
+    """Formats and prints a list of generated questions and answers."""
+    for i, qa in enumerate(qa_list):
+        space = " " * (3 if i < 9 else 4)
+        print(f"{i + 1}) Q: {qa['question']}")
+        answer = qa["answer"]
+
+        if isinstance(answer, list):
+            for j, option in enumerate(answer):
+                prefix = f"{space}A: " if j == 0 else f"{space}   "
+                correct = " (correct)" if show_answers and option["correct"] else ""
+                print(f"{prefix}{j + 1}. {option['answer']}{correct}")
+            print("")
+        elif show_answers:
+            print(f"{space}A: {answer}\n")
@@ -1,6 +1,6 @@
 #run_qg.py
 import argparse
-from questiongenerator import QuestionGenerator
+from questiongenerator import MODEL_TIERS, QuestionGenerator
 from questiongenerator import print_qa
 
 def parse_args() -> argparse.Namespace:
@@ -11,10 +11,40 @@ def parse_args() -> argparse.Namespace:
         type=str,
         help="The desired type of answers. Choose from ['all', 'sentences', 'multiple_choice']",
     )
-    parser.add_argument("--model_dir", type=str, default=None)
+    parser.add_argument(
+        "--draft_model",
+        type=str,
+        default=None,
+        help="Small T5 checkpoint used to draft tokens for assisted decoding, e.g. t5-small. Overrides the tier.",
+    )
+    parser.add_argument(
+        "--model_dir",
+        type=str,
+        default=None,
+        help="Question generator checkpoint, e.g. the save_dir of training/qg_train.py. Overrides the tier.",
+    )
+    parser.add_argument(
+        "--num_assistant_tokens",
+        type=int,
+        default=None,
+        help="Tokens the draft model proposes per step. Overrides the tier (default 5).",
+    )
     parser.add_argument("--num_questions", type=int, default=10)
+    parser.add_argument(
+        "--prerank_factor",
+        type=int,
+        default=None,
+        help="Only generate questions for the prerank_factor * num_questions most promising answers.",
+    )
+    parser.add_argument(
+        "--qa_eval_model",
+        type=str,
+        default=None,
+        help="QA evaluator checkpoint, e.g. the save_dir of training/qa_eval_train.py. Overrides the tier.",
+    )
     parser.add_argument("--show_answers", dest="show_answers", action="store_true", default=True)
     parser.add_argument("--text_file", type=str, required=True)
+    parser.add_argument("--tier", type=str, default="best", choices=list(MODEL_TIERS))
     parser.add_argument("--use_qa_eval", dest="use_qa_eval", action="store_true", default=True)
     return parser.parse_args()
 
@@ -23,11 +53,24 @@ if __name__ == "__main__":
     args = parse_args()
     with open(args.text_file, 'r') as file:
         text_file = file.read()
-    qg = QuestionGenerator()
+    # Only the options given on the command line replace the tier's settings, so the rest of
+    # its config (screening, cascade, static generation, cache size) still applies.
+    overrides = {
+        "qg_model": args.model_dir,
+        "qa_eval_model": args.qa_eval_model,
+        "draft_model": args.draft_model,
+        "num_assistant_tokens": args.num_assistant_tokens,
+    }
+    config = dict(MODEL_TIERS[args.tier])
+    config.update({key: value for key, value in overrides.items() if value is not None})
+    qg = QuestionGenerator.from_tier(args.tier, {args.tier: config})
     qa_list = qg.generate(
         text_file,
         num_questions=int(args.num_questions),
         answer_style=args.answer_style,
-        use_evaluator=args.use_qa_eval
+        use_evaluator=args.use_qa_eval,
+        prerank_factor=args.prerank_factor
     )
-    print_qa(qa_list, show_answers=args.show_answers)
\ No newline at end of file
+    print_qa(qa_list, show_answers=args.show_answers)
+    if qg.qg_draft_model is not None:
+        print("Assisted decoding:", qg.get_assisted_decoding_stats())
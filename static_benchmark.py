@@ -0,0 +1,63 @@
+#static_benchmark.py
+import argparse
+import json
+from qg_static import DEFAULT_BUCKETS, compare_with_eager
+from questiongenerator import MODEL_TIERS, QuestionGenerator
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Compares the compiled, static-shape question generation path with eager generate()."
+    )
+    parser.add_argument(
+        "--answer_style",
+        default="all",
+        type=str,
+        help="The desired type of answers. Choose from ['all', 'sentences', 'multiple_choice']",
+    )
+    parser.add_argument("--buckets", type=int, nargs="+", default=list(DEFAULT_BUCKETS))
+    parser.add_argument(
+        "--cache_dir",
+        type=str,
+        default=None,
+        help="Where compiled artifacts are saved and loaded from. Run twice to measure a warm boot.",
+    )
+    parser.add_argument("--max_inputs", type=int, default=50)
+    parser.add_argument("--output", type=str, default=None)
+    parser.add_argument("--text_files", type=str, nargs="+", required=True)
+    parser.add_argument("--tier", type=str, default="best", choices=list(MODEL_TIERS))
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    tier = MODEL_TIERS[args.tier]
+    qg = QuestionGenerator(
+        qg_model=tier["qg_model"],
+        qa_eval_model=tier["qa_eval_model"],
+        static_generation={"buckets": args.buckets, "cache_dir": args.cache_dir},
+    )
+    if qg.qg_static is None:
+        raise SystemExit("The {} tier's question generator does not decode greedily.".format(args.tier))
+
+    inputs = []
+    for text_file in args.text_files:
+        with open(text_file, "r") as file:
+            qg_inputs, _ = qg.generate_qg_inputs(file.read(), args.answer_style)
+        inputs.extend(qg._encode_qg_input(qg_input)["input_ids"][0] for qg_input in qg_inputs)
+    inputs = inputs[:args.max_inputs]
+
+    # One eager call first, so that neither path pays for first-call allocations.
+    qg.qg_model.generate(input_ids=inputs[0].reshape(1, -1), max_length=64)
+    comparison = compare_with_eager(qg.qg_model, qg.qg_static, inputs)
+
+    report = json.dumps({
+        "warm_up_s": qg.qg_static.stats["warm_up_s"],
+        "artifacts_loaded": qg.qg_static.stats["artifacts_loaded"],
+        "buckets": args.buckets,
+        "comparison": comparison,
+    }, indent=2)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(report)
+    print(report)
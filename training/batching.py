@@ -0,0 +1,109 @@
+#batching.py
+
+import random
+import numpy as np
+import torch
+from torch.utils.data import Sampler
+from typing import Iterator, List, Mapping, Optional, Sequence
+
+
+# Per-token fields, padded along their first dimension. Anything else (scalar labels,
+# teacher_logits) has the same shape in every example and is stacked as is.
+SEQUENCE_FIELDS = [
+    "input_ids",
+    "attention_mask",
+    "token_type_ids",
+    "labels",
+    "teacher_topk_values",
+    "teacher_topk_indices",
+    "teacher_mask",
+]
+
+
+class PaddingCollator:
+    """Pads a batch of unpadded examples to the longest sequence in the batch rather than to
+    max_length."""
+
+    def __init__(
+        self,
+        pad_token_id: int,
+        pad_mask_id: int = -100,
+        pad_to_multiple_of: Optional[int] = None,
+        pad_to_length: Optional[int] = None
+    ) -> None:
+        self.pad_values = {"input_ids": pad_token_id, "labels": pad_mask_id}
+        self.pad_to_multiple_of = pad_to_multiple_of
+        # Pads every batch to a fixed length, i.e. the old static padding; used for benchmarking.
+        self.pad_to_length = pad_to_length
+
+    def __call__(self, examples: Sequence[Mapping[str, torch.Tensor]]) -> Mapping[str, torch.Tensor]:
+        return {key: self._collate_field(key, [e[key] for e in examples]) for key in examples[0]}
+
+    def _collate_field(self, key: str, values: List[torch.Tensor]) -> torch.Tensor:
+        if key not in SEQUENCE_FIELDS or values[0].dim() == 0:
+            return torch.stack(values)
+        # At least one position: models index the first decoder position even if every label is empty.
+        length = self.pad_to_length or max(max(v.shape[0] for v in values), 1)
+        if self.pad_to_multiple_of is not None:
+            length = -(-length // self.pad_to_multiple_of) * self.pad_to_multiple_of
+        batch = values[0].new_full((len(values), length) + values[0].shape[1:], self.pad_values.get(key, 0))
+        for i, value in enumerate(values):
+            batch[i, :value.shape[0]] = value
+        return batch
+
+
+class LengthGroupedSampler(Sampler):
+    """Yields batches of indices whose examples have similar lengths, so little of each batch is
+    padding. Indices are shuffled, cut into buckets of bucket_size_multiplier batches, sorted by
+    length within each bucket and the resulting batches shuffled again. With shuffle=False every
+    example is sorted by length instead, which suits evaluation.
+
+    With num_replicas > 1 every rank builds the same batches from the same seed and takes every
+    num_replicas-th one, wrapping around so all ranks run the same number of steps."""
+
+    def __init__(
+        self,
+        lengths: Sequence[int],
+        batch_size: int,
+        shuffle: bool = True,
+        bucket_size_multiplier: int = 50,
+        seed: int = 0,
+        num_replicas: int = 1,
+        rank: int = 0
+    ) -> None:
+        self.lengths = np.asarray(lengths)
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.bucket_size = batch_size * bucket_size_multiplier
+        self.seed = seed
+        self.num_replicas = num_replicas
+        self.rank = rank
+        self.epoch = 0
+
+    def set_epoch(self, epoch: int) -> None:
+        self.epoch = epoch
+
+    def __len__(self) -> int:
+        batches = -(-len(self.lengths) // self.batch_size)
+        return -(-batches // self.num_replicas)
+
+    def __iter__(self) -> Iterator[List[int]]:
+        batches = self._batches()
+        total = len(self) * self.num_replicas
+        batches += batches[:total - len(batches)]
+        return iter(batches[self.rank:total:self.num_replicas])
+
+    def _batches(self) -> List[List[int]]:
+        if not self.shuffle:
+            order = np.argsort(-self.lengths, kind="stable")
+            return [order[i:i + self.batch_size].tolist() for i in range(0, len(order), self.batch_size)]
+
+        rng = random.Random(self.seed + self.epoch)
+        indices = list(range(len(self.lengths)))
+        rng.shuffle(indices)
+        batches = []
+        for start in range(0, len(indices), self.bucket_size):
+            bucket = sorted(indices[start:start + self.bucket_size], key=lambda i: -self.lengths[i])
+            batches.extend(bucket[i:i + self.batch_size] for i in range(0, len(bucket), self.batch_size))
+        rng.shuffle(batches)
+        return batches
@@ -0,0 +1,121 @@
+#checkpoint.py
+
+import glob
+import os
+import random
+import re
+import numpy as np
+import torch
+import torch.distributed as dist
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, List, Mapping, Optional
+
+from distributed import is_distributed
+
+CHECKPOINT_PATTERN = re.compile(r"checkpoint-(\d+)\.pt$")
+
+
+def to_cpu(obj: Any, memo: Optional[dict] = None) -> Any:
+    # A copy the training loop can keep updating while the copy is being written. Tensors that
+    # share memory (tied embeddings) still share it in the copy, so they are not saved twice.
+    memo = {} if memo is None else memo
+    if isinstance(obj, torch.Tensor):
+        key = (obj.data_ptr(), obj.dtype, tuple(obj.shape), obj.stride())
+        if key not in memo:
+            memo[key] = obj.detach().to("cpu", copy=True)
+        return memo[key]
+    if isinstance(obj, dict):
+        return {key: to_cpu(value, memo) for key, value in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(to_cpu(value, memo) for value in obj)
+    return obj
+
+
+def get_rng_state() -> Mapping[str, Any]:
+    state = {
+        "python": random.getstate(),
+        "numpy": np.random.get_state(),
+        "torch": torch.get_rng_state(),
+    }
+    if torch.cuda.is_available():
+        state["cuda"] = torch.cuda.get_rng_state_all()
+    return state
+
+
+def set_rng_state(state: Mapping[str, Any]) -> None:
+    random.setstate(state["python"])
+    np.random.set_state(state["numpy"])
+    torch.set_rng_state(state["torch"])
+    if "cuda" in state and torch.cuda.is_available():
+        torch.cuda.set_rng_state_all(state["cuda"])
+
+
+def gather_rng_states() -> List[Mapping[str, Any]]:
+    # Every rank has its own RNG stream (dropout, DataLoader worker seeds), so all are saved.
+    if not is_distributed():
+        return [get_rng_state()]
+    states = [None] * dist.get_world_size()
+    dist.all_gather_object(states, get_rng_state())
+    return states
+
+
+class CheckpointManager:
+    """Writes training checkpoints from a background thread so the training loop only pays for
+    copying the state to CPU memory. Each checkpoint is written to a temporary file and renamed
+    into place, and only the newest keep_last are kept. At most one write is in flight; a new
+    save waits for the previous one, which also bounds the memory held by snapshots."""
+
+    def __init__(self, checkpoint_dir: str, keep_last: int = 2) -> None:
+        self.checkpoint_dir = checkpoint_dir
+        self.keep_last = keep_last
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="checkpoint")
+        self._pending = None
+
+    def checkpoints(self) -> List[str]:
+        paths = glob.glob(os.path.join(self.checkpoint_dir, "checkpoint-*.pt"))
+        return sorted(
+            (path for path in paths if CHECKPOINT_PATTERN.search(path)),
+            key=lambda path: int(CHECKPOINT_PATTERN.search(path).group(1))
+        )
+
+    def latest(self) -> Optional[str]:
+        checkpoints = self.checkpoints()
+        return checkpoints[-1] if checkpoints else None
+
+    def save(self, state: Mapping[str, Any], step: int) -> None:
+        snapshot = to_cpu(state)
+        self.submit(lambda: self._write(snapshot, step))
+
+    def submit(self, fn: Callable[[], None]) -> None:
+        self.wait()
+        self._pending = self._executor.submit(fn)
+
+    def wait(self) -> None:
+        # Re-raises any error from the background write.
+        if self._pending is not None:
+            pending, self._pending = self._pending, None
+            pending.result()
+
+    def load(self, path: str, map_location: str = "cpu") -> Mapping[str, Any]:
+        return torch.load(path, map_location=map_location, weights_only=False)
+
+    def _write(self, snapshot: Mapping[str, Any], step: int) -> None:
+        os.makedirs(self.checkpoint_dir, exist_ok=True)
+        path = os.path.join(self.checkpoint_dir, f"checkpoint-{step:08d}.pt")
+        tmp_path = path + ".tmp"
+        torch.save(snapshot, tmp_path)
+        os.replace(tmp_path, path)
+        for old_path in self.checkpoints()[:-self.keep_last]:
+            os.remove(old_path)
+
+
+def write_atomically(save_fn: Callable[[str], None], save_dir: str) -> None:
+    # save_pretrained writes several files; each one is moved into save_dir with a rename, so a
+    # reader never sees a half-written file.
+    tmp_dir = save_dir.rstrip("/") + ".tmp"
+    os.makedirs(tmp_dir, exist_ok=True)
+    save_fn(tmp_dir)
+    os.makedirs(save_dir, exist_ok=True)
+    for name in os.listdir(tmp_dir):
+        os.replace(os.path.join(tmp_dir, name), os.path.join(save_dir, name))
+    os.rmdir(tmp_dir)
@@ -1,12 +1,14 @@
 #dataset.py
 
 import datasets
-import random
+import numpy as np
 import pandas as pd
 import torch
 from transformers import AutoTokenizer
-from typing import Mapping, Tuple
-import en_core_web_sm
+from typing import Mapping, Optional, Sequence, Tuple
+
+from entity_cache import build_entity_spans, load_ner
+from token_cache import _fingerprint, build_token_cache
 
 
 class QGDataset(torch.utils.data.Dataset):
@@ -15,90 +17,222 @@ class QGDataset(torch.utils.data.Dataset):
         data: datasets.Dataset,
         max_length: int,
         pad_mask_id: int,
-        tokenizer: AutoTokenizer
+        tokenizer: AutoTokenizer,
+        token_cache_dir: Optional[str] = None
     ) -> None:
-        self.data = pd.DataFrame(data)
         self.max_length = max_length
         self.pad_mask_id = pad_mask_id
         self.tokenizer = tokenizer
+        # Identifies the examples themselves, for caches derived from this dataset.
+        self.fingerprint = _fingerprint(list(data["text"]) + list(data["question"]))
+        self.text_cache = None
+        if token_cache_dir is None:
+            self.data = pd.DataFrame(data)
+        else:
+            # Pre-tokenized once; items are slices of memory-mapped arrays, no DataFrame needed.
+            self.data = None
+            self.text_cache = build_token_cache(
+                data["text"], tokenizer, max_length, token_cache_dir, "qg-text"
+            )
+            self.question_cache = build_token_cache(
+                data["question"], tokenizer, max_length, token_cache_dir, "qg-question"
+            )
 
     def __len__(self) -> int:
+        if self.text_cache is not None:
+            return len(self.text_cache)
         return len(self.data)
 
     def __getitem__(self, index: int) -> Mapping[str, torch.Tensor]:
-        item = self.data.loc[index]
-        input_ids, attention_mask = self._encode_text(item.text)
-        labels, _ = self._encode_text(item.question)
-        masked_labels = self._mask_label_padding(labels)
+        # Items are unpadded; PaddingCollator pads each batch to its longest sequence and
+        # fills label padding with pad_mask_id.
+        if self.text_cache is not None:
+            input_ids = torch.from_numpy(self.text_cache[index].astype(np.int64))
+            labels = torch.from_numpy(self.question_cache[index].astype(np.int64))
+        else:
+            item = self.data.loc[index]
+            input_ids = self._encode_text(item.text)
+            labels = self._encode_text(item.question)
         return {
             "input_ids": input_ids,
-            "attention_mask": attention_mask,
-            "labels": masked_labels
+            "attention_mask": torch.ones_like(input_ids),
+            "labels": labels
         }
 
-    def _encode_text(self, text: str) -> Tuple[torch.Tensor, torch.Tensor]:
+    @property
+    def lengths(self) -> np.ndarray:
+        # Input lengths for LengthGroupedSampler. Without a token cache, word counts are a
+        # close enough proxy and avoid tokenizing the whole dataset up front.
+        if self.text_cache is not None:
+            return self.text_cache.lengths
+        return self.data.text.str.split().str.len().to_numpy()
+
+    def _encode_text(self, text: str) -> torch.Tensor:
         encoded_text = self.tokenizer(
             text,
-            padding="max_length",
             max_length=self.max_length,
             truncation=True,
             return_tensors='pt'
         )
-        return (
-            encoded_text["input_ids"].squeeze(),
-            encoded_text["attention_mask"].squeeze()
-        )
-
-    def _mask_label_padding(self, labels: torch.Tensor) -> torch.Tensor:
-        labels[labels == self.tokenizer.pad_token_id] = self.pad_mask_id
-        return labels
+        return encoded_text["input_ids"][0]
 
 
 class QAEvalDataset(torch.utils.data.Dataset):
-    def __init__(self, data: datasets.Dataset, max_length: int, tokenizer: AutoTokenizer) -> None:
-        self.data = pd.DataFrame(data)
+    # How each example is turned into a pair for the current epoch.
+    POSITIVE, SHUFFLE, COPY_ENTITY, ENTITY_ANSWER = range(4)
+
+    def __init__(
+        self,
+        data: datasets.Dataset,
+        max_length: int,
+        tokenizer: AutoTokenizer,
+        token_cache_dir: Optional[str] = None,
+        seed: int = 0
+    ) -> None:
+        self.questions = list(data["question"])
+        self.answers = list(data["answer"])
         self.max_length = max_length
-        self.transforms = [self.shuffle, self.corrupt]
         self.hf_tokenizer = tokenizer
-        self.spacy_tokenizer = en_core_web_sm.load()
+        self.seed = seed
+        self.fingerprint = _fingerprint(self.questions + self.answers)
+        # NER runs once over all questions instead of once per negative in __getitem__.
+        self.entities = build_entity_spans(self.questions, load_ner(), token_cache_dir, "qa-eval-entities")
+        self.answer_codes, unique_answers = pd.factorize(pd.Series(self.answers))
+        if len(unique_answers) < 2:
+            raise ValueError("QAEvalDataset needs at least two distinct answers to sample negatives from")
+        self.question_cache = None
+        if token_cache_dir is not None:
+            # Questions and answers are cached separately since negatives pair them up
+            # differently; only corrupted questions still go through the tokenizer. They are
+            # stored untruncated because pair truncation depends on both full lengths.
+            self.question_cache = build_token_cache(
+                data["question"], tokenizer, None, token_cache_dir, "qa-eval-question",
+                add_special_tokens=False
+            )
+            self.answer_cache = build_token_cache(
+                data["answer"], tokenizer, None, token_cache_dir, "qa-eval-answer",
+                add_special_tokens=False
+            )
+            self.question_index = {q: i for i, q in enumerate(self.questions)}
+            self.answer_index = {a: i for i, a in enumerate(self.answers)}
+        self.set_epoch(0)
 
     def __len__(self) -> int:
-        return len(self.data)
+        return len(self.questions)
+
+    @property
+    def lengths(self) -> np.ndarray:
+        if self.question_cache is not None:
+            return self.question_cache.lengths + self.answer_cache.lengths
+        return np.array([len(q.split()) + len(a.split()) for q, a in zip(self.questions, self.answers)])
+
+    def set_epoch(self, epoch: int) -> None:
+        """Draws this epoch's labels and negatives for every example at once. The draw only depends
+        on the seed and the epoch, so runs (and DataLoader workers) see the same pairs."""
+        rng = np.random.default_rng([self.seed, epoch])
+        n = len(self)
+        counts = self.entities.counts
+        labels = rng.integers(0, 2, n)
+        corrupt = rng.integers(0, 2, n).astype(bool)
+
+        kinds = np.full(n, self.POSITIVE)
+        negative = labels == 0
+        kinds[negative & ~corrupt] = self.SHUFFLE
+        # Corrupting a question without entities falls back to shuffling, as before.
+        kinds[negative & corrupt & (counts == 0)] = self.SHUFFLE
+        kinds[negative & corrupt & (counts == 1)] = self.ENTITY_ANSWER
+        kinds[negative & corrupt & (counts > 1)] = self.COPY_ENTITY
+
+        # Another example's answer, resampled wherever the answer text happens to be the same.
+        other_answers = rng.integers(0, n, n)
+        same = self.answer_codes[other_answers] == self.answer_codes
+        while same.any():
+            other_answers[same] = rng.integers(0, n, int(same.sum()))
+            same = self.answer_codes[other_answers] == self.answer_codes
+
+        self.epoch = epoch
+        self.pair_labels = labels
+        self.pair_kinds = kinds
+        self.pair_answers = other_answers
+        self.pair_entities = (rng.random(n) * np.maximum(counts, 1)).astype(np.int64)
 
     def __getitem__(self, index: int) -> Mapping[str, torch.Tensor]:
-        question, answer = self.data.loc[index]
-        label = random.choice([0, 1])
-        if label == 0:
-            question, answer = random.choice(self.transforms)(question, answer)
+        question, answer, label = self.get_pair(index)
+        return self._encode_pair(question, answer, label)
+
+    def get_pair(self, index: int) -> Tuple[str, str, int]:
+        question, answer = self.questions[index], self.answers[index]
+        kind = self.pair_kinds[index]
+        if kind == self.SHUFFLE:
+            answer = self.answers[self.pair_answers[index]]
+        elif kind == self.ENTITY_ANSWER:
+            start, end = self.entities[index][0]
+            answer = question[start:end]
+        elif kind == self.COPY_ENTITY:
+            # Every entity in the question is replaced with one of them.
+            entities = [question[start:end] for start, end in self.entities[index]]
+            copy_entity = entities[self.pair_entities[index]]
+            for entity in entities:
+                question = question.replace(entity, copy_entity)
+        return question, answer, int(self.pair_labels[index])
+
+    def _encode_pair(self, question: str, answer: str, label: int) -> Mapping[str, torch.Tensor]:
+        if self.question_cache is not None:
+            return self._encode_cached_pair(question, answer, label)
         encoded_data = self.hf_tokenizer(
             text=question,
             text_pair=answer,
-            padding="max_length",
             max_length=self.max_length,
             truncation=True,
             return_tensors="pt"
         )
         return {
-            "input_ids": encoded_data["input_ids"].squeeze(),
-            "attention_mask": encoded_data["attention_mask"].squeeze(),
-            "token_type_ids": encoded_data["token_type_ids"].squeeze(),
+            "input_ids": encoded_data["input_ids"][0],
+            "attention_mask": encoded_data["attention_mask"][0],
+            "token_type_ids": encoded_data["token_type_ids"][0],
             "labels": torch.tensor(label, dtype=torch.int64)
         }
 
-    def shuffle(self, question: str, answer: str) -> Tuple[str, str]:
-        shuffled_answer = answer
-        while shuffled_answer == answer:
-            shuffled_answer = self.data.sample(1)['answer'].item()
-        return question, shuffled_answer
-
-    def corrupt(self, question: str, answer: str) -> Tuple[str, str]:
-        doc = self.spacy_tokenizer(question)
-        if len(doc.ents) > 1:
-            copy_ent = str(random.choice(doc.ents))
-            for ent in doc.ents:
-                question = question.replace(str(ent), copy_ent)
-        elif len(doc.ents) == 1:
-            answer = str(doc.ents[0])
+    def _encode_cached_pair(self, question: str, answer: str, label: int) -> Mapping[str, torch.Tensor]:
+        question_ids = self._cached_ids(question, self.question_index, self.question_cache)
+        answer_ids = self._cached_ids(answer, self.answer_index, self.answer_cache)
+        question_ids, answer_ids = self._truncate_pair(question_ids, answer_ids)
+        tokenizer = self.hf_tokenizer
+        input_ids = torch.tensor(tokenizer.build_inputs_with_special_tokens(question_ids, answer_ids))
+        token_type_ids = tokenizer.create_token_type_ids_from_sequences(question_ids, answer_ids)
+        return {
+            "input_ids": input_ids,
+            "attention_mask": torch.ones_like(input_ids),
+            "token_type_ids": torch.tensor(token_type_ids),
+            "labels": torch.tensor(label, dtype=torch.int64)
+        }
+
+    def _truncate_pair(self, question_ids: list, answer_ids: list) -> Tuple[list, list]:
+        # Matches the "longest_first" truncation the tokenizer applies to text pairs. The Rust
+        # (fast) tokenizers share the budget as evenly as possible, the longer side taking the
+        # odd token; the Python ones remove tokens from the longer side first.
+        budget = self.max_length - self.hf_tokenizer.num_special_tokens_to_add(pair=True)
+        n_question, n_answer = len(question_ids), len(answer_ids)
+        if n_question + n_answer <= budget:
+            return question_ids, answer_ids
+        if not self.hf_tokenizer.is_fast:
+            question_ids, answer_ids, _ = self.hf_tokenizer.truncate_sequences(
+                question_ids,
+                pair_ids=answer_ids,
+                num_tokens_to_remove=n_question + n_answer - budget,
+                truncation_strategy="longest_first"
+            )
+            return question_ids, answer_ids
+        if min(n_question, n_answer) > budget // 2:
+            shorter = budget // 2
+            n_question, n_answer = (budget - shorter, shorter) if n_question > n_answer else (shorter, budget - shorter)
+        elif n_question < n_answer:
+            n_answer = budget - n_question
         else:
-            question, answer = self.shuffle(question, answer)
-        return question, answer
+            n_question = budget - n_answer
+        return question_ids[:n_question], answer_ids[:n_answer]
+
+    def _cached_ids(self, text: str, index: Mapping[str, int], cache: Sequence[np.ndarray]) -> list:
+        if text in index:
+            return cache[index[text]].tolist()
+        return self.hf_tokenizer(text, add_special_tokens=False)["input_ids"]
@@ -0,0 +1,357 @@
+#distillation.py
+
+import hashlib
+import json
+import os
+import time
+import numpy as np
+import torch
+import torch.nn.functional as F
+from scipy.stats import spearmanr
+from torch.utils.data import DataLoader
+from tqdm import tqdm
+from transformers import AutoTokenizer, PreTrainedModel
+from typing import Any, List, Mapping, Tuple
+
+from batching import PaddingCollator
+from dataset import QAEvalDataset, QGDataset
+from utils import cache_meta_matches, write_array_cache
+
+TEACHER_PREFIX = "teacher_"
+CACHE_VERSION = 1
+
+
+def distillation_loss(
+    student_logits: torch.Tensor,
+    teacher: Mapping[str, torch.Tensor],
+    temperature: float
+) -> torch.Tensor:
+    if "teacher_topk_indices" in teacher:
+        # Token level: cross-entropy against the teacher's renormalised top-k distribution
+        # at every label position, which equals the KL divergence up to a constant.
+        student_log_probs = F.log_softmax(student_logits / temperature, dim=-1)
+        student_topk = student_log_probs.gather(-1, teacher["teacher_topk_indices"])
+        teacher_probs = F.softmax(teacher["teacher_topk_values"].float() / temperature, dim=-1)
+        per_token = -(teacher_probs * student_topk).sum(-1)
+        mask = teacher["teacher_mask"]
+        loss = (per_token * mask).sum() / mask.sum().clamp(min=1)
+    else:
+        loss = F.kl_div(
+            F.log_softmax(student_logits / temperature, dim=-1),
+            F.log_softmax(teacher["teacher_logits"].float() / temperature, dim=-1),
+            log_target=True,
+            reduction="batchmean"
+        )
+    return loss * temperature ** 2
+
+
+def checkpoint_fingerprint(teacher: PreTrainedModel, teacher_name: str) -> str:
+    """Identifies the teacher's weights: the Hub commit it was resolved to, or for a local
+    checkpoint the name, size and modification time of every file in its directory, so a
+    retrained checkpoint saved to the same path does not reuse the old teacher's outputs."""
+    commit = getattr(teacher.config, "_commit_hash", None)
+    if not os.path.isdir(teacher_name):
+        return commit or teacher_name
+    paths = sorted(
+        os.path.relpath(os.path.join(root, file_name), teacher_name)
+        for root, _, files in os.walk(teacher_name)
+        for file_name in files
+    )
+    digest = hashlib.sha1()
+    for path in paths:
+        stat = os.stat(os.path.join(teacher_name, path))
+        digest.update(f"{path}\0{stat.st_size}\0{stat.st_mtime_ns}\0".encode("utf-8"))
+    return digest.hexdigest()
+
+
+def load_teacher_cache(cache_dir: str) -> Mapping[str, Any]:
+    cache = {}
+    for file_name in os.listdir(cache_dir):
+        if file_name.endswith(".npy"):
+            cache[file_name[:-4]] = np.load(os.path.join(cache_dir, file_name), mmap_mode="r")
+    with open(os.path.join(cache_dir, "meta.json")) as f:
+        cache["meta"] = json.load(f)
+    return cache
+
+
+@torch.no_grad()
+def build_qg_teacher_cache(
+    dataset: QGDataset,
+    teacher: PreTrainedModel,
+    teacher_name: str,
+    cache_dir: str,
+    batch_size: int,
+    device: str,
+    top_k: int = 20,
+    targets: str = "gold"
+) -> Mapping[str, Any]:
+    """Runs the teacher once over the dataset and stores its top-k logits at every label position.
+    With targets="gold" the teacher is teacher-forced on the reference questions; with "teacher"
+    the teacher's own greedy questions are stored and become the student's labels."""
+    meta = {
+        "version": CACHE_VERSION,
+        "teacher": teacher_name,
+        "teacher_fingerprint": checkpoint_fingerprint(teacher, teacher_name),
+        "targets": targets,
+        "top_k": top_k,
+        "examples": len(dataset),
+        "fingerprint": dataset.fingerprint,
+        "max_length": dataset.max_length,
+        "vocab_size": len(dataset.tokenizer),
+    }
+    if cache_meta_matches(cache_dir, meta):
+        return load_teacher_cache(cache_dir)
+
+    teacher.to(device)
+    teacher.eval()
+    loader = DataLoader(
+        dataset,
+        batch_size=batch_size,
+        shuffle=False,
+        collate_fn=PaddingCollator(dataset.tokenizer.pad_token_id, dataset.pad_mask_id)
+    )
+    values, indices, label_ids, lengths = [], [], [], []
+    for data in tqdm(loader, desc="teacher"):
+        data = {key: value.to(device) for key, value in data.items()}
+        labels = data["labels"]
+        if targets == "teacher":
+            generated = teacher.generate(
+                input_ids=data["input_ids"], attention_mask=data["attention_mask"], max_length=64
+            )[:, 1:]
+            labels = generated.masked_fill(generated == dataset.tokenizer.pad_token_id, dataset.pad_mask_id)
+        logits = teacher(
+            input_ids=data["input_ids"], attention_mask=data["attention_mask"], labels=labels
+        ).logits.float()
+        # Checkpoints may carry padded embedding rows beyond the tokenizer's vocabulary,
+        # which the student (resized to the tokenizer) does not have.
+        logits[..., len(dataset.tokenizer):] = float("-inf")
+        topk = logits.topk(top_k, dim=-1)
+        for i in range(labels.shape[0]):
+            n = int((labels[i] != dataset.pad_mask_id).sum())
+            values.append(topk.values[i, :n].cpu().numpy().astype(np.float16))
+            indices.append(topk.indices[i, :n].cpu().numpy().astype(np.int32))
+            label_ids.append(labels[i, :n].cpu().numpy().astype(np.int32))
+            lengths.append(n)
+
+    arrays = {
+        "offsets": np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64),
+        "topk_values": np.concatenate(values),
+        "topk_indices": np.concatenate(indices),
+    }
+    if targets == "teacher":
+        arrays["label_ids"] = np.concatenate(label_ids)
+    write_array_cache(cache_dir, meta, arrays)
+    return load_teacher_cache(cache_dir)
+
+
+@torch.no_grad()
+def build_qa_eval_teacher_cache(
+    dataset: QAEvalDataset,
+    teacher: PreTrainedModel,
+    teacher_name: str,
+    teacher_tokenizer: AutoTokenizer,
+    cache_dir: str,
+    batch_size: int,
+    device: str
+) -> Mapping[str, Any]:
+    """Stores the teacher's scores for the dataset's epoch 0 pairs, which are fixed by its seed.
+    Single-logit evaluators (like the one served by QAEvaluator) are stored as two-class logits
+    [0, s], which gives the same probability under a softmax as sigmoid(s)."""
+    meta = {
+        "version": CACHE_VERSION,
+        "teacher": teacher_name,
+        "teacher_fingerprint": checkpoint_fingerprint(teacher, teacher_name),
+        "seed": dataset.seed,
+        "examples": len(dataset),
+        "fingerprint": dataset.fingerprint,
+        "max_length": dataset.max_length,
+    }
+    if cache_meta_matches(cache_dir, meta):
+        return load_qa_eval_teacher_cache(cache_dir)
+
+    dataset.set_epoch(0)
+    pairs = [dataset.get_pair(i) for i in tqdm(range(len(dataset)), desc="pairs")]
+    teacher.to(device)
+    teacher.eval()
+    teacher_logits = []
+    for start in tqdm(range(0, len(pairs), batch_size), desc="teacher"):
+        batch = pairs[start:start + batch_size]
+        encoded = teacher_tokenizer(
+            [q for q, _, _ in batch],
+            [a for _, a, _ in batch],
+            padding=True,
+            truncation=True,
+            max_length=dataset.max_length,
+            return_tensors="pt"
+        ).to(device)
+        logits = teacher(**encoded).logits.float()
+        if logits.shape[-1] == 1:
+            logits = torch.cat([torch.zeros_like(logits), logits], dim=-1)
+        teacher_logits.append(logits.cpu().numpy())
+
+    arrays = {
+        "labels": np.array([label for _, _, label in pairs], dtype=np.int64),
+        "teacher_logits": np.concatenate(teacher_logits),
+    }
+    text = {"questions": [q for q, _, _ in pairs], "answers": [a for _, a, _ in pairs]}
+    write_array_cache(cache_dir, meta, arrays, {"pairs": text})
+    return load_qa_eval_teacher_cache(cache_dir)
+
+
+def load_qa_eval_teacher_cache(cache_dir: str) -> Mapping[str, Any]:
+    cache = load_teacher_cache(cache_dir)
+    with open(os.path.join(cache_dir, "pairs.json")) as f:
+        cache.update(json.load(f))
+    return cache
+
+
+class DistillQGDataset(torch.utils.data.Dataset):
+    def __init__(self, dataset: QGDataset, cache: Mapping[str, Any]) -> None:
+        self.dataset = dataset
+        self.cache = cache
+
+    def __len__(self) -> int:
+        return len(self.dataset)
+
+    @property
+    def lengths(self) -> np.ndarray:
+        return self.dataset.lengths
+
+    def __getitem__(self, index: int) -> Mapping[str, torch.Tensor]:
+        # Teacher outputs cover exactly the label positions, so they stay aligned with the
+        # labels when PaddingCollator pads both to the batch maximum.
+        item = self.dataset[index]
+        start, end = self.cache["offsets"][index], self.cache["offsets"][index + 1]
+        if "label_ids" in self.cache:
+            item["labels"] = torch.from_numpy(self.cache["label_ids"][start:end].astype(np.int64))
+        item["teacher_topk_values"] = torch.from_numpy(self.cache["topk_values"][start:end].astype(np.float32))
+        item["teacher_topk_indices"] = torch.from_numpy(self.cache["topk_indices"][start:end].astype(np.int64))
+        item["teacher_mask"] = torch.ones(end - start)
+        return item
+
+
+class DistillQAEvalDataset(QAEvalDataset):
+    # Serves the fixed pairs the teacher scored instead of sampling new negatives,
+    # so it needs neither the entity spans nor spaCy.
+    def __init__(self, cache: Mapping[str, Any], max_length: int, tokenizer: AutoTokenizer) -> None:
+        self.cache = cache
+        self.max_length = max_length
+        self.hf_tokenizer = tokenizer
+        self.question_cache = None
+
+    def __len__(self) -> int:
+        return len(self.cache["labels"])
+
+    @property
+    def lengths(self) -> np.ndarray:
+        return np.array([
+            len(q.split()) + len(a.split()) for q, a in zip(self.cache["questions"], self.cache["answers"])
+        ])
+
+    def set_epoch(self, epoch: int) -> None:
+        self.epoch = epoch
+
+    def get_pair(self, index: int) -> Tuple[str, str, int]:
+        return self.cache["questions"][index], self.cache["answers"][index], int(self.cache["labels"][index])
+
+    def __getitem__(self, index: int) -> Mapping[str, torch.Tensor]:
+        item = super().__getitem__(index)
+        item["teacher_logits"] = torch.from_numpy(np.array(self.cache["teacher_logits"][index]))
+        return item
+
+
+def _time_per_example(fn: Any, examples: List[Any]) -> Tuple[List[Any], float]:
+    outputs = []
+    start = time.perf_counter()
+    for example in examples:
+        outputs.append(fn(example))
+    return outputs, (time.perf_counter() - start) * 1000 / max(len(examples), 1)
+
+
+def _token_f1(prediction: str, reference: str) -> float:
+    prediction_tokens, reference_tokens = prediction.split(), reference.split()
+    if not prediction_tokens and not reference_tokens:
+        return 1.0
+    common = sum(min(prediction_tokens.count(t), reference_tokens.count(t)) for t in set(prediction_tokens))
+    if common == 0:
+        return 0.0
+    precision = common / len(prediction_tokens)
+    recall = common / len(reference_tokens)
+    return 2 * precision * recall / (precision + recall)
+
+
+@torch.no_grad()
+def qg_distillation_report(
+    teacher: PreTrainedModel,
+    student: PreTrainedModel,
+    tokenizer: AutoTokenizer,
+    texts: List[str],
+    device: str,
+    max_length: int
+) -> Mapping[str, Any]:
+    def generator(model: PreTrainedModel) -> Any:
+        model.to(device)
+        model.eval()
+
+        def generate(text: str) -> str:
+            encoded = tokenizer(text, truncation=True, max_length=max_length, return_tensors="pt").to(device)
+            output = model.generate(**encoded, max_length=64)
+            return tokenizer.decode(output[0], skip_special_tokens=True)
+        return generate
+
+    teacher_questions, teacher_ms = _time_per_example(generator(teacher), texts)
+    student_questions, student_ms = _time_per_example(generator(student), texts)
+    return {
+        "examples": len(texts),
+        "device": device,
+        "teacher_ms_per_example": teacher_ms,
+        "student_ms_per_example": student_ms,
+        "speedup": teacher_ms / max(student_ms, 1e-9),
+        "exact_match": float(np.mean([s == t for s, t in zip(student_questions, teacher_questions)])),
+        "token_f1": float(np.mean([_token_f1(s, t) for s, t in zip(student_questions, teacher_questions)])),
+    }
+
+
+@torch.no_grad()
+def qa_eval_distillation_report(
+    teacher: PreTrainedModel,
+    teacher_tokenizer: AutoTokenizer,
+    student: PreTrainedModel,
+    student_tokenizer: AutoTokenizer,
+    pairs: List[Tuple[str, str]],
+    device: str,
+    max_length: int
+) -> Mapping[str, Any]:
+    def scorer(model: PreTrainedModel, tokenizer: AutoTokenizer) -> Any:
+        model.to(device)
+        model.eval()
+
+        def score(pair: Tuple[str, str]) -> float:
+            encoded = tokenizer(
+                pair[0], pair[1], truncation=True, max_length=max_length, return_tensors="pt"
+            ).to(device)
+            logits = model(**encoded).logits[0].float()
+            return float(logits[1] - logits[0]) if logits.shape[-1] == 2 else float(logits[0])
+        return score
+
+    teacher_scores, teacher_ms = _time_per_example(scorer(teacher, teacher_tokenizer), pairs)
+    student_scores, student_ms = _time_per_example(scorer(student, student_tokenizer), pairs)
+    teacher_scores, student_scores = np.array(teacher_scores), np.array(student_scores)
+    return {
+        "examples": len(pairs),
+        "device": device,
+        "teacher_ms_per_example": teacher_ms,
+        "student_ms_per_example": student_ms,
+        "speedup": teacher_ms / max(student_ms, 1e-9),
+        "label_agreement": float(np.mean((teacher_scores > 0) == (student_scores > 0))),
+        "spearman": float(spearmanr(teacher_scores, student_scores).correlation),
+    }
+
+
+def write_report(report: Mapping[str, Any], save_dir: str, name: str = "distillation_report.json") -> str:
+    os.makedirs(save_dir, exist_ok=True)
+    path = os.path.join(save_dir, name)
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2)
+    print(json.dumps(report, indent=2))
+    return path
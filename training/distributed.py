@@ -0,0 +1,79 @@
+#distributed.py
+
+import contextlib
+import os
+import torch
+import torch.distributed as dist
+from typing import Iterator, List
+
+from utils import AverageMeter
+
+
+def init_distributed(device: str) -> str:
+    """Joins the process group when started by launch.py or torchrun (which set WORLD_SIZE, RANK
+    and LOCAL_RANK) and returns the device this rank should use. CPU ranks use the gloo backend
+    and split the node's cores between them instead of each starting a thread per core."""
+    world_size = int(os.environ.get("WORLD_SIZE", 1))
+    if world_size == 1 or is_distributed():
+        return device
+    local_rank = int(os.environ["LOCAL_RANK"])
+    if device.startswith("cuda"):
+        dist.init_process_group("nccl")
+        torch.cuda.set_device(local_rank)
+        return f"cuda:{local_rank}"
+    dist.init_process_group("gloo")
+    local_world_size = int(os.environ.get("LOCAL_WORLD_SIZE", world_size))
+    torch.set_num_threads(max(1, (os.cpu_count() or 1) // local_world_size))
+    return device
+
+
+def is_distributed() -> bool:
+    return dist.is_available() and dist.is_initialized()
+
+
+def get_rank() -> int:
+    return dist.get_rank() if is_distributed() else 0
+
+
+def get_world_size() -> int:
+    return dist.get_world_size() if is_distributed() else 1
+
+
+def is_main_process() -> bool:
+    return get_rank() == 0
+
+
+@contextlib.contextmanager
+def main_process_first() -> Iterator[None]:
+    # Rank 0 builds the on-disk caches while the other ranks wait, then they load them.
+    if not is_main_process():
+        dist.barrier()
+    yield
+    if is_main_process() and is_distributed():
+        dist.barrier()
+
+
+def _reduce_device() -> torch.device:
+    # nccl only reduces CUDA tensors; gloo takes them from the CPU.
+    return torch.device("cuda", torch.cuda.current_device()) if dist.get_backend() == "nccl" else torch.device("cpu")
+
+
+def all_reduce_sum(values: List[float]) -> List[float]:
+    if not is_distributed():
+        return values
+    tensor = torch.tensor(values, dtype=torch.float64, device=_reduce_device())
+    dist.all_reduce(tensor)
+    return tensor.tolist()
+
+
+def all_reduce_max(value: float) -> float:
+    if not is_distributed():
+        return value
+    tensor = torch.tensor([value], dtype=torch.float64, device=_reduce_device())
+    dist.all_reduce(tensor, op=dist.ReduceOp.MAX)
+    return tensor.item()
+
+
+def reduce_meter(meter: AverageMeter) -> float:
+    total, count = all_reduce_sum([meter.sum, meter.count])
+    return total / max(count, 1)
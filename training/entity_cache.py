@@ -0,0 +1,82 @@
+#entity_cache.py
+
+import hashlib
+import json
+import os
+import numpy as np
+from tqdm import tqdm
+from spacy.language import Language
+from typing import List, Mapping, Optional
+import en_core_web_sm
+
+from token_cache import _fingerprint
+from utils import cache_meta_matches, write_array_cache
+
+CACHE_VERSION = 1
+
+
+class EntitySpans:
+    """Character spans of the named entities found in each text, stored back to back like
+    TokenCache. Loaded from disk the arrays are memory-mapped."""
+
+    def __init__(self, arrays: Mapping[str, np.ndarray]) -> None:
+        self.spans = arrays["spans"]
+        self.offsets = arrays["offsets"]
+
+    @classmethod
+    def load(cls, path: str) -> "EntitySpans":
+        return cls({
+            name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r") for name in ["spans", "offsets"]
+        })
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index: int) -> np.ndarray:
+        return self.spans[self.offsets[index]:self.offsets[index + 1]]
+
+    @property
+    def counts(self) -> np.ndarray:
+        return np.diff(self.offsets)
+
+
+def load_ner() -> Language:
+    # Only the entity recognizer is needed; the tagger, parser and lemmatizer would only add cost.
+    return en_core_web_sm.load(disable=["tagger", "parser", "attribute_ruler", "lemmatizer"])
+
+
+def extract_entities(texts: List[str], nlp: Language, batch_size: int = 256) -> Mapping[str, np.ndarray]:
+    spans, counts = [], []
+    for doc in tqdm(nlp.pipe(texts, batch_size=batch_size), total=len(texts), desc="entities"):
+        spans.extend((ent.start_char, ent.end_char) for ent in doc.ents)
+        counts.append(len(doc.ents))
+    return {
+        "spans": np.array(spans, dtype=np.int32).reshape(-1, 2),
+        "offsets": np.concatenate([[0], np.cumsum(counts)]).astype(np.int64),
+    }
+
+
+def build_entity_spans(
+    texts: List[str],
+    nlp: Language,
+    cache_dir: Optional[str] = None,
+    name: str = "entities",
+    batch_size: int = 256
+) -> EntitySpans:
+    """Runs NER over all texts in one nlp.pipe pass. With a cache_dir the spans are stored on disk,
+    keyed by the spaCy pipeline and the texts, and later runs load them instead."""
+    if cache_dir is None:
+        return EntitySpans(extract_entities(texts, nlp, batch_size))
+
+    meta = {
+        "version": CACHE_VERSION,
+        "name": name,
+        "pipeline": f"{nlp.meta['lang']}_{nlp.meta['name']}-{nlp.meta['version']}",
+        "texts": len(texts),
+        "fingerprint": _fingerprint(texts),
+    }
+    key = hashlib.sha1(json.dumps(meta, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+    path = os.path.join(cache_dir, f"{name}-{key}")
+    if not cache_meta_matches(path, meta):
+        write_array_cache(path, meta, extract_entities(texts, nlp, batch_size))
+    return EntitySpans.load(path)
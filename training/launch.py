@@ -0,0 +1,38 @@
+#launch.py
+import argparse
+from torch.distributed import run
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Runs a training script (qg_train.py, qa_eval_train.py, ...) data-parallel over several "
+        "processes. Example: python launch.py --nproc_per_node 4 qg_train.py --device cpu --epochs 3"
+    )
+    parser.add_argument("--master_addr", type=str, default="127.0.0.1", help="Address of node 0 when --nnodes > 1")
+    parser.add_argument("--master_port", type=int, default=29500)
+    parser.add_argument("--nnodes", type=int, default=1)
+    parser.add_argument("--node_rank", type=int, default=0)
+    parser.add_argument("--nproc_per_node", type=int, default=1)
+    parser.add_argument("script", type=str)
+    parser.add_argument("script_args", nargs=argparse.REMAINDER)
+    return parser.parse_args()
+
+
+def launch_args(args: argparse.Namespace) -> list:
+    launch = [f"--nproc_per_node={args.nproc_per_node}"]
+    if args.nnodes == 1:
+        launch.append("--standalone")
+    else:
+        launch += [
+            f"--nnodes={args.nnodes}",
+            f"--node_rank={args.node_rank}",
+            f"--master_addr={args.master_addr}",
+            f"--master_port={args.master_port}",
+        ]
+    return launch + [args.script] + args.script_args
+
+
+if __name__ == "__main__":
+    # torchrun sets RANK, WORLD_SIZE, LOCAL_RANK and LOCAL_WORLD_SIZE for every process it
+    # starts; the entry points pick them up through distributed.init_distributed.
+    run.main(launch_args(parse_args()))
@@ -0,0 +1,119 @@
+#padding_benchmark.py
+import argparse
+import json
+import time
+import datasets
+import torch
+from torch.optim import AdamW
+from torch.utils.data import DataLoader
+from transformers import AutoModelForSequenceClassification, AutoTokenizer
+from typing import Any, Mapping, Tuple
+
+from batching import LengthGroupedSampler, PaddingCollator
+from dataset import QAEvalDataset, QGDataset
+from qg_train import get_model, get_tokenizer
+
+MODES = ["max_length", "dynamic", "grouped"]
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Measures training throughput with static padding, dynamic padding and length-grouped batches."
+    )
+    parser.add_argument("--batch_size", type=int, default=8)
+    parser.add_argument("--device", type=str, default="cuda" if torch.cuda.is_available() else "cpu")
+    parser.add_argument("--examples", type=int, default=2048, help="Number of training examples to sample from")
+    parser.add_argument("--max_length", type=int, default=512)
+    parser.add_argument("--model", type=str, required=True)
+    parser.add_argument("--modes", type=str, nargs="+", default=MODES, choices=MODES)
+    parser.add_argument("--output", type=str, default=None, help="Write the results to this JSON file")
+    parser.add_argument("--pad_mask_id", type=int, default=-100)
+    parser.add_argument("--steps", type=int, default=50)
+    parser.add_argument("--task", type=str, required=True, choices=["qg", "qa_eval"])
+    parser.add_argument("--token_cache_dir", type=str, default=None)
+    parser.add_argument("--warmup_steps", type=int, default=5)
+    return parser.parse_args()
+
+
+def get_loader(dataset: torch.utils.data.Dataset, mode: str, args: argparse.Namespace, pad_token_id: int) -> DataLoader:
+    if mode == "max_length":
+        # What the Trainer did before: every batch padded to max_length.
+        collator = PaddingCollator(pad_token_id, args.pad_mask_id, pad_to_length=args.max_length)
+        return DataLoader(dataset, batch_size=args.batch_size, shuffle=True, collate_fn=collator)
+    collator = PaddingCollator(pad_token_id, args.pad_mask_id)
+    if mode == "grouped":
+        sampler = LengthGroupedSampler(dataset.lengths, args.batch_size)
+        return DataLoader(dataset, batch_sampler=sampler, collate_fn=collator)
+    return DataLoader(dataset, batch_size=args.batch_size, shuffle=True, collate_fn=collator)
+
+
+def benchmark(model: torch.nn.Module, loader: DataLoader, args: argparse.Namespace) -> Mapping[str, Any]:
+    model.train()
+    optimizer = AdamW(model.parameters(), lr=1e-5)
+    samples, tokens, padded_tokens = 0, 0, 0
+    batches = iter(loader)
+    for step in range(args.warmup_steps + args.steps):
+        if step == args.warmup_steps:
+            if torch.cuda.is_available():
+                torch.cuda.synchronize()
+            start = time.perf_counter()
+        try:
+            data = next(batches)
+        except StopIteration:
+            batches = iter(loader)
+            data = next(batches)
+        data = {key: value.to(args.device) for key, value in data.items()}
+        model(**data).loss.backward()
+        optimizer.step()
+        optimizer.zero_grad()
+        if step >= args.warmup_steps:
+            samples += data["input_ids"].shape[0]
+            tokens += int(data["attention_mask"].sum())
+            padded_tokens += data["attention_mask"].numel()
+    if torch.cuda.is_available():
+        torch.cuda.synchronize()
+    seconds = time.perf_counter() - start
+    return {
+        "samples_per_sec": samples / seconds,
+        "tokens_per_sec": tokens / seconds,
+        "padding_fraction": 1 - tokens / padded_tokens,
+        "mean_batch_length": padded_tokens / samples,
+    }
+
+
+def load_task(args: argparse.Namespace) -> Tuple[torch.utils.data.Dataset, torch.nn.Module, AutoTokenizer]:
+    # The first --examples training examples of the task, with the model and tokenizer to train.
+    if args.task == "qg":
+        tokenizer = get_tokenizer(args.model)
+        data = datasets.load_dataset("iarfmoose/question_generator")["train"]
+        data = data.select(range(min(args.examples, len(data))))
+        dataset = QGDataset(data, args.max_length, args.pad_mask_id, tokenizer, args.token_cache_dir)
+        model = get_model(args.model, args.device, tokenizer)
+    else:
+        tokenizer = AutoTokenizer.from_pretrained(args.model)
+        data = datasets.load_dataset("iarfmoose/qa_evaluator")["train"]
+        data = data.select(range(min(args.examples, len(data))))
+        dataset = QAEvalDataset(data, args.max_length, tokenizer, args.token_cache_dir)
+        model = AutoModelForSequenceClassification.from_pretrained(args.model).to(args.device)
+    return dataset, model, tokenizer
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    dataset, model, tokenizer = load_task(args)
+
+    results = {}
+    for mode in args.modes:
+        torch.manual_seed(0)
+        results[mode] = benchmark(model, get_loader(dataset, mode, args, tokenizer.pad_token_id), args)
+        print(
+            f"{mode}: {results[mode]['samples_per_sec']:.1f} samples/s, "
+            f"{results[mode]['tokens_per_sec']:.1f} tokens/s, {results[mode]['padding_fraction']:.1%} padding"
+        )
+    if "max_length" in results:
+        for mode in results:
+            results[mode]["speedup"] = results[mode]["samples_per_sec"] / results["max_length"]["samples_per_sec"]
+    print(json.dumps(results, indent=2))
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
@@ -0,0 +1,50 @@
+#preprocess.py
+import argparse
+import datasets
+from transformers import AutoTokenizer
+
+from entity_cache import build_entity_spans, load_ner
+from qg_train import get_tokenizer
+from token_cache import build_token_cache
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Tokenizes a training dataset (and finds the entities in QA evaluator questions) once "
+        "into the memory-mapped caches used by --token_cache_dir."
+    )
+    parser.add_argument("--max_length", type=int, default=512)
+    parser.add_argument("--model", type=str, required=True, help="Checkpoint whose tokenizer is used")
+    parser.add_argument("--task", type=str, required=True, choices=["qg", "qa_eval"])
+    parser.add_argument("--token_cache_dir", type=str, required=True)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.task == "qg":
+        tokenizer = get_tokenizer(args.model)
+        dataset = datasets.load_dataset("iarfmoose/question_generator")
+        fields = [("text", "qg-text", True), ("question", "qg-question", True)]
+    else:
+        tokenizer = AutoTokenizer.from_pretrained(args.model)
+        dataset = datasets.load_dataset("iarfmoose/qa_evaluator")
+        nlp = load_ner()
+        # Must match QAEvalDataset, which caches questions and answers untruncated.
+        fields = [("question", "qa-eval-question", False), ("answer", "qa-eval-answer", False)]
+
+    for split in ["train", "validation"]:
+        for field, name, add_special_tokens in fields:
+            cache = build_token_cache(
+                dataset[split][field],
+                tokenizer,
+                args.max_length if args.task == "qg" else None,
+                args.token_cache_dir,
+                name,
+                add_special_tokens=add_special_tokens
+            )
+            print(f"{split}/{field}: {len(cache)} texts, {int(cache.lengths.sum())} tokens -> {cache.path}")
+        if args.task == "qa_eval":
+            # The spans QAEvalDataset corrupts questions with when building negatives.
+            entities = build_entity_spans(dataset[split]["question"], nlp, args.token_cache_dir, "qa-eval-entities")
+            print(f"{split}/question: {int(entities.counts.sum())} entities")
@@ -0,0 +1,110 @@
+#profiling.py
+
+import contextlib
+import json
+import os
+import resource
+import time
+import torch
+from typing import Any, Iterator, List, Mapping, Optional, Tuple
+
+from distributed import all_reduce_max, all_reduce_sum, get_rank, get_world_size
+
+PHASES = ["data", "h2d", "forward", "backward", "optimizer"]
+
+
+class StepTimer:
+    """Accumulates wall time per phase of a training step. CUDA work is asynchronous, so on GPUs
+    each phase synchronizes before it is timed; on CPU the timings are free."""
+
+    def __init__(self, device: str) -> None:
+        self.sync = torch.device(device).type == "cuda"
+        self.reset()
+
+    def reset(self) -> None:
+        self.totals = {phase: 0.0 for phase in PHASES}
+        self.steps = 0
+
+    @contextlib.contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        yield
+        if self.sync:
+            torch.cuda.synchronize()
+        self.totals[name] += time.perf_counter() - start
+
+    def summary(self) -> Mapping[str, Any]:
+        # Averaged over ranks; every rank runs the same number of steps.
+        totals = [total / get_world_size() for total in all_reduce_sum(list(self.totals.values()))]
+        step_time = sum(totals)
+        return {
+            "step_time_ms": {
+                phase: 1000 * total / max(self.steps, 1) for phase, total in zip(PHASES, totals)
+            },
+            "step_time_fraction": {
+                phase: total / step_time if step_time else 0.0 for phase, total in zip(PHASES, totals)
+            },
+        }
+
+
+def reset_peak_memory(device: str) -> None:
+    if torch.device(device).type == "cuda":
+        torch.cuda.reset_peak_memory_stats(device)
+
+
+def peak_memory_mb(device: str) -> Mapping[str, float]:
+    # Peak over all ranks. ru_maxrss is in kilobytes on Linux and covers the whole process
+    # lifetime; CUDA peaks are reset every epoch.
+    memory = {"peak_rss_mb": all_reduce_max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024)}
+    if torch.device(device).type == "cuda":
+        memory["peak_cuda_allocated_mb"] = all_reduce_max(torch.cuda.max_memory_allocated(device) / 2**20)
+    return memory
+
+
+class ProfilerWindow:
+    """Records a torch.profiler trace for training steps [start, end) (counted in batches across
+    epochs) and writes a Chrome trace plus an operator table for each rank to output_dir."""
+
+    def __init__(self, steps: Optional[Tuple[int, int]], output_dir: str, device: str) -> None:
+        self.start, self.end = steps if steps is not None else (None, None)
+        self.output_dir = output_dir
+        self.activities = [torch.profiler.ProfilerActivity.CPU]
+        if torch.device(device).type == "cuda":
+            self.activities.append(torch.profiler.ProfilerActivity.CUDA)
+        self.profiler = None
+        # Time spent exporting traces, which the Trainer leaves out of its throughput numbers.
+        self.export_seconds = 0.0
+
+    def step(self, step: int) -> None:
+        # Called before each batch, including the first batch after the window.
+        if step == self.start:
+            self.profiler = torch.profiler.profile(
+                activities=self.activities, record_shapes=True, profile_memory=True
+            )
+            self.profiler.__enter__()
+        elif step == self.end:
+            self.close()
+
+    def close(self) -> None:
+        if self.profiler is None:
+            return
+        start = time.perf_counter()
+        profiler, self.profiler = self.profiler, None
+        profiler.__exit__(None, None, None)
+        os.makedirs(self.output_dir, exist_ok=True)
+        name = f"trace-rank{get_rank()}-steps{self.start}-{self.end}"
+        profiler.export_chrome_trace(os.path.join(self.output_dir, f"{name}.json"))
+        with open(os.path.join(self.output_dir, f"{name}.txt"), "w") as f:
+            f.write(profiler.key_averages().table(sort_by="self_cpu_time_total", row_limit=50))
+        self.export_seconds += time.perf_counter() - start
+
+    def overlaps(self, first_step: int, last_step: int) -> bool:
+        return self.start is not None and self.start <= last_step and first_step < self.end
+
+
+def write_summary(summary: List[Mapping[str, Any]], output_dir: str, name: str = "training_profile.json") -> str:
+    os.makedirs(output_dir, exist_ok=True)
+    path = os.path.join(output_dir, name)
+    with open(path, "w") as f:
+        json.dump(summary, f, indent=4)
+    return path
@@ -0,0 +1,137 @@
+#qa_eval_distill.py
+import argparse
+import datasets
+import torch
+from transformers import AutoModelForSequenceClassification, AutoTokenizer
+
+from dataset import QAEvalDataset
+from distillation import (
+    DistillQAEvalDataset,
+    build_qa_eval_teacher_cache,
+    qa_eval_distillation_report,
+    write_report
+)
+from distributed import init_distributed, is_main_process, main_process_first
+from trainer import Trainer
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--alpha", type=float, default=0.5, help="Weight of the soft (teacher) loss")
+    parser.add_argument("--cache_dir", type=str, default="./distillation-cache/qa_eval")
+    parser.add_argument("--compile", dest="compile", action="store_true", default=False)
+    parser.add_argument("--dataloader_workers", type=int, default=0)
+    parser.add_argument("--device", type=str, default="cuda" if torch.cuda.is_available() else "cpu")
+    parser.add_argument("--epochs", type=int, default=20)
+    parser.add_argument("--gradient_accumulation_steps", type=int, default=1)
+    parser.add_argument(
+        "--group_by_length",
+        dest="group_by_length",
+        action="store_true",
+        default=False,
+        help="Batch examples of similar length together to minimise padding",
+    )
+    parser.add_argument("--keep_checkpoints", type=int, default=2, help="Number of epoch checkpoints to keep")
+    parser.add_argument("--learning_rate", type=float, default=1e-3)
+    parser.add_argument("--max_grad_norm", type=float, default=None)
+    parser.add_argument("--max_length", type=int, default=512)
+    parser.add_argument("--pin_memory", dest="pin_memory", action="store_true", default=False)
+    parser.add_argument("--precision", type=str, default="fp32", choices=["fp32", "bf16"])
+    parser.add_argument(
+        "--profile_steps",
+        type=int,
+        nargs=2,
+        default=None,
+        metavar=("START", "END"),
+        help="Record a torch.profiler trace of training steps [START, END) next to the checkpoints",
+    )
+    parser.add_argument("--report_device", type=str, default="cpu")
+    parser.add_argument("--report_examples", type=int, default=200)
+    parser.add_argument(
+        "--resume",
+        dest="resume",
+        action="store_true",
+        default=False,
+        help="Continue from the latest checkpoint in save_dir/checkpoints",
+    )
+    parser.add_argument("--save_dir", type=str, default="./bert-small-qa-evaluator")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--student_model", type=str, default="bert-base-cased")
+    parser.add_argument("--teacher_batch_size", type=int, default=64)
+    parser.add_argument("--teacher_model", type=str, required=True)
+    parser.add_argument("--temperature", type=float, default=2.0)
+    parser.add_argument(
+        "--token_cache_dir",
+        type=str,
+        default=None,
+        help="Pre-tokenize the datasets once into memory-mapped caches under this directory",
+    )
+    parser.add_argument("--train_batch_size", type=int, default=16)
+    parser.add_argument("--valid_batch_size", type=int, default=128)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    args.device = init_distributed(args.device)
+    teacher_tokenizer = AutoTokenizer.from_pretrained(args.teacher_model)
+    tokenizer = AutoTokenizer.from_pretrained(args.student_model)
+    # Rank 0 builds the token, entity and teacher caches first; other ranks then load them.
+    with main_process_first():
+        dataset = datasets.load_dataset("iarfmoose/qa_evaluator")
+        train_set = QAEvalDataset(dataset["train"], args.max_length, tokenizer, args.token_cache_dir, args.seed)
+        valid_set = QAEvalDataset(dataset["validation"], args.max_length, tokenizer, args.token_cache_dir)
+
+        teacher = AutoModelForSequenceClassification.from_pretrained(args.teacher_model)
+        cache = build_qa_eval_teacher_cache(
+            train_set,
+            teacher,
+            args.teacher_model,
+            teacher_tokenizer,
+            args.cache_dir,
+            args.teacher_batch_size,
+            args.device
+        )
+    teacher.to("cpu")
+
+    model = AutoModelForSequenceClassification.from_pretrained(args.student_model)
+    trainer = Trainer(
+        dataloader_workers=args.dataloader_workers,
+        device=args.device,
+        epochs=args.epochs,
+        learning_rate=args.learning_rate,
+        model=model,
+        pin_memory=args.pin_memory,
+        save_dir=args.save_dir,
+        tokenizer=tokenizer,
+        train_batch_size=args.train_batch_size,
+        train_set=DistillQAEvalDataset(cache, args.max_length, tokenizer),
+        valid_batch_size=args.valid_batch_size,
+        valid_set=valid_set,
+        evaluate_on_accuracy=True,
+        distillation_alpha=args.alpha,
+        distillation_temperature=args.temperature,
+        precision=args.precision,
+        gradient_accumulation_steps=args.gradient_accumulation_steps,
+        compile_model=args.compile,
+        max_grad_norm=args.max_grad_norm,
+        group_by_length=args.group_by_length,
+        keep_checkpoints=args.keep_checkpoints,
+        resume=args.resume,
+        profile_steps=args.profile_steps
+    )
+    trainer.train()
+
+    if is_main_process():
+        student = AutoModelForSequenceClassification.from_pretrained(args.save_dir)
+        report_pairs = [valid_set.get_pair(i)[:2] for i in range(min(args.report_examples, len(valid_set)))]
+        report = qa_eval_distillation_report(
+            teacher,
+            teacher_tokenizer,
+            student,
+            tokenizer,
+            report_pairs,
+            args.report_device,
+            args.max_length
+        )
+        write_report(report, args.save_dir)
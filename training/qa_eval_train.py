@@ -1,24 +1,60 @@
 #qa_eval_train.py
 import argparse
 import datasets
+import torch
 from transformers import AutoModelForSequenceClassification, AutoTokenizer
 import spacy
-from training.dataset import QAEvalDataset
+from dataset import QAEvalDataset
+from distributed import init_distributed, main_process_first
 from trainer import Trainer
 
 spacy.prefer_gpu()
 
 def parse_args() -> argparse.Namespace:
     parser = argparse.ArgumentParser()
+    parser.add_argument("--compile", dest="compile", action="store_true", default=False)
     parser.add_argument("--dataloader_workers", type=int, default=0)
-    parser.add_argument("--device", type=str, default="cuda")
+    parser.add_argument("--device", type=str, default="cuda" if torch.cuda.is_available() else "cpu")
     parser.add_argument("--epochs", type=int, default=20)
+    parser.add_argument("--gradient_accumulation_steps", type=int, default=1)
+    parser.add_argument(
+        "--group_by_length",
+        dest="group_by_length",
+        action="store_true",
+        default=False,
+        help="Batch examples of similar length together to minimise padding",
+    )
+    parser.add_argument("--keep_checkpoints", type=int, default=2, help="Number of epoch checkpoints to keep")
     parser.add_argument("--learning_rate", type=float, default=1e-3)
+    parser.add_argument("--max_grad_norm", type=float, default=None)
     parser.add_argument("--max_length", type=int, default=512)
     parser.add_argument("--qa_eval_model", type=str, default="bert-base-cased")
     parser.add_argument("--pad_mask_id", type=int, default=-100)
     parser.add_argument("--pin_memory", dest="pin_memory", action="store_true", default=False)
+    parser.add_argument("--precision", type=str, default="fp32", choices=["fp32", "bf16"])
+    parser.add_argument(
+        "--profile_steps",
+        type=int,
+        nargs=2,
+        default=None,
+        metavar=("START", "END"),
+        help="Record a torch.profiler trace of training steps [START, END) next to the checkpoints",
+    )
+    parser.add_argument(
+        "--resume",
+        dest="resume",
+        action="store_true",
+        default=False,
+        help="Continue from the latest checkpoint in save_dir/checkpoints",
+    )
     parser.add_argument("--save_dir", type=str, default="./bert-base-cased-qa-evaluator")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the negative pairs drawn each epoch")
+    parser.add_argument(
+        "--token_cache_dir",
+        type=str,
+        default=None,
+        help="Pre-tokenize the datasets once into memory-mapped caches under this directory",
+    )
     parser.add_argument("--train_batch_size", type=int, default=16)
     parser.add_argument("--valid_batch_size", type=int, default=128)
     return parser.parse_args()
@@ -26,10 +62,13 @@ def parse_args() -> argparse.Namespace:
 
 if __name__ == "__main__":
     args = parse_args()
+    args.device = init_distributed(args.device)
     tokenizer = AutoTokenizer.from_pretrained(args.qa_eval_model)
-    dataset = datasets.load_dataset("iarfmoose/qa_evaluator")
-    train_set = QAEvalDataset(dataset["train"], args.max_length, tokenizer)
-    valid_set = QAEvalDataset(dataset["validation"], args.max_length, tokenizer)
+    # Rank 0 builds the token and entity caches first; other ranks then load them.
+    with main_process_first():
+        dataset = datasets.load_dataset("iarfmoose/qa_evaluator")
+        train_set = QAEvalDataset(dataset["train"], args.max_length, tokenizer, args.token_cache_dir, args.seed)
+        valid_set = QAEvalDataset(dataset["validation"], args.max_length, tokenizer, args.token_cache_dir, args.seed)
     model = AutoModelForSequenceClassification.from_pretrained(args.qa_eval_model)
     trainer = Trainer(
         dataloader_workers=args.dataloader_workers,
@@ -44,7 +83,15 @@ if __name__ == "__main__":
         train_set=train_set,
         valid_batch_size=args.valid_batch_size,
         valid_set=valid_set,
-        evaluate_on_accuracy=True
+        evaluate_on_accuracy=True,
+        precision=args.precision,
+        gradient_accumulation_steps=args.gradient_accumulation_steps,
+        compile_model=args.compile,
+        max_grad_norm=args.max_grad_norm,
+        group_by_length=args.group_by_length,
+        keep_checkpoints=args.keep_checkpoints,
+        resume=args.resume,
+        profile_steps=args.profile_steps
     )
     trainer.train()
 
@@ -1,23 +1,58 @@
 #qg_train.py
 import argparse
 import datasets
+import torch
 from transformers import T5Config, T5ForConditionalGeneration, T5Tokenizer
 
 from dataset import QGDataset
+from distributed import init_distributed, main_process_first
 from trainer import Trainer
 
 
 def parse_args() -> argparse.Namespace:
     parser = argparse.ArgumentParser()
+    parser.add_argument("--compile", dest="compile", action="store_true", default=False)
     parser.add_argument("--dataloader_workers", type=int, default=2)
-    parser.add_argument("--device", type=str, default="cuda")
+    parser.add_argument("--device", type=str, default="cuda" if torch.cuda.is_available() else "cpu")
     parser.add_argument("--epochs", type=int, default=20)
+    parser.add_argument("--gradient_accumulation_steps", type=int, default=1)
+    parser.add_argument(
+        "--group_by_length",
+        dest="group_by_length",
+        action="store_true",
+        default=False,
+        help="Batch examples of similar length together to minimise padding",
+    )
+    parser.add_argument("--keep_checkpoints", type=int, default=2, help="Number of epoch checkpoints to keep")
     parser.add_argument("--learning_rate", type=float, default=1e-3)
+    parser.add_argument("--max_grad_norm", type=float, default=None)
     parser.add_argument("--max_length", type=int, default=512)
     parser.add_argument("--qg_model", type=str, default="t5-base")
     parser.add_argument("--pad_mask_id", type=int, default=-100)
     parser.add_argument("--pin_memory", dest="pin_memory", action="store_true", default=False)
+    parser.add_argument("--precision", type=str, default="fp32", choices=["fp32", "bf16"])
+    parser.add_argument(
+        "--profile_steps",
+        type=int,
+        nargs=2,
+        default=None,
+        metavar=("START", "END"),
+        help="Record a torch.profiler trace of training steps [START, END) next to the checkpoints",
+    )
+    parser.add_argument(
+        "--resume",
+        dest="resume",
+        action="store_true",
+        default=False,
+        help="Continue from the latest checkpoint in save_dir/checkpoints",
+    )
     parser.add_argument("--save_dir", type=str, default="./t5-base-question-generator")
+    parser.add_argument(
+        "--token_cache_dir",
+        type=str,
+        default=None,
+        help="Pre-tokenize the datasets once into memory-mapped caches under this directory",
+    )
     parser.add_argument("--train_batch_size", type=int, default=4)
     parser.add_argument("--valid_batch_size", type=int, default=32)
     return parser.parse_args()
@@ -41,10 +76,13 @@ def get_model(checkpoint: str, device: str, tokenizer: T5Tokenizer) -> T5ForCond
 
 if __name__ == "__main__":
     args = parse_args()
+    args.device = init_distributed(args.device)
     tokenizer = get_tokenizer(args.qg_model)
-    dataset = datasets.load_dataset("iarfmoose/question_generator")
-    train_set = QGDataset(dataset["train"], args.max_length, args.pad_mask_id, tokenizer)
-    valid_set = QGDataset(dataset["validation"], args.max_length, args.pad_mask_id, tokenizer)
+    # Rank 0 builds the token caches first; other ranks then load them.
+    with main_process_first():
+        dataset = datasets.load_dataset("iarfmoose/question_generator")
+        train_set = QGDataset(dataset["train"], args.max_length, args.pad_mask_id, tokenizer, args.token_cache_dir)
+        valid_set = QGDataset(dataset["validation"], args.max_length, args.pad_mask_id, tokenizer, args.token_cache_dir)
     model = get_model(args.qg_model, args.device, tokenizer)
     trainer = Trainer(
         dataloader_workers=args.dataloader_workers,
@@ -58,6 +96,15 @@ if __name__ == "__main__":
         train_batch_size=args.train_batch_size,
         train_set=train_set,
         valid_batch_size=args.valid_batch_size,
-        valid_set=valid_set
+        valid_set=valid_set,
+        precision=args.precision,
+        gradient_accumulation_steps=args.gradient_accumulation_steps,
+        compile_model=args.compile,
+        max_grad_norm=args.max_grad_norm,
+        pad_mask_id=args.pad_mask_id,
+        group_by_length=args.group_by_length,
+        keep_checkpoints=args.keep_checkpoints,
+        resume=args.resume,
+        profile_steps=args.profile_steps
     )
     trainer.train()
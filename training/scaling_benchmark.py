@@ -0,0 +1,99 @@
+#scaling_benchmark.py
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import torch
+from torch.nn.parallel import DistributedDataParallel
+from torch.utils.data import DataLoader, DistributedSampler
+
+from batching import PaddingCollator
+from distributed import all_reduce_sum, get_rank, get_world_size, init_distributed, is_main_process, main_process_first
+from padding_benchmark import benchmark, load_task
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Measures data-parallel training throughput and scaling efficiency for several process counts."
+    )
+    parser.add_argument("--batch_size", type=int, default=8, help="Per-process batch size")
+    parser.add_argument("--device", type=str, default="cpu")
+    parser.add_argument("--examples", type=int, default=2048, help="Number of training examples to sample from")
+    parser.add_argument("--max_length", type=int, default=512)
+    parser.add_argument("--model", type=str, required=True)
+    parser.add_argument("--output", type=str, default=None, help="Write the results to this JSON file")
+    parser.add_argument("--pad_mask_id", type=int, default=-100)
+    parser.add_argument("--processes", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--result_file", type=str, default=None, help=argparse.SUPPRESS)
+    parser.add_argument("--steps", type=int, default=50)
+    parser.add_argument("--task", type=str, required=True, choices=["qg", "qa_eval"])
+    parser.add_argument("--token_cache_dir", type=str, default=None)
+    parser.add_argument("--warmup_steps", type=int, default=5)
+    return parser.parse_args()
+
+
+def run_worker(args: argparse.Namespace) -> None:
+    args.device = init_distributed(args.device)
+    with main_process_first():
+        dataset, model, tokenizer = load_task(args)
+    if get_world_size() > 1:
+        model = DistributedDataParallel(model)
+    sampler = DistributedSampler(dataset, num_replicas=get_world_size(), rank=get_rank(), shuffle=True)
+    loader = DataLoader(
+        dataset,
+        batch_size=args.batch_size,
+        sampler=sampler,
+        collate_fn=PaddingCollator(tokenizer.pad_token_id, args.pad_mask_id)
+    )
+    stats = benchmark(model, loader, args)
+    samples_per_sec, tokens_per_sec = all_reduce_sum([stats["samples_per_sec"], stats["tokens_per_sec"]])
+    if is_main_process():
+        with open(args.result_file, "w") as f:
+            json.dump({
+                "processes": get_world_size(),
+                "threads_per_process": torch.get_num_threads(),
+                "samples_per_sec": samples_per_sec,
+                "tokens_per_sec": tokens_per_sec,
+            }, f)
+
+
+def run_scaling(args: argparse.Namespace) -> dict:
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for processes in args.processes:
+            result_file = os.path.join(tmp_dir, f"{processes}.json")
+            subprocess.run(
+                [
+                    sys.executable, "-m", "torch.distributed.run", "--standalone", f"--nproc_per_node={processes}",
+                    os.path.abspath(__file__), *sys.argv[1:], "--result_file", result_file
+                ],
+                check=True
+            )
+            with open(result_file) as f:
+                results[processes] = json.load(f)
+
+    # Weak scaling: every process keeps its batch size, so the ideal is N times the 1-process rate.
+    baseline = results[min(results)]
+    for processes, result in results.items():
+        speedup = result["samples_per_sec"] / baseline["samples_per_sec"]
+        result["speedup"] = speedup
+        result["scaling_efficiency"] = speedup / (processes / baseline["processes"])
+    return results
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.result_file is not None:
+        run_worker(args)
+    else:
+        results = run_scaling(args)
+        for processes, result in results.items():
+            print(
+                f"{processes} processes: {result['samples_per_sec']:.1f} samples/s, "
+                f"speedup {result['speedup']:.2f}, efficiency {result['scaling_efficiency']:.0%}"
+            )
+        if args.output is not None:
+            with open(args.output, "w") as f:
+                json.dump(results, f, indent=2)
@@ -0,0 +1,89 @@
+#token_cache.py
+
+import hashlib
+import json
+import os
+import numpy as np
+from tqdm import tqdm
+from transformers import AutoTokenizer
+from typing import List, Optional
+
+from utils import cache_meta_matches, write_array_cache
+
+CACHE_VERSION = 1
+
+
+class TokenCache:
+    """Token IDs for a list of texts, stored back to back in memory-mapped arrays. DataLoader
+    workers forked from the main process share the mapped pages instead of each holding a copy."""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.ids = np.load(os.path.join(path, "ids.npy"), mmap_mode="r")
+        self.offsets = np.load(os.path.join(path, "offsets.npy"), mmap_mode="r")
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index: int) -> np.ndarray:
+        return self.ids[self.offsets[index]:self.offsets[index + 1]]
+
+    @property
+    def lengths(self) -> np.ndarray:
+        return np.diff(self.offsets)
+
+
+def _fingerprint(texts: List[str]) -> str:
+    digest = hashlib.sha1()
+    for text in texts:
+        digest.update(text.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def build_token_cache(
+    texts: List[str],
+    tokenizer: AutoTokenizer,
+    max_length: Optional[int],
+    cache_dir: str,
+    name: str,
+    add_special_tokens: bool = True,
+    batch_size: int = 1024
+) -> TokenCache:
+    """Tokenizes texts once and stores the truncated, unpadded token IDs under cache_dir. The cache
+    is keyed by the tokenizer, max_length and the texts themselves, so changing any of them builds
+    a new cache next to the old one instead of silently reusing stale IDs. A max_length of None
+    stores the texts untruncated."""
+    meta = {
+        "version": CACHE_VERSION,
+        "name": name,
+        "tokenizer": tokenizer.name_or_path,
+        "tokenizer_class": type(tokenizer).__name__,
+        "vocab_size": len(tokenizer),
+        "max_length": max_length,
+        "add_special_tokens": add_special_tokens,
+        "texts": len(texts),
+        "fingerprint": _fingerprint(texts),
+    }
+    key = hashlib.sha1(json.dumps(meta, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+    path = os.path.join(cache_dir, f"{name}-{key}")
+    if cache_meta_matches(path, meta):
+        return TokenCache(path)
+
+    ids, lengths = [], []
+    for start in tqdm(range(0, len(texts), batch_size), desc=f"tokenizing {name}"):
+        encoded = tokenizer(
+            list(texts[start:start + batch_size]),
+            truncation=max_length is not None,
+            max_length=max_length,
+            add_special_tokens=add_special_tokens
+        )["input_ids"]
+        ids.extend(np.array(e, dtype=np.int32) for e in encoded)
+        lengths.extend(len(e) for e in encoded)
+
+    arrays = {
+        "ids": np.concatenate(ids) if ids else np.zeros(0, dtype=np.int32),
+        "offsets": np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64),
+    }
+    write_array_cache(path, meta, arrays)
+    return TokenCache(path)
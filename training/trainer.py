@@ -1,13 +1,23 @@
 #trainer.py
 
+import contextlib
+import os
+import time
 import torch
 from tqdm import tqdm
+from torch.nn.parallel import DistributedDataParallel
 from torch.optim import AdamW
-from torch.utils.data import DataLoader, Dataset
+from torch.utils.data import DataLoader, Dataset, DistributedSampler
 from sklearn.metrics import accuracy_score
 from transformers import AutoTokenizer
+from typing import Mapping, Optional, Tuple
 
+from batching import LengthGroupedSampler, PaddingCollator
+from checkpoint import CheckpointManager, gather_rng_states, set_rng_state, to_cpu, write_atomically
+from distributed import all_reduce_max, all_reduce_sum, get_rank, get_world_size, is_main_process, reduce_meter
+from profiling import ProfilerWindow, StepTimer, peak_memory_mb, reset_peak_memory, write_summary
 from utils import AverageMeter
+from distillation import TEACHER_PREFIX, distillation_loss
 
 
 class Trainer:
@@ -25,59 +35,156 @@ class Trainer:
         train_set: Dataset,
         valid_batch_size: int,
         valid_set: Dataset,
-        evaluate_on_accuracy: bool = False
+        evaluate_on_accuracy: bool = False,
+        distillation_alpha: Optional[float] = None,
+        distillation_temperature: float = 2.0,
+        precision: str = "fp32",
+        gradient_accumulation_steps: int = 1,
+        compile_model: bool = False,
+        max_grad_norm: Optional[float] = None,
+        pad_mask_id: int = -100,
+        group_by_length: bool = False,
+        checkpoint_dir: Optional[str] = None,
+        keep_checkpoints: int = 2,
+        resume: bool = False,
+        profile_steps: Optional[Tuple[int, int]] = None
     ) -> None:
         self.device = device
         self.epochs = epochs
         self.save_dir = save_dir
         self.train_batch_size = train_batch_size
         self.valid_batch_size = valid_batch_size
-        self.train_loader = DataLoader(
-            train_set,
-            batch_size=train_batch_size,
-            num_workers=dataloader_workers,
-            pin_memory=pin_memory,
-            shuffle=True
-        )
-        self.valid_loader = DataLoader(
-            valid_set,
-            batch_size=train_batch_size,
-            num_workers=dataloader_workers,
-            pin_memory=pin_memory,
-            shuffle=False
-        )
+        self.group_by_length = group_by_length
+        # Under launch.py/torchrun every rank trains on its own shard of each epoch, so the
+        # global batch is train_batch_size * world_size.
+        self.rank = get_rank()
+        self.world_size = get_world_size()
+        loader_args = {
+            # Datasets return unpadded examples; each batch is padded to its own longest sequence.
+            "collate_fn": PaddingCollator(tokenizer.pad_token_id, pad_mask_id),
+            "num_workers": dataloader_workers,
+            "pin_memory": pin_memory,
+        }
+        if group_by_length:
+            self.train_sampler = LengthGroupedSampler(
+                train_set.lengths, train_batch_size, num_replicas=self.world_size, rank=self.rank
+            )
+            valid_sampler = LengthGroupedSampler(
+                valid_set.lengths, train_batch_size, shuffle=False, num_replicas=self.world_size, rank=self.rank
+            )
+            self.train_loader = DataLoader(train_set, batch_sampler=self.train_sampler, **loader_args)
+            self.valid_loader = DataLoader(valid_set, batch_sampler=valid_sampler, **loader_args)
+        elif self.world_size > 1:
+            self.train_sampler = DistributedSampler(train_set, shuffle=True)
+            valid_sampler = DistributedSampler(valid_set, shuffle=False)
+            self.train_loader = DataLoader(
+                train_set, batch_size=train_batch_size, sampler=self.train_sampler, **loader_args
+            )
+            self.valid_loader = DataLoader(valid_set, batch_size=train_batch_size, sampler=valid_sampler, **loader_args)
+        else:
+            self.train_sampler = None
+            self.train_loader = DataLoader(train_set, batch_size=train_batch_size, shuffle=True, **loader_args)
+            self.valid_loader = DataLoader(valid_set, batch_size=train_batch_size, shuffle=False, **loader_args)
         self.tokenizer = tokenizer
         self.model = model.to(self.device)
+        self.ddp_model = None
+        if self.world_size > 1:
+            self.ddp_model = DistributedDataParallel(
+                self.model,
+                device_ids=[self.device] if self.device.startswith("cuda") else None
+            )
+        # The compiled and DDP modules share their parameters with self.model, which is what gets saved.
+        wrapped_model = self.ddp_model if self.ddp_model is not None else self.model
+        self.forward_model = torch.compile(wrapped_model) if compile_model else wrapped_model
         self.optimizer = AdamW(self.model.parameters(), lr=learning_rate)
+        if precision not in ["fp32", "bf16"]:
+            raise ValueError(f"Invalid precision {precision}. Please choose from ['fp32', 'bf16']")
+        self.precision = precision
+        self.gradient_accumulation_steps = gradient_accumulation_steps
+        self.compile_model = compile_model
+        self.max_grad_norm = max_grad_norm
+        self.throughput = []
         self.train_loss = AverageMeter()
         self.evaluate_on_accuracy = evaluate_on_accuracy
+        # With distillation_alpha set, batches carrying teacher outputs are trained on
+        # alpha * soft (teacher) loss + (1 - alpha) * hard (label) loss.
+        self.distillation_alpha = distillation_alpha
+        self.distillation_temperature = distillation_temperature
         if evaluate_on_accuracy:
             self.best_valid_score = 0
         else:
             self.best_valid_score = float("inf")
+        # Full training state is checkpointed after every epoch; save_dir only gets the best model.
+        self.checkpoints = CheckpointManager(checkpoint_dir or os.path.join(save_dir, "checkpoints"), keep_checkpoints)
+        # Per-epoch step-time breakdown, throughput and peak memory go to training_profile.json
+        # next to the checkpoints, plus an optional torch.profiler trace of profile_steps.
+        self.timer = StepTimer(device)
+        self.profiler_window = ProfilerWindow(
+            profile_steps, os.path.join(self.checkpoints.checkpoint_dir, "profile"), device
+        )
+        self.start_epoch = 1
+        self.global_step = 0
+        if resume:
+            self._resume()
 
     def train(self) -> None:
-        for epoch in range(1, self.epochs+1):
+        for epoch in range(self.start_epoch, self.epochs+1):
             self.model.train()
             self.train_loss.reset()
+            if self.train_sampler is not None:
+                self.train_sampler.set_epoch(epoch)
+            if hasattr(self.train_loader.dataset, "set_epoch"):
+                # Datasets that draw examples per epoch (QAEvalDataset negatives) do so up front.
+                self.train_loader.dataset.set_epoch(epoch)
 
-            with tqdm(total=len(self.train_loader), unit="batches") as tepoch:
+            samples, tokens, padded_tokens = 0, 0, 0
+            self.timer.reset()
+            self.profiler_window.export_seconds = 0.0
+            reset_peak_memory(self.device)
+            start = time.perf_counter()
+            self.optimizer.zero_grad()
+            batches = iter(self.train_loader)
+            with tqdm(total=len(self.train_loader), unit="batches", disable=not is_main_process()) as tepoch:
                 tepoch.set_description(f"epoch {epoch}")
-                for data in self.train_loader:
-                    self.optimizer.zero_grad()
-                    data = {key: value.to(self.device) for key, value in data.items()}
-                    output = self.model(**data)
-                    loss = output.loss
-                    loss.backward()
-                    self.optimizer.step()
+                for step in range(1, len(self.train_loader) + 1):
+                    self.profiler_window.step((epoch - 1) * len(self.train_loader) + step - 1)
+                    with self.timer.phase("data"):
+                        data = next(batches)
+                    with self.timer.phase("h2d"):
+                        data = {key: value.to(self.device) for key, value in data.items()}
+                    sync = step % self.gradient_accumulation_steps == 0 or step == len(self.train_loader)
+                    # The last window of an epoch can hold fewer micro-batches; averaging over the
+                    # ones it holds keeps its update on the same scale as the others.
+                    window_start = (step - 1) // self.gradient_accumulation_steps * self.gradient_accumulation_steps
+                    window_size = min(self.gradient_accumulation_steps, len(self.train_loader) - window_start)
+                    # Under DDP the gradient all-reduce overlaps with, and is timed as, backward.
+                    with self._no_sync(sync):
+                        with self.timer.phase("forward"), self._autocast():
+                            loss = self._compute_loss(data)
+                        with self.timer.phase("backward"):
+                            (loss / window_size).backward()
+                    if sync:
+                        with self.timer.phase("optimizer"):
+                            if self.max_grad_norm is not None:
+                                torch.nn.utils.clip_grad_norm_(self.model.parameters(), self.max_grad_norm)
+                            self.optimizer.step()
+                            self.optimizer.zero_grad()
+                        self.global_step += 1
+                    self.timer.steps += 1
+                    samples += data["input_ids"].shape[0]
+                    tokens += int(data["attention_mask"].sum())
+                    padded_tokens += data["attention_mask"].numel()
                     self.train_loss.update(loss.item(), self.train_batch_size)
                     tepoch.set_postfix({"train_loss": self.train_loss.avg})
                     tepoch.update(1)
+            seconds = time.perf_counter() - start - self.profiler_window.export_seconds
+            self._report_throughput(epoch, samples, tokens, padded_tokens, seconds)
 
+            # Validation metrics are reduced over all ranks, so every rank takes the same decision.
             if self.evaluate_on_accuracy:
                 valid_accuracy = self.evaluate_accuracy(self.valid_loader)
                 if valid_accuracy > self.best_valid_score:
-                    print(
+                    self._print(
                         f"Validation accuracy improved from {self.best_valid_score:.4f} to {valid_accuracy:.4f}. Saving."
                     )
                     self.best_valid_score = valid_accuracy
@@ -85,42 +192,152 @@ class Trainer:
             else:
                 valid_loss = self.evaluate(self.valid_loader)
                 if valid_loss < self.best_valid_score:
-                    print(
+                    self._print(
                         f"Validation loss decreased from {self.best_valid_score:.4f} to {valid_loss:.4f}. Saving.")
                     self.best_valid_score = valid_loss
                     self._save()
+            self._checkpoint(epoch)
+        self.profiler_window.close()
+        self.checkpoints.wait()
+
+    def _no_sync(self, sync: bool) -> contextlib.AbstractContextManager:
+        # Gradients of accumulation micro-batches stay local; DDP all-reduces them on the last one.
+        if self.ddp_model is None or sync:
+            return contextlib.nullcontext()
+        return self.ddp_model.no_sync()
+
+    def _print(self, message: str) -> None:
+        if is_main_process():
+            print(message)
+
+    def _autocast(self) -> torch.autocast:
+        # bf16 autocast works on CPU as well as CUDA and needs no loss scaling.
+        return torch.autocast(
+            device_type=torch.device(self.device).type,
+            dtype=torch.bfloat16,
+            enabled=self.precision == "bf16"
+        )
+
+    def _report_throughput(self, epoch: int, samples: int, tokens: int, padded_tokens: int, seconds: float) -> None:
+        samples, tokens, padded_tokens = all_reduce_sum([samples, tokens, padded_tokens])
+        seconds = all_reduce_max(seconds)
+        stats = {
+            "epoch": epoch,
+            "world_size": self.world_size,
+            "precision": self.precision,
+            "gradient_accumulation_steps": self.gradient_accumulation_steps,
+            "effective_batch_size": self.train_batch_size * self.gradient_accumulation_steps * self.world_size,
+            "compile": self.compile_model,
+            "group_by_length": self.group_by_length,
+            "samples_per_sec": samples / seconds,
+            "tokens_per_sec": tokens / seconds,
+            "padding_fraction": 1 - tokens / max(padded_tokens, 1),
+            # Profiled steps run slower, so epochs that include them are flagged.
+            "profiled": self.profiler_window.overlaps(
+                (epoch - 1) * len(self.train_loader), epoch * len(self.train_loader) - 1
+            ),
+            **self.timer.summary(),
+            **peak_memory_mb(self.device),
+        }
+        self.throughput.append(stats)
+        self._print(
+            f"epoch {epoch}: {stats['samples_per_sec']:.1f} samples/s, {stats['tokens_per_sec']:.1f} tokens/s "
+            f"({self.precision}, effective batch {stats['effective_batch_size']}, compile={self.compile_model}, "
+            f"{stats['padding_fraction']:.1%} padding, world size {self.world_size})"
+        )
+        self._print("step time: " + ", ".join(
+            f"{phase} {ms:.1f} ms ({stats['step_time_fraction'][phase]:.0%})"
+            for phase, ms in stats["step_time_ms"].items()
+        ) + f"; peak RSS {stats['peak_rss_mb']:.0f} MB")
+        if is_main_process():
+            write_summary(self.throughput, self.checkpoints.checkpoint_dir)
+
+    def _compute_loss(self, data: Mapping[str, torch.Tensor]) -> torch.Tensor:
+        teacher = {key: value for key, value in data.items() if key.startswith(TEACHER_PREFIX)}
+        inputs = {key: value for key, value in data.items() if not key.startswith(TEACHER_PREFIX)}
+        output = self.forward_model(**inputs)
+        if self.distillation_alpha is None or not teacher:
+            return output.loss
+        soft_loss = distillation_loss(output.logits, teacher, self.distillation_temperature)
+        return self.distillation_alpha * soft_loss + (1 - self.distillation_alpha) * output.loss
 
     @torch.no_grad()
     def evaluate(self, dataloader: DataLoader) -> float:
         self.model.eval()
         eval_loss = AverageMeter()
-        with tqdm(total=len(dataloader), unit="batches") as tepoch:
+        with tqdm(total=len(dataloader), unit="batches", disable=not is_main_process()) as tepoch:
             tepoch.set_description("validation")
             for data in dataloader:
                 data = {key: value.to(self.device) for key, value in data.items()}
-                output = self.model(**data)
+                with self._autocast():
+                    output = self.forward_model(**data)
                 loss = output.loss
                 eval_loss.update(loss.item(), self.valid_batch_size)
                 tepoch.set_postfix({"valid_loss": eval_loss.avg})
                 tepoch.update(1)
-        return eval_loss.avg
+        return reduce_meter(eval_loss)
 
     @torch.no_grad()
     def evaluate_accuracy(self, dataloader: DataLoader) -> float:
         self.model.eval()
         accuracy = AverageMeter()
-        with tqdm(total=len(dataloader), unit="batches") as tepoch:
+        with tqdm(total=len(dataloader), unit="batches", disable=not is_main_process()) as tepoch:
             tepoch.set_description("validation")
             for data in dataloader:
                 data = {key: value.to(self.device) for key, value in data.items()}
-                output = self.model(**data)
+                with self._autocast():
+                    output = self.forward_model(**data)
                 preds = torch.argmax(output.logits, dim=1)
                 score = accuracy_score(data["labels"].cpu(), preds.cpu())
                 accuracy.update(score, self.valid_batch_size)
                 tepoch.set_postfix({"valid_acc": accuracy.avg})
                 tepoch.update(1)
-        return accuracy.avg
+        return reduce_meter(accuracy)
 
     def _save(self) -> None:
-        self.tokenizer.save_pretrained(self.save_dir)
-        self.model.save_pretrained(self.save_dir)
+        if not is_main_process():
+            return
+        state_dict = to_cpu(self.model.state_dict())
+
+        def save(path: str) -> None:
+            self.tokenizer.save_pretrained(path)
+            self.model.save_pretrained(path, state_dict=state_dict)
+
+        self.checkpoints.submit(lambda: write_atomically(save, self.save_dir))
+
+    def _checkpoint(self, epoch: int) -> None:
+        # Taken after validation, which also draws from the RNG, so a resumed run starts the
+        # next epoch in exactly the state an uninterrupted one would.
+        rng = gather_rng_states()
+        if not is_main_process():
+            return
+        self.checkpoints.save({
+            "epoch": epoch,
+            "global_step": self.global_step,
+            "model": self.model.state_dict(),
+            "optimizer": self.optimizer.state_dict(),
+            "best_valid_score": self.best_valid_score,
+            "throughput": self.throughput,
+            "world_size": self.world_size,
+            "rng": rng,
+        }, self.global_step)
+
+    def _resume(self) -> None:
+        path = self.checkpoints.latest()
+        if path is None:
+            self._print(f"No checkpoint found in {self.checkpoints.checkpoint_dir}, starting from scratch.")
+            return
+        state = self.checkpoints.load(path)
+        self.model.load_state_dict(state["model"])
+        self.optimizer.load_state_dict(state["optimizer"])
+        self.start_epoch = state["epoch"] + 1
+        self.global_step = state["global_step"]
+        self.best_valid_score = state["best_valid_score"]
+        self.throughput = state["throughput"]
+        if state["world_size"] != self.world_size:
+            self._print(
+                f"Checkpoint was written by {state['world_size']} processes, resuming with {self.world_size}: "
+                "the data order will differ from the original run."
+            )
+        set_rng_state(state["rng"][self.rank % len(state["rng"])])
+        self._print(f"Resumed from {path} at epoch {self.start_epoch}.")
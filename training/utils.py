@@ -1,6 +1,13 @@
 
 #utils
 
+import json
+import os
+import shutil
+import numpy as np
+from typing import Any, Mapping
+
+
 class AverageMeter(object):
     def __init__(self) -> None:
         self.reset()
@@ -16,3 +23,33 @@ class AverageMeter(object):
         self.sum += val * n
         self.count += n
         self.avg = self.sum / self.count
+
+
+def cache_meta_matches(cache_dir: str, meta: Mapping[str, Any]) -> bool:
+    meta_path = os.path.join(cache_dir, "meta.json")
+    if not os.path.exists(meta_path):
+        return False
+    with open(meta_path) as f:
+        return json.load(f) == meta
+
+
+def write_array_cache(
+    cache_dir: str,
+    meta: Mapping[str, Any],
+    arrays: Mapping[str, np.ndarray],
+    json_files: Mapping[str, Any] = {}
+) -> None:
+    # Written to a sibling directory and renamed, so a killed run never leaves a
+    # half-written cache that looks valid.
+    tmp_dir = cache_dir.rstrip("/") + ".tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    for name, array in arrays.items():
+        np.save(os.path.join(tmp_dir, f"{name}.npy"), array)
+    for name, content in json_files.items():
+        with open(os.path.join(tmp_dir, f"{name}.json"), "w") as f:
+            json.dump(content, f)
+    with open(os.path.join(tmp_dir, "meta.json"), "w") as f:
+        json.dump(meta, f)
+    shutil.rmtree(cache_dir, ignore_errors=True)
+    os.replace(tmp_dir, cache_dir)